@@ -1,5 +1,11 @@
 #! /usr/bin/env python3
 
+import os
 import pathlib
 
 PYPKG_DIR = pathlib.Path(__file__).parent.absolute()
+
+# Persistent caches (dependency probes, rendered fragments...) live here
+CACHE_DIR = pathlib.Path(os.environ.get('SCOOPER_CACHE_DIR',
+                                        pathlib.Path(os.environ.get('XDG_CACHE_HOME', '~/.cache')) / 'scooper',
+                                        )).expanduser()
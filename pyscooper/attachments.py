@@ -3,22 +3,38 @@
 # std imports
 import logging
 import typing as T
+import os
+import hashlib
 import pathlib
 import functools
 import glob
 import fnmatch
-
-from pyscooper.tex_utils import sanitize_tex
+import time
+import contextlib
+import tempfile
+import concurrent.futures as cf
+
+from pyscooper.tex_utils import sanitize_tex, escape_tex, TOC_HEADING_FCN_MAP, DEEPEST_TOC_LVL
+from pyscooper.extmatch import ExtMap
+from pyscooper.cache import FragmentCache, handler_id, file_digest, LINK_TOKEN, ASSETS_TOKEN
+from pyscooper.images import prepare_image, DEFAULT_IMAGE_DPI
+from pyscooper.dedup import Duplicate
+from pyscooper.profiling import Profiler, tex_marker
+from pyscooper.tables import pandas_longtable, DEFAULT_TABLE_MAX_ROWS, DEFAULT_TABLE_MAX_COLS
+from pyscooper.text_sample import sample_lines, write_sampled_copy, DEFAULT_TEXT_MAX_BYTES, DEFAULT_TEXT_MAX_LINES
 from pyscooper import deps
 from pyscooper.cli_utils import debug, info, warning, error
 
 
 class TOCFile:
+    # No per-instance __dict__ -> there is one of these per scooped file
+    __slots__ = ('filepath', 'ext_key', 'keypath')
 
-    def __init__(self, filepath: pathlib.Path, keypath: T.Tuple[str], ext_key: T.Optional[str] = None):
+    def __init__(self, filepath: pathlib.Path, keypath: T.Tuple[str, ...], ext_key: T.Optional[str] = None):
         self.filepath = filepath
+        # The scan already matched it -> only match again if it was not given
         self.ext_key = ext_key if ext_key is not None else ext_match(filepath)
-        self.keypath = keypath  # To the PARENT dir!
+        self.keypath = keypath  # To the PARENT dir! (shared by all the files in it)
 
     def __repr__(self):
         return (f"<{self.__class__}"
@@ -28,6 +44,20 @@ class TOCFile:
                 ">")
 
 
+class ScoopOptions(T.NamedTuple):
+    """Settings that change the fragments generated for the same file (they are part of the cache keys)"""
+    highlighter: str = 'minted'  # or 'pygments' -> highlighted in-process, no -shell-escape
+    text_max_bytes: int = DEFAULT_TEXT_MAX_BYTES  # Budgets of the text files (see text_sample), 0 -> no limit
+    text_max_lines: int = DEFAULT_TEXT_MAX_LINES
+    text_mode: str = 'inline'  # or 'input' / 'sampled-input' -> TeX reads the (sampled copy of the) file itself
+    table_max_rows: int = DEFAULT_TABLE_MAX_ROWS  # Caps of the CSV/TSV files (see tables), 0 -> no limit
+    table_max_cols: int = DEFAULT_TABLE_MAX_COLS
+    image_dpi: int = DEFAULT_IMAGE_DPI  # Images are pre-processed (see images) for this resolution, 0 -> as they are
+
+
+DEFAULT_OPTIONS = ScoopOptions()
+
+
 def sanitize_path(in_str: T.Union[pathlib.Path, str], ) -> str:
     return (str(in_str)
             .replace(' ', r'\space ')
@@ -68,11 +98,12 @@ def tex_centering(fcn, add_pagebreak: bool = False):
 
 
 def verbatim(fcn):
-    def wrapper(p):
+    @functools.wraps(fcn)
+    def wrapper(*args, **kwargs):
         return "\n".join(
             ["",
              r"\begin{verbatim}",
-             f"{fcn(p)}",
+             f"{fcn(*args, **kwargs)}",
              r"\end{verbatim}",
              "",
              ]
@@ -106,6 +137,36 @@ def vspace(fcn):
     return wrapper
 
 
+def requires(probe: T.Callable[[], bool], fallback: T.Callable[[pathlib.Path], str]):
+    """Only use the decorated scooper if *probe* (see deps) passes, otherwise use *fallback*"""
+
+    def decorator(fcn):
+        @functools.wraps(fcn)
+        def wrapper(*args, **kwargs):
+            if probe():
+                return fcn(*args, **kwargs)
+            return fallback(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def cacheable(fcn):
+    """Marks the scoopers that do real work in python -> their fragments are worth storing in the FragmentCache"""
+    fcn.cacheable = True
+    return fcn
+
+
+def with_assets(fcn):
+    """
+    Marks the scoopers that also write files: they are called as fcn(file, assets_dir) and their fragments refer
+    to those files through ASSETS_TOKEN (see scoop_entry)
+    """
+    fcn.with_assets = True
+    return fcn
+
+
 def pagebreak_after(fcn):
     @functools.wraps(fcn)
     def wrapper(*args, **kwargs):
@@ -122,13 +183,18 @@ def scoop_img(file: pathlib.Path, width: None = None, ) -> str:
     return r'\includegraphics[width=\linewidth]{' + sanitize_path(file.absolute()) + r'}'
 
 
+@cacheable
 @blank_pad
 @pagebreak_after
 @centering
 @verbatim
-def scoop_text(file: pathlib.Path) -> str:
-    with open(file, 'r') as fp:
-        contents = sanitize_tex('\n'.join(fp.readlines()))
+def scoop_text(file: pathlib.Path,
+               max_bytes: int = DEFAULT_TEXT_MAX_BYTES,
+               max_lines: int = DEFAULT_TEXT_MAX_LINES,
+               ) -> str:
+    # Streamed -> only the sampled lines are ever in memory (see text_sample)
+    with open(file, 'r', errors='replace') as fp:
+        contents = sanitize_tex(''.join(sample_lines(fp, max_bytes=max_bytes, max_lines=max_lines)))
     # Ensure the encodings are OK
     # encoding = 'ascii'  # Safe for TeX
     encoding = 'utf-8'  # Should work... might be riskier for TeX
@@ -136,6 +202,38 @@ def scoop_text(file: pathlib.Path) -> str:
     return contents
 
 
+@functools.lru_cache(maxsize=None)
+def scoop_img_prepared_fcn(dpi: int) -> T.Callable[[pathlib.Path, pathlib.Path], str]:
+    """scoop_img on a right-sized copy of the image (see images.prepare_image)"""
+
+    @cacheable
+    @with_assets
+    def wrapped(file: pathlib.Path, assets_dir: pathlib.Path) -> str:
+        from PIL import Image
+
+        try:
+            prepared = prepare_image(file, assets_dir, dpi=dpi)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # pdflatex gets the original -> it decides whether it can include it
+            debug(f"Could not prepare {file} ({e.__class__.__name__}: {e}), including it as it is")
+            prepared = None
+        if prepared is None:
+            return scoop_img(file)
+        return scoop_img(prepared).replace(sanitize_path(assets_dir.absolute()), ASSETS_TOKEN)
+
+    wrapped.cache_id = f"{handler_id(wrapped)}:{dpi}"
+    return wrapped
+
+
+@blank_pad
+def scoop_duplicate(original: pathlib.Path, label: T.Optional[str] = None) -> str:
+    """A short reference to the (identical) *original*, which was included where *label* is (if known)"""
+    out_str = r'\noindent\emph{Identical to \texttt{' + escape_tex(original) + r'}'
+    if label is not None:
+        out_str += r', \hyperref[' + label + r']{page~\pageref*{' + label + r'}}'
+    return out_str + '.}'
+
+
 @blank_pad
 def scoop_pdf(file: pathlib.Path, ) -> str:
     return r'\includepdf[pages=-,pagecommand={},width=\linewidth]{' + sanitize_path(file.absolute()) + r'}'
@@ -162,37 +260,99 @@ def scoop_3d(file: pathlib.Path) -> str:
     return "TODO "
 
 
+@cacheable
+@requires(deps.was_pandas_found, fallback=scoop_text)
 @blank_pad
 @pagebreak_after
-@centering
-@vspace
 def pandas_scoop_csv(file: pathlib.Path) -> str:
-    import pandas as pd
+    # A longtable breaks across pages -> no centering/vspace
+    return pandas_longtable(file, max_rows=DEFAULT_TABLE_MAX_ROWS, max_cols=DEFAULT_TABLE_MAX_COLS)
 
-    df = pd.read_csv(file,
-                     delim_whitespace=True,
-                     skipinitialspace=True,
-                     )
-    # delimiter=','
-    # sep=','
 
-    return df.to_latex()
+pandas_scoop_tsv = pandas_scoop_csv
 
 
-pandas_scoop_tsv = pandas_scoop_csv
+@functools.lru_cache(maxsize=None)
+def scoop_text_fcn(max_bytes: int, max_lines: int) -> T.Callable[[pathlib.Path], str]:
+    """scoop_text with a different budget"""
+
+    @functools.wraps(scoop_text)
+    def wrapped(file: pathlib.Path, ) -> str:
+        return scoop_text(file, max_bytes=max_bytes, max_lines=max_lines)
+
+    wrapped.cache_id = f"{handler_id(scoop_text)}:{max_bytes}:{max_lines}"
+    return wrapped
+
+
+@functools.lru_cache(maxsize=None)
+def pandas_scoop_csv_fcn(max_rows: int, max_cols: int) -> T.Callable[[pathlib.Path], str]:
+    """pandas_scoop_csv with different caps"""
+
+    @cacheable
+    @requires(deps.was_pandas_found, fallback=scoop_text)
+    @blank_pad
+    @pagebreak_after
+    def wrapped(file: pathlib.Path, ) -> str:
+        return pandas_longtable(file, max_rows=max_rows, max_cols=max_cols)
+
+    wrapped.cache_id = f"{handler_id(pandas_scoop_csv)}:{max_rows}:{max_cols}"
+    return wrapped
+
+
+@blank_pad
+@pagebreak_after
+def scoop_text_input(file: pathlib.Path) -> str:
+    """The text is never read by python: fancyvrb inputs the file while compiling"""
+    return r'\VerbatimInput[fontsize=\small]{' + sanitize_path(file.absolute()) + r'}'
+
+
+@functools.lru_cache(maxsize=None)
+def scoop_text_sampled_fcn(max_bytes: int, max_lines: int) -> T.Callable[[pathlib.Path], str]:
+    """
+    Like scoop_text_input but on a sampled & sanitized copy (see text_sample) written next to *file*
+
+    Not cacheable: the copy only lives as long as the run's links
+    """
+
+    @blank_pad
+    @pagebreak_after
+    def wrapped(file: pathlib.Path, ) -> str:
+        sampled = file.with_name(f"{file.name}.sampled.txt")
+        write_sampled_copy(file, sampled, max_bytes=max_bytes, max_lines=max_lines)
+        return r'\VerbatimInput[fontsize=\small]{' + sanitize_path(sampled.absolute()) + r'}'
+
+    wrapped.cache_id = f"{handler_id(wrapped)}:{max_bytes}:{max_lines}"
+    return wrapped
 
 
 # Minted scoopers -> All the same with different types
 def scoop_minted_fcn(lexer: str) -> T.Callable[[pathlib.Path], str]:
+    @requires(deps.was_pygmentize_found, fallback=scoop_text)
     @blank_pad
     @pagebreak_after
     def wrapped(file: pathlib.Path, ) -> str:
         return r'\inputminted{' + str(lexer) + r"}{" + sanitize_path(file.absolute()) + r'}'
 
+    wrapped.cache_id = f"{handler_id(wrapped)}:{lexer}"
+    return wrapped
+
+
+# Pygments scoopers -> Same lexers as minted but highlighted in python (and cached)
+@functools.lru_cache(maxsize=None)
+def scoop_pygments_fcn(lexer: str) -> T.Callable[[pathlib.Path], str]:
+    @cacheable
+    @requires(deps.was_pygments_found, fallback=scoop_text)
+    @blank_pad
+    @pagebreak_after
+    def wrapped(file: pathlib.Path, ) -> str:
+        from pyscooper.highlight import highlight_file
+        return highlight_file(file, lexer)
+
+    wrapped.cache_id = f"{handler_id(wrapped)}:{lexer}"
     return wrapped
 
 
-EXT_MAP = {
+EXT_MAP = ExtMap({
     '*.jpg': scoop_img,
     '*.jpeg': scoop_img,
     '*.png': scoop_img,
@@ -204,643 +364,642 @@ EXT_MAP = {
     # '*.mp4': scoop_vid,
     # '*.gif': 'todo',
     # '*.mp3': scoop_song,
-}
+})
 
 MINTED_LEXERS = dict()
 MINTED_EXTS = set()
-if deps.PYGMENTIZE_OK:
-    # deps.get_pygmentize_lexers
-    unique_ext2lexer = {
-        '*.abap': 'abap',
-        '*.abnf': 'abnf',
-        '*.ada': 'ada',
-        '*.adb': 'ada',
-        '*.ads': 'ada',
-        '*.adl': 'adl',
-        '*.adlf': 'adl',
-        '*.adls': 'adl',
-        '*.adlx': 'adl',
-        '*.agda': 'agda',
-        '*.aheui': 'aheui',
-        '*.als': 'alloy',
-        '*.at': 'ambienttalk',
-        '*.isa': 'amdgpu',
-        '*.run': 'ampl',
-        '*.ans': 'ansys',
-        '.htaccess': 'apacheconf',
-        'apache.conf': 'apacheconf',
-        'apache2.conf': 'apacheconf',
-        '*.apl': 'apl',
-        '*.aplc': 'apl',
-        '*.aplf': 'apl',
-        '*.apli': 'apl',
-        '*.apln': 'apl',
-        '*.aplo': 'apl',
-        '*.dyalog': 'apl',
-        '*.applescript': 'applescript',
-        '*.ino': 'arduino',
-        '*.arw': 'arrow',
-        '*.aj': 'aspectj',
-        '*.asy': 'asymptote',
-        '*.aug': 'augeas',
-        '*.ahk': 'autohotkey',
-        '*.ahkl': 'autohotkey',
-        '*.au3': 'autoit',
-        '*.awk': 'awk',
-        '*.bare': 'bare',
-        '*.bash': 'bash',
-        '*.ebuild': 'bash',
-        '*.eclass': 'bash',
-        '*.exheres-0': 'bash',
-        '*.exlib': 'bash',
-        '*.ksh': 'bash',
-        '*.sh': 'bash',
-        '*.zsh': 'bash',
-        '.bash_*': 'bash',
-        '.bashrc': 'bash',
-        '.zshrc': 'bash',
-        'bash_*': 'bash',
-        'bashrc': 'bash',
-        'pkgbuild': 'bash',
-        'zshrc': 'bash',
-        '*.bat': 'batch',
-        '*.cmd': 'batch',
-        '*.bbc': 'bbcbasic',
-        '*.bc': 'bc',
-        '*.befunge': 'befunge',
-        '*.bib': 'bibtex',
-        '*.bb': 'blitzbasic',
-        '*.decls': 'blitzbasic',
-        '*.bmx': 'blitzmax',
-        '*.bnf': 'bnf',
-        '*.boa': 'boa',
-        '*.boo': 'boo',
-        '*.bpl': 'boogie',
-        '*.bf': 'brainfuck',
-        '*.bst': 'bst',
-        '*.c-objdump': 'c-objdump',
-        '*.idc': 'c',
-        '*.cadl': 'cadl',
-        '*.camkes': 'camkes',
-        '*.idl4': 'camkes',
-        '*.cdl': 'capdl',
-        '*.capnp': 'capnp',
-        '*.cddl': 'cddl',
-        '*.ceylon': 'ceylon',
-        '*.cfc': 'cfc',
-        '*.cf': 'cfengine3',
-        '*.cfm': 'cfm',
-        '*.cfml': 'cfm',
-        '*.chai': 'chaiscript',
-        '*.chpl': 'chapel',
-        '*.ci': 'charmci',
-        '*.spt': 'cheetah',
-        '*.tmpl': 'cheetah',
-        '*.cirru': 'cirru',
-        '*.clay': 'clay',
-        '*.dcl': 'clean',
-        '*.icl': 'clean',
-        '*.clj': 'clojure',
-        '*.cljs': 'clojurescript',
-        '*.cmake': 'cmake',
-        'cmakelists.txt': 'cmake',
-        '*.cob': 'cobol',
-        '*.cpy': 'cobol',
-        '*.cbl': 'cobolfree',
-        '*.coffee': 'coffeescript',
-        '*.cl': 'common-lisp',
-        '*.lisp': 'common-lisp',
-        '*.cps': 'componentpascal',
-        '*.sh-session': 'console',
-        '*.shell-session': 'console',
-        '*.c++': 'cpp',
-        '*.cc': 'cpp',
-        '*.cpp': 'cpp',
-        '*.cxx': 'cpp',
-        '*.h++': 'cpp',
-        '*.hpp': 'cpp',
-        '*.hxx': 'cpp',
-        '*.c++-objdump': 'cpp-objdump',
-        '*.cpp-objdump': 'cpp-objdump',
-        '*.cxx-objdump': 'cpp-objdump',
-        '*.cpsa': 'cpsa',
-        '*.cr': 'cr',
-        '*.crmsh': 'crmsh',
-        '*.pcmk': 'crmsh',
-        '*.croc': 'croc',
-        '*.cry': 'cryptol',
-        '*.cs': 'csharp',
-        '*.orc': 'csound',
-        '*.udo': 'csound',
-        '*.csd': 'csound-document',
-        '*.sco': 'csound-score',
-        '*.css.in': 'css+mozpreproc',
-        '*.css': 'css',
-        '*.cu': 'cuda',
-        '*.cuh': 'cuda',
-        '*.cyp': 'cypher',
-        '*.cypher': 'cypher',
-        '*.pxd': 'cython',
-        '*.pxi': 'cython',
-        '*.pyx': 'cython',
-        '*.d-objdump': 'd-objdump',
-        '*.d': 'd',
-        '*.di': 'd',
-        '*.dart': 'dart',
-        '*.dasm': 'dasm16',
-        '*.dasm16': 'dasm16',
-        'control': 'debcontrol',
-        'sources.list': 'debsources',
-        '*.dpr': 'delphi',
-        '*.pas': 'delphi',
-        '*.dts': 'devicetree',
-        '*.dtsi': 'devicetree',
-        '*.dg': 'dg',
-        '*.diff': 'diff',
-        '*.patch': 'diff',
-        '*.docker': 'docker',
-        'dockerfile': 'docker',
-        '*.darcspatch': 'dpatch',
-        '*.dpatch': 'dpatch',
-        '*.dtd': 'dtd',
-        '*.duel': 'duel',
-        '*.jbst': 'duel',
-        '*.dylan-console': 'dylan-console',
-        '*.hdp': 'dylan-lid',
-        '*.lid': 'dylan-lid',
-        '*.dyl': 'dylan',
-        '*.dylan': 'dylan',
-        '*.intr': 'dylan',
-        '*.eg': 'earl-grey',
-        '*.ezt': 'easytrieve',
-        '*.mac': 'easytrieve',
-        '*.ebnf': 'ebnf',
-        '*.ec': 'ec',
-        '*.eh': 'ec',
-        '*.e': 'eiffel',
-        '*.eex': 'elixir',
-        '*.ex': 'elixir',
-        '*.exs': 'elixir',
-        '*.leex': 'elixir',
-        '*.elm': 'elm',
-        '*.el': 'emacs-lisp',
-        '*.eml': 'email',
-        '*.erl-sh': 'erl',
-        '*.erl': 'erlang',
-        '*.es': 'erlang',
-        '*.escript': 'erlang',
-        '*.hrl': 'erlang',
-        '*.evoque': 'evoque',
-        '*.exec': 'execline',
-        '*.xtm': 'extempore',
-        '*.factor': 'factor',
-        '*.fan': 'fan',
-        '*.fancypack': 'fancy',
-        '*.fy': 'fancy',
-        '*.flx': 'felix',
-        '*.flxh': 'felix',
-        '*.fnl': 'fennel',
-        '*.fish': 'fish',
-        '*.load': 'fish',
-        '*.flo': 'floscript',
-        '*.frt': 'forth',
-        '*.f03': 'fortran',
-        '*.f90': 'fortran',
-        '*.f': 'fortranfixed',
-        '*.prg': 'foxpro',
-        '*.edp': 'freefem',
-        '*.fsi': 'fsharp',
-        '*.fst': 'fstar',
-        '*.fsti': 'fstar',
-        '*.fut': 'futhark',
-        '*.gap': 'gap',
-        '*.gi': 'gap',
-        '*.gcode': 'gcode',
-        '*.kid': 'genshi',
-        '*.feature': 'gherkin',
-        '*.frag': 'glsl',
-        '*.geo': 'glsl',
-        '*.vert': 'glsl',
-        '*.plot': 'gnuplot',
-        '*.plt': 'gnuplot',
-        '*.go': 'go',
-        '*.golo': 'golo',
-        '*.gdc': 'gooddata-cl',
-        '*.gs': 'gosu',
-        '*.gsp': 'gosu',
-        '*.gsx': 'gosu',
-        '*.vark': 'gosu',
-        '*.dot': 'graphviz',
-        '*.gv': 'graphviz',
-        '*.[1234567]': 'groff',
-        '*.man': 'groff',
-        '*.gradle': 'groovy',
-        '*.groovy': 'groovy',
-        '*.gst': 'gst',
-        '*.haml': 'haml',
-        '*.hs': 'haskell',
-        '*.hx': 'haxe',
-        '*.hxsl': 'haxe',
-        '*.hxml': 'haxeml',
-        '*.hlsl': 'hlsl',
-        '*.hlsli': 'hlsl',
-        '*.hsail': 'hsail',
-        '*.handlebars': 'html+handlebars',
-        '*.hbs': 'html+handlebars',
-        '*.ng2': 'html+ng2',
-        '*.phtml': 'html+php',
-        '*.twig': 'html+twig',
-        '*.htm': 'html',
-        '*.xhtml': 'html',
-        '*.hyb': 'hybris',
-        '*.i6t': 'i6t',
-        '*.icon': 'icon',
-        '*.idr': 'idris',
-        '*.ipf': 'igor',
-        '*.i7x': 'inform7',
-        '*.ni': 'inform7',
-        '*.cfg': 'ini',
-        '*.ini': 'ini',
-        '*.io': 'io',
-        '*.ik': 'ioke',
-        '*.weechatlog': 'irc',
-        '*.thy': 'isabelle',
-        '*.ijs': 'j',
-        '*.jag': 'jags',
-        '*.java': 'java',
-        '*.js.in': 'javascript+mozpreproc',
-        '*.cjs': 'javascript',
-        '*.js': 'javascript',
-        '*.jsm': 'javascript',
-        '*.mjs': 'javascript',
-        '*.jcl': 'jcl',
-        '*.jsgf': 'jsgf',
-        '*.json': 'json',
-        'pipfile.lock': 'json',
-        '*.jsonld': 'jsonld',
-        '*.jsp': 'jsp',
-        '*.jl': 'julia',
-        '*.juttle': 'juttle',
-        '*.kal': 'kal',
-        '*config.in*': 'kconfig',
-        'external.in*': 'kconfig',
-        'kconfig*': 'kconfig',
-        'standard-modules.in': 'kconfig',
-        '*.dmesg': 'kmsg',
-        '*.kmsg': 'kmsg',
-        '*.kk': 'koka',
-        '*.kki': 'koka',
-        '*.kt': 'kotlin',
-        '*.kts': 'kotlin',
-        '*.kn': 'kuin',
-        '*.lasso': 'lasso',
-        '*.lasso[89]': 'lasso',
-        '*.lean': 'lean',
-        '*.less': 'less',
-        'lighttpd.conf': 'lighttpd',
-        '*.liquid': 'liquid',
-        '*.lagda': 'literate-agda',
-        '*.lcry': 'literate-cryptol',
-        '*.lhs': 'literate-haskell',
-        '*.lidr': 'literate-idris',
-        '*.ls': 'livescript',
-        '*.mir': 'llvm-mir',
-        '*.ll': 'llvm',
-        '*.x': 'logos',
-        '*.xi': 'logos',
-        '*.xm': 'logos',
-        '*.xmi': 'logos',
-        '*.lgt': 'logtalk',
-        '*.logtalk': 'logtalk',
-        '*.lsl': 'lsl',
-        '*.lua': 'lua',
-        '*.wlua': 'lua',
-        '*.mak': 'make',
-        '*.mk': 'make',
-        'gnumakefile': 'make',
-        'makefile': 'make',
-        'makefile.*': 'make',
-        '*.mao': 'mako',
-        '*.maql': 'maql',
-        '*.markdown': 'markdown',
-        '*.md': 'markdown',
-        '*.mask': 'mask',
-        '*.mc': 'mason',
-        '*.mhtml': 'mason',
-        '*.mi': 'mason',
-        'autohandler': 'mason',
-        'dhandler': 'mason',
-        '*.cdf': 'mathematica',
-        '*.ma': 'mathematica',
-        '*.nb': 'mathematica',
-        '*.nbp': 'mathematica',
-        '*.ms': 'miniscript',
-        '*.mo': 'modelica',
-        '*.mod': 'modula2',
-        '*.monkey': 'monkey',
-        '*.mt': 'monte',
-        '*.moo': 'moocode',
-        '*.moon': 'moonscript',
-        '*.mos': 'mosel',
-        '*.mq4': 'mql',
-        '*.mq5': 'mql',
-        '*.mqh': 'mql',
-        '*.msc': 'mscgen',
-        '*.mu': 'mupad',
-        '*.mxml': 'mxml',
-        '*.myt': 'myghty',
-        'autodelegate': 'myghty',
-        '*.ncl': 'ncl',
-        '*.nc': 'nesc',
-        '*.nt': 'nestedtext',
-        '*.kif': 'newlisp',
-        '*.lsp': 'newlisp',
-        '*.nl': 'newlisp',
-        '*.ns2': 'newspeak',
-        'nginx.conf': 'nginx',
-        '*.nim': 'nimrod',
-        '*.nimrod': 'nimrod',
-        '*.nit': 'nit',
-        '*.nix': 'nixos',
-        '*.nsh': 'nsis',
-        '*.nsi': 'nsis',
-        '*.smv': 'nusmv',
-        '*.objdump-intel': 'objdump-nasm',
-        '*.objdump': 'objdump',
-        '*.mm': 'objective-c++',
-        '*.ml': 'ocaml',
-        '*.mli': 'ocaml',
-        '*.mll': 'ocaml',
-        '*.mly': 'ocaml',
-        '*.odin': 'odin',
-        '*.idl': 'omg-idl',
-        '*.pidl': 'omg-idl',
-        '*.ooc': 'ooc',
-        '*.opa': 'opa',
-        '*.cls': 'openedge',
-        'pacman.conf': 'pacmanconf',
-        '*.pan': 'pan',
-        '*.psi': 'parasail',
-        '*.psl': 'parasail',
-        '*.pwn': 'pawn',
-        '*.peg': 'peg',
-        '*.perl': 'perl',
-        '*.6pl': 'perl6',
-        '*.6pm': 'perl6',
-        '*.nqp': 'perl6',
-        '*.p6': 'perl6',
-        '*.p6l': 'perl6',
-        '*.p6m': 'perl6',
-        '*.pl6': 'perl6',
-        '*.pm6': 'perl6',
-        '*.raku': 'perl6',
-        '*.rakudoc': 'perl6',
-        '*.rakumod': 'perl6',
-        '*.rakutest': 'perl6',
-        '*.php': 'php',
-        '*.php[345]': 'php',
-        '*.pig': 'pig',
-        '*.pike': 'pike',
-        '*.pmod': 'pike',
-        '*.pc': 'pkgconfig',
-        '*.ptls': 'pointless',
-        '*.pony': 'pony',
-        '*.eps': 'postscript',
-        '*.ps': 'postscript',
-        '*.po': 'pot',
-        '*.pot': 'pot',
-        '*.pov': 'pov',
-        '*.ps1': 'powershell',
-        '*.psm1': 'powershell',
-        '*.praat': 'praat',
-        '*.proc': 'praat',
-        '*.psc': 'praat',
-        '*.prolog': 'prolog',
-        '*.promql': 'promql',
-        '*.properties': 'properties',
-        '*.proto': 'protobuf',
-        '*.jade': 'pug',
-        '*.pug': 'pug',
-        '*.pp': 'puppet',
-        '*.py2tb': 'py2tb',
-        '*.pypylog': 'pypylog',
-        '*.py3tb': 'pytb',
-        '*.pytb': 'pytb',
-        '*.bzl': 'python',
-        '*.jy': 'python',
-        '*.py': 'python',
-        '*.pyw': 'python',
-        '*.sage': 'python',
-        '*.tac': 'python',
-        'buck': 'python',
-        'build': 'python',
-        'build.bazel': 'python',
-        'sconscript': 'python',
-        'sconstruct': 'python',
-        'workspace': 'python',
-        '*.qbs': 'qml',
-        '*.qml': 'qml',
-        '*.qvto': 'qvto',
-        '*.rkt': 'racket',
-        '*.rktd': 'racket',
-        '*.rktl': 'racket',
-        '*.rout': 'rconsole',
-        '*.rd': 'rd',
-        '*.re': 'reasonml',
-        '*.rei': 'reasonml',
-        '*.r3': 'rebol',
-        '*.reb': 'rebol',
-        '*.red': 'red',
-        '*.reds': 'red',
-        '*.cw': 'redcode',
-        '*.reg': 'registry',
-        '*.rest': 'restructuredtext',
-        '*.rst': 'restructuredtext',
-        '*.arexx': 'rexx',
-        '*.rex': 'rexx',
-        '*.rexx': 'rexx',
-        '*.rx': 'rexx',
-        '*.rhtml': 'rhtml',
-        '*.ride': 'ride',
-        '*.rnc': 'rng-compact',
-        '*.graph': 'roboconf-graph',
-        '*.instances': 'roboconf-instances',
-        '*.robot': 'robotframework',
-        '*.rql': 'rql',
-        '*.rsl': 'rsl',
-        '*.duby': 'ruby',
-        '*.gemspec': 'ruby',
-        '*.rake': 'ruby',
-        '*.rb': 'ruby',
-        '*.rbw': 'ruby',
-        '*.rbx': 'ruby',
-        'gemfile': 'ruby',
-        'rakefile': 'ruby',
-        '*.rs': 'rust',
-        '*.rs.in': 'rust',
-        '*.sarl': 'sarl',
-        '*.sas': 'sas',
-        '*.sass': 'sass',
-        '*.scala': 'scala',
-        '*.scaml': 'scaml',
-        '*.scdoc': 'scdoc',
-        '*.scm': 'scheme',
-        '*.ss': 'scheme',
-        '*.sce': 'scilab',
-        '*.sci': 'scilab',
-        '*.tst': 'scilab',
-        '*.scss': 'scss',
-        '*.sgf': 'sgf',
-        '*.shen': 'shen',
-        '*.shex': 'shexc',
-        '*.sieve': 'sieve',
-        '*.siv': 'sieve',
-        '*.sil': 'silver',
-        '*.vpr': 'silver',
-        'singularity': 'singularity',
-        '*.sla': 'slash',
-        '*.slim': 'slim',
-        '*.sl': 'slurm',
-        '*.smali': 'smali',
-        '*.st': 'smalltalk',
-        '*.tpl': 'smarty',
-        '*.fun': 'sml',
-        '*.sig': 'sml',
-        '*.sml': 'sml',
-        '*.snobol': 'snobol',
-        '*.sbl': 'snowball',
-        '*.sol': 'solidity',
-        '*.sp': 'sp',
-        '*.rq': 'sparql',
-        '*.sparql': 'sparql',
-        '*.spec': 'spec',
-        '.renviron': 'splus',
-        '.rhistory': 'splus',
-        '.rprofile': 'splus',
-        '*.sqlite3-console': 'sqlite3',
-        'squid.conf': 'squidconf',
-        '*.ssp': 'ssp',
-        '*.stan': 'stan',
-        '*.ado': 'stata',
-        '*.do': 'stata',
-        '*.swift': 'swift',
-        '*.i': 'swig',
-        '*.swg': 'swig',
-        '*.sv': 'systemverilog',
-        '*.svh': 'systemverilog',
-        '*.tap': 'tap',
-        '*.tasm': 'tasm',
-        '*.rvt': 'tcl',
-        '*.tcl': 'tcl',
-        '*.csh': 'tcsh',
-        '*.tcsh': 'tcsh',
-        '*.tea': 'tea',
-        '*.teal': 'teal',
-        'termcap': 'termcap',
-        'termcap.src': 'termcap',
-        'terminfo': 'terminfo',
-        'terminfo.src': 'terminfo',
-        '*.tf': 'terraform',
-        '*.aux': 'tex',
-        '*.tex': 'tex',
-        '*.toc': 'tex',
-        '*.txt': 'text',
-        '*.thrift': 'thrift',
-        '*.ti': 'ti',
-        '*.tid': 'tid',
-        '*.tnt': 'tnt',
-        '*.todotxt': 'todotxt',
-        'todo.txt': 'todotxt',
-        '*.toml': 'toml',
-        'pipfile': 'toml',
-        'poetry.lock': 'toml',
-        '*.rts': 'trafficscript',
-        '*.treetop': 'treetop',
-        '*.tt': 'treetop',
-        '*.ts': 'typescript',
-        '*.tsx': 'typescript',
-        '*.typoscript': 'typoscript',
-        '*.u1': 'ucode',
-        '*.u2': 'ucode',
-        '*.icn': 'unicon',
-        '*.usd': 'usd',
-        '*.usda': 'usd',
-        '*.vala': 'vala',
-        '*.vapi': 'vala',
-        '*.vb': 'vb.net',
-        '*.vbs': 'vbscript',
-        '*.vcl': 'vcl',
-        '*.fhtml': 'velocity',
-        '*.vm': 'velocity',
-        '*.rpf': 'vgl',
-        '*.vhd': 'vhdl',
-        '*.vhdl': 'vhdl',
-        '*.vim': 'vim',
-        '.exrc': 'vim',
-        '.gvimrc': 'vim',
-        '.vimrc': 'vim',
-        '_exrc': 'vim',
-        '_gvimrc': 'vim',
-        '_vimrc': 'vim',
-        'gvimrc': 'vim',
-        'vimrc': 'vim',
-        '*.wast': 'wast',
-        '*.wat': 'wast',
-        '*.wdiff': 'wdiff',
-        '*.webidl': 'webidl',
-        '*.whiley': 'whiley',
-        '*.x10': 'x10',
-        '*.rss': 'xml',
-        '*.wsdl': 'xml',
-        '*.wsf': 'xml',
-        '*.xsd': 'xml',
-        'xorg.conf': 'xorg.conf',
-        '*.xq': 'xquery',
-        '*.xql': 'xquery',
-        '*.xqm': 'xquery',
-        '*.xquery': 'xquery',
-        '*.xqy': 'xquery',
-        '*.xpl': 'xslt',
-        '*.xtend': 'xtend',
-        '*.xul.in': 'xul+mozpreproc',
-        '*.sls': 'yaml+jinja',
-        '*.yaml': 'yaml',
-        '*.yml': 'yaml',
-        '*.yang': 'yang',
-        '*.bro': 'zeek',
-        '*.zeek': 'zeek',
-        '*.zep': 'zephir',
-        '*.zig': 'zig',
-    }
-    ambiguous_ext2lexer = {
-        '*.c': 'c',
-        '*.h': 'c',
-        '*.cp': 'cpp',
-        '*.hh': 'cpp',
-        '*.html': 'cpp',
-        '*.xml': 'xml',
-        '*.xsl': 'xslt',
-        '*.xslt': 'xslt',
-        '*.sql': 'sql',
-        '*.r': 'rebol',
-
-    }
-
-    manual_tuning = dict()
-    for ext, lexer in {**unique_ext2lexer, **ambiguous_ext2lexer, **manual_tuning}.items():
-        if ext in EXT_MAP:
-            debug(f"Skipping {ext} ...")
-            continue
-        MINTED_EXTS.add(ext)
-        EXT_MAP[ext] = scoop_minted_fcn(lexer)
-
-PANDAS_EXT_MAP = dict()
-if deps.PANDAS_OK:
-    PANDAS_EXT_MAP = {
-        '*.csv': pandas_scoop_csv,
-        '*.tsv': pandas_scoop_tsv,
-    }
-    EXT_MAP.update(PANDAS_EXT_MAP)
+# deps.get_pygmentize_lexers
+# Always registered: the handlers only need pygmentize once they are called
+unique_ext2lexer = {
+    '*.abap': 'abap',
+    '*.abnf': 'abnf',
+    '*.ada': 'ada',
+    '*.adb': 'ada',
+    '*.ads': 'ada',
+    '*.adl': 'adl',
+    '*.adlf': 'adl',
+    '*.adls': 'adl',
+    '*.adlx': 'adl',
+    '*.agda': 'agda',
+    '*.aheui': 'aheui',
+    '*.als': 'alloy',
+    '*.at': 'ambienttalk',
+    '*.isa': 'amdgpu',
+    '*.run': 'ampl',
+    '*.ans': 'ansys',
+    '.htaccess': 'apacheconf',
+    'apache.conf': 'apacheconf',
+    'apache2.conf': 'apacheconf',
+    '*.apl': 'apl',
+    '*.aplc': 'apl',
+    '*.aplf': 'apl',
+    '*.apli': 'apl',
+    '*.apln': 'apl',
+    '*.aplo': 'apl',
+    '*.dyalog': 'apl',
+    '*.applescript': 'applescript',
+    '*.ino': 'arduino',
+    '*.arw': 'arrow',
+    '*.aj': 'aspectj',
+    '*.asy': 'asymptote',
+    '*.aug': 'augeas',
+    '*.ahk': 'autohotkey',
+    '*.ahkl': 'autohotkey',
+    '*.au3': 'autoit',
+    '*.awk': 'awk',
+    '*.bare': 'bare',
+    '*.bash': 'bash',
+    '*.ebuild': 'bash',
+    '*.eclass': 'bash',
+    '*.exheres-0': 'bash',
+    '*.exlib': 'bash',
+    '*.ksh': 'bash',
+    '*.sh': 'bash',
+    '*.zsh': 'bash',
+    '.bash_*': 'bash',
+    '.bashrc': 'bash',
+    '.zshrc': 'bash',
+    'bash_*': 'bash',
+    'bashrc': 'bash',
+    'pkgbuild': 'bash',
+    'zshrc': 'bash',
+    '*.bat': 'batch',
+    '*.cmd': 'batch',
+    '*.bbc': 'bbcbasic',
+    '*.bc': 'bc',
+    '*.befunge': 'befunge',
+    '*.bib': 'bibtex',
+    '*.bb': 'blitzbasic',
+    '*.decls': 'blitzbasic',
+    '*.bmx': 'blitzmax',
+    '*.bnf': 'bnf',
+    '*.boa': 'boa',
+    '*.boo': 'boo',
+    '*.bpl': 'boogie',
+    '*.bf': 'brainfuck',
+    '*.bst': 'bst',
+    '*.c-objdump': 'c-objdump',
+    '*.idc': 'c',
+    '*.cadl': 'cadl',
+    '*.camkes': 'camkes',
+    '*.idl4': 'camkes',
+    '*.cdl': 'capdl',
+    '*.capnp': 'capnp',
+    '*.cddl': 'cddl',
+    '*.ceylon': 'ceylon',
+    '*.cfc': 'cfc',
+    '*.cf': 'cfengine3',
+    '*.cfm': 'cfm',
+    '*.cfml': 'cfm',
+    '*.chai': 'chaiscript',
+    '*.chpl': 'chapel',
+    '*.ci': 'charmci',
+    '*.spt': 'cheetah',
+    '*.tmpl': 'cheetah',
+    '*.cirru': 'cirru',
+    '*.clay': 'clay',
+    '*.dcl': 'clean',
+    '*.icl': 'clean',
+    '*.clj': 'clojure',
+    '*.cljs': 'clojurescript',
+    '*.cmake': 'cmake',
+    'cmakelists.txt': 'cmake',
+    '*.cob': 'cobol',
+    '*.cpy': 'cobol',
+    '*.cbl': 'cobolfree',
+    '*.coffee': 'coffeescript',
+    '*.cl': 'common-lisp',
+    '*.lisp': 'common-lisp',
+    '*.cps': 'componentpascal',
+    '*.sh-session': 'console',
+    '*.shell-session': 'console',
+    '*.c++': 'cpp',
+    '*.cc': 'cpp',
+    '*.cpp': 'cpp',
+    '*.cxx': 'cpp',
+    '*.h++': 'cpp',
+    '*.hpp': 'cpp',
+    '*.hxx': 'cpp',
+    '*.c++-objdump': 'cpp-objdump',
+    '*.cpp-objdump': 'cpp-objdump',
+    '*.cxx-objdump': 'cpp-objdump',
+    '*.cpsa': 'cpsa',
+    '*.cr': 'cr',
+    '*.crmsh': 'crmsh',
+    '*.pcmk': 'crmsh',
+    '*.croc': 'croc',
+    '*.cry': 'cryptol',
+    '*.cs': 'csharp',
+    '*.orc': 'csound',
+    '*.udo': 'csound',
+    '*.csd': 'csound-document',
+    '*.sco': 'csound-score',
+    '*.css.in': 'css+mozpreproc',
+    '*.css': 'css',
+    '*.cu': 'cuda',
+    '*.cuh': 'cuda',
+    '*.cyp': 'cypher',
+    '*.cypher': 'cypher',
+    '*.pxd': 'cython',
+    '*.pxi': 'cython',
+    '*.pyx': 'cython',
+    '*.d-objdump': 'd-objdump',
+    '*.d': 'd',
+    '*.di': 'd',
+    '*.dart': 'dart',
+    '*.dasm': 'dasm16',
+    '*.dasm16': 'dasm16',
+    'control': 'debcontrol',
+    'sources.list': 'debsources',
+    '*.dpr': 'delphi',
+    '*.pas': 'delphi',
+    '*.dts': 'devicetree',
+    '*.dtsi': 'devicetree',
+    '*.dg': 'dg',
+    '*.diff': 'diff',
+    '*.patch': 'diff',
+    '*.docker': 'docker',
+    'dockerfile': 'docker',
+    '*.darcspatch': 'dpatch',
+    '*.dpatch': 'dpatch',
+    '*.dtd': 'dtd',
+    '*.duel': 'duel',
+    '*.jbst': 'duel',
+    '*.dylan-console': 'dylan-console',
+    '*.hdp': 'dylan-lid',
+    '*.lid': 'dylan-lid',
+    '*.dyl': 'dylan',
+    '*.dylan': 'dylan',
+    '*.intr': 'dylan',
+    '*.eg': 'earl-grey',
+    '*.ezt': 'easytrieve',
+    '*.mac': 'easytrieve',
+    '*.ebnf': 'ebnf',
+    '*.ec': 'ec',
+    '*.eh': 'ec',
+    '*.e': 'eiffel',
+    '*.eex': 'elixir',
+    '*.ex': 'elixir',
+    '*.exs': 'elixir',
+    '*.leex': 'elixir',
+    '*.elm': 'elm',
+    '*.el': 'emacs-lisp',
+    '*.eml': 'email',
+    '*.erl-sh': 'erl',
+    '*.erl': 'erlang',
+    '*.es': 'erlang',
+    '*.escript': 'erlang',
+    '*.hrl': 'erlang',
+    '*.evoque': 'evoque',
+    '*.exec': 'execline',
+    '*.xtm': 'extempore',
+    '*.factor': 'factor',
+    '*.fan': 'fan',
+    '*.fancypack': 'fancy',
+    '*.fy': 'fancy',
+    '*.flx': 'felix',
+    '*.flxh': 'felix',
+    '*.fnl': 'fennel',
+    '*.fish': 'fish',
+    '*.load': 'fish',
+    '*.flo': 'floscript',
+    '*.frt': 'forth',
+    '*.f03': 'fortran',
+    '*.f90': 'fortran',
+    '*.f': 'fortranfixed',
+    '*.prg': 'foxpro',
+    '*.edp': 'freefem',
+    '*.fsi': 'fsharp',
+    '*.fst': 'fstar',
+    '*.fsti': 'fstar',
+    '*.fut': 'futhark',
+    '*.gap': 'gap',
+    '*.gi': 'gap',
+    '*.gcode': 'gcode',
+    '*.kid': 'genshi',
+    '*.feature': 'gherkin',
+    '*.frag': 'glsl',
+    '*.geo': 'glsl',
+    '*.vert': 'glsl',
+    '*.plot': 'gnuplot',
+    '*.plt': 'gnuplot',
+    '*.go': 'go',
+    '*.golo': 'golo',
+    '*.gdc': 'gooddata-cl',
+    '*.gs': 'gosu',
+    '*.gsp': 'gosu',
+    '*.gsx': 'gosu',
+    '*.vark': 'gosu',
+    '*.dot': 'graphviz',
+    '*.gv': 'graphviz',
+    '*.[1234567]': 'groff',
+    '*.man': 'groff',
+    '*.gradle': 'groovy',
+    '*.groovy': 'groovy',
+    '*.gst': 'gst',
+    '*.haml': 'haml',
+    '*.hs': 'haskell',
+    '*.hx': 'haxe',
+    '*.hxsl': 'haxe',
+    '*.hxml': 'haxeml',
+    '*.hlsl': 'hlsl',
+    '*.hlsli': 'hlsl',
+    '*.hsail': 'hsail',
+    '*.handlebars': 'html+handlebars',
+    '*.hbs': 'html+handlebars',
+    '*.ng2': 'html+ng2',
+    '*.phtml': 'html+php',
+    '*.twig': 'html+twig',
+    '*.htm': 'html',
+    '*.xhtml': 'html',
+    '*.hyb': 'hybris',
+    '*.i6t': 'i6t',
+    '*.icon': 'icon',
+    '*.idr': 'idris',
+    '*.ipf': 'igor',
+    '*.i7x': 'inform7',
+    '*.ni': 'inform7',
+    '*.cfg': 'ini',
+    '*.ini': 'ini',
+    '*.io': 'io',
+    '*.ik': 'ioke',
+    '*.weechatlog': 'irc',
+    '*.thy': 'isabelle',
+    '*.ijs': 'j',
+    '*.jag': 'jags',
+    '*.java': 'java',
+    '*.js.in': 'javascript+mozpreproc',
+    '*.cjs': 'javascript',
+    '*.js': 'javascript',
+    '*.jsm': 'javascript',
+    '*.mjs': 'javascript',
+    '*.jcl': 'jcl',
+    '*.jsgf': 'jsgf',
+    '*.json': 'json',
+    'pipfile.lock': 'json',
+    '*.jsonld': 'jsonld',
+    '*.jsp': 'jsp',
+    '*.jl': 'julia',
+    '*.juttle': 'juttle',
+    '*.kal': 'kal',
+    '*config.in*': 'kconfig',
+    'external.in*': 'kconfig',
+    'kconfig*': 'kconfig',
+    'standard-modules.in': 'kconfig',
+    '*.dmesg': 'kmsg',
+    '*.kmsg': 'kmsg',
+    '*.kk': 'koka',
+    '*.kki': 'koka',
+    '*.kt': 'kotlin',
+    '*.kts': 'kotlin',
+    '*.kn': 'kuin',
+    '*.lasso': 'lasso',
+    '*.lasso[89]': 'lasso',
+    '*.lean': 'lean',
+    '*.less': 'less',
+    'lighttpd.conf': 'lighttpd',
+    '*.liquid': 'liquid',
+    '*.lagda': 'literate-agda',
+    '*.lcry': 'literate-cryptol',
+    '*.lhs': 'literate-haskell',
+    '*.lidr': 'literate-idris',
+    '*.ls': 'livescript',
+    '*.mir': 'llvm-mir',
+    '*.ll': 'llvm',
+    '*.x': 'logos',
+    '*.xi': 'logos',
+    '*.xm': 'logos',
+    '*.xmi': 'logos',
+    '*.lgt': 'logtalk',
+    '*.logtalk': 'logtalk',
+    '*.lsl': 'lsl',
+    '*.lua': 'lua',
+    '*.wlua': 'lua',
+    '*.mak': 'make',
+    '*.mk': 'make',
+    'gnumakefile': 'make',
+    'makefile': 'make',
+    'makefile.*': 'make',
+    '*.mao': 'mako',
+    '*.maql': 'maql',
+    '*.markdown': 'markdown',
+    '*.md': 'markdown',
+    '*.mask': 'mask',
+    '*.mc': 'mason',
+    '*.mhtml': 'mason',
+    '*.mi': 'mason',
+    'autohandler': 'mason',
+    'dhandler': 'mason',
+    '*.cdf': 'mathematica',
+    '*.ma': 'mathematica',
+    '*.nb': 'mathematica',
+    '*.nbp': 'mathematica',
+    '*.ms': 'miniscript',
+    '*.mo': 'modelica',
+    '*.mod': 'modula2',
+    '*.monkey': 'monkey',
+    '*.mt': 'monte',
+    '*.moo': 'moocode',
+    '*.moon': 'moonscript',
+    '*.mos': 'mosel',
+    '*.mq4': 'mql',
+    '*.mq5': 'mql',
+    '*.mqh': 'mql',
+    '*.msc': 'mscgen',
+    '*.mu': 'mupad',
+    '*.mxml': 'mxml',
+    '*.myt': 'myghty',
+    'autodelegate': 'myghty',
+    '*.ncl': 'ncl',
+    '*.nc': 'nesc',
+    '*.nt': 'nestedtext',
+    '*.kif': 'newlisp',
+    '*.lsp': 'newlisp',
+    '*.nl': 'newlisp',
+    '*.ns2': 'newspeak',
+    'nginx.conf': 'nginx',
+    '*.nim': 'nimrod',
+    '*.nimrod': 'nimrod',
+    '*.nit': 'nit',
+    '*.nix': 'nixos',
+    '*.nsh': 'nsis',
+    '*.nsi': 'nsis',
+    '*.smv': 'nusmv',
+    '*.objdump-intel': 'objdump-nasm',
+    '*.objdump': 'objdump',
+    '*.mm': 'objective-c++',
+    '*.ml': 'ocaml',
+    '*.mli': 'ocaml',
+    '*.mll': 'ocaml',
+    '*.mly': 'ocaml',
+    '*.odin': 'odin',
+    '*.idl': 'omg-idl',
+    '*.pidl': 'omg-idl',
+    '*.ooc': 'ooc',
+    '*.opa': 'opa',
+    '*.cls': 'openedge',
+    'pacman.conf': 'pacmanconf',
+    '*.pan': 'pan',
+    '*.psi': 'parasail',
+    '*.psl': 'parasail',
+    '*.pwn': 'pawn',
+    '*.peg': 'peg',
+    '*.perl': 'perl',
+    '*.6pl': 'perl6',
+    '*.6pm': 'perl6',
+    '*.nqp': 'perl6',
+    '*.p6': 'perl6',
+    '*.p6l': 'perl6',
+    '*.p6m': 'perl6',
+    '*.pl6': 'perl6',
+    '*.pm6': 'perl6',
+    '*.raku': 'perl6',
+    '*.rakudoc': 'perl6',
+    '*.rakumod': 'perl6',
+    '*.rakutest': 'perl6',
+    '*.php': 'php',
+    '*.php[345]': 'php',
+    '*.pig': 'pig',
+    '*.pike': 'pike',
+    '*.pmod': 'pike',
+    '*.pc': 'pkgconfig',
+    '*.ptls': 'pointless',
+    '*.pony': 'pony',
+    '*.eps': 'postscript',
+    '*.ps': 'postscript',
+    '*.po': 'pot',
+    '*.pot': 'pot',
+    '*.pov': 'pov',
+    '*.ps1': 'powershell',
+    '*.psm1': 'powershell',
+    '*.praat': 'praat',
+    '*.proc': 'praat',
+    '*.psc': 'praat',
+    '*.prolog': 'prolog',
+    '*.promql': 'promql',
+    '*.properties': 'properties',
+    '*.proto': 'protobuf',
+    '*.jade': 'pug',
+    '*.pug': 'pug',
+    '*.pp': 'puppet',
+    '*.py2tb': 'py2tb',
+    '*.pypylog': 'pypylog',
+    '*.py3tb': 'pytb',
+    '*.pytb': 'pytb',
+    '*.bzl': 'python',
+    '*.jy': 'python',
+    '*.py': 'python',
+    '*.pyw': 'python',
+    '*.sage': 'python',
+    '*.tac': 'python',
+    'buck': 'python',
+    'build': 'python',
+    'build.bazel': 'python',
+    'sconscript': 'python',
+    'sconstruct': 'python',
+    'workspace': 'python',
+    '*.qbs': 'qml',
+    '*.qml': 'qml',
+    '*.qvto': 'qvto',
+    '*.rkt': 'racket',
+    '*.rktd': 'racket',
+    '*.rktl': 'racket',
+    '*.rout': 'rconsole',
+    '*.rd': 'rd',
+    '*.re': 'reasonml',
+    '*.rei': 'reasonml',
+    '*.r3': 'rebol',
+    '*.reb': 'rebol',
+    '*.red': 'red',
+    '*.reds': 'red',
+    '*.cw': 'redcode',
+    '*.reg': 'registry',
+    '*.rest': 'restructuredtext',
+    '*.rst': 'restructuredtext',
+    '*.arexx': 'rexx',
+    '*.rex': 'rexx',
+    '*.rexx': 'rexx',
+    '*.rx': 'rexx',
+    '*.rhtml': 'rhtml',
+    '*.ride': 'ride',
+    '*.rnc': 'rng-compact',
+    '*.graph': 'roboconf-graph',
+    '*.instances': 'roboconf-instances',
+    '*.robot': 'robotframework',
+    '*.rql': 'rql',
+    '*.rsl': 'rsl',
+    '*.duby': 'ruby',
+    '*.gemspec': 'ruby',
+    '*.rake': 'ruby',
+    '*.rb': 'ruby',
+    '*.rbw': 'ruby',
+    '*.rbx': 'ruby',
+    'gemfile': 'ruby',
+    'rakefile': 'ruby',
+    '*.rs': 'rust',
+    '*.rs.in': 'rust',
+    '*.sarl': 'sarl',
+    '*.sas': 'sas',
+    '*.sass': 'sass',
+    '*.scala': 'scala',
+    '*.scaml': 'scaml',
+    '*.scdoc': 'scdoc',
+    '*.scm': 'scheme',
+    '*.ss': 'scheme',
+    '*.sce': 'scilab',
+    '*.sci': 'scilab',
+    '*.tst': 'scilab',
+    '*.scss': 'scss',
+    '*.sgf': 'sgf',
+    '*.shen': 'shen',
+    '*.shex': 'shexc',
+    '*.sieve': 'sieve',
+    '*.siv': 'sieve',
+    '*.sil': 'silver',
+    '*.vpr': 'silver',
+    'singularity': 'singularity',
+    '*.sla': 'slash',
+    '*.slim': 'slim',
+    '*.sl': 'slurm',
+    '*.smali': 'smali',
+    '*.st': 'smalltalk',
+    '*.tpl': 'smarty',
+    '*.fun': 'sml',
+    '*.sig': 'sml',
+    '*.sml': 'sml',
+    '*.snobol': 'snobol',
+    '*.sbl': 'snowball',
+    '*.sol': 'solidity',
+    '*.sp': 'sp',
+    '*.rq': 'sparql',
+    '*.sparql': 'sparql',
+    '*.spec': 'spec',
+    '.renviron': 'splus',
+    '.rhistory': 'splus',
+    '.rprofile': 'splus',
+    '*.sqlite3-console': 'sqlite3',
+    'squid.conf': 'squidconf',
+    '*.ssp': 'ssp',
+    '*.stan': 'stan',
+    '*.ado': 'stata',
+    '*.do': 'stata',
+    '*.swift': 'swift',
+    '*.i': 'swig',
+    '*.swg': 'swig',
+    '*.sv': 'systemverilog',
+    '*.svh': 'systemverilog',
+    '*.tap': 'tap',
+    '*.tasm': 'tasm',
+    '*.rvt': 'tcl',
+    '*.tcl': 'tcl',
+    '*.csh': 'tcsh',
+    '*.tcsh': 'tcsh',
+    '*.tea': 'tea',
+    '*.teal': 'teal',
+    'termcap': 'termcap',
+    'termcap.src': 'termcap',
+    'terminfo': 'terminfo',
+    'terminfo.src': 'terminfo',
+    '*.tf': 'terraform',
+    '*.aux': 'tex',
+    '*.tex': 'tex',
+    '*.toc': 'tex',
+    '*.txt': 'text',
+    '*.thrift': 'thrift',
+    '*.ti': 'ti',
+    '*.tid': 'tid',
+    '*.tnt': 'tnt',
+    '*.todotxt': 'todotxt',
+    'todo.txt': 'todotxt',
+    '*.toml': 'toml',
+    'pipfile': 'toml',
+    'poetry.lock': 'toml',
+    '*.rts': 'trafficscript',
+    '*.treetop': 'treetop',
+    '*.tt': 'treetop',
+    '*.ts': 'typescript',
+    '*.tsx': 'typescript',
+    '*.typoscript': 'typoscript',
+    '*.u1': 'ucode',
+    '*.u2': 'ucode',
+    '*.icn': 'unicon',
+    '*.usd': 'usd',
+    '*.usda': 'usd',
+    '*.vala': 'vala',
+    '*.vapi': 'vala',
+    '*.vb': 'vb.net',
+    '*.vbs': 'vbscript',
+    '*.vcl': 'vcl',
+    '*.fhtml': 'velocity',
+    '*.vm': 'velocity',
+    '*.rpf': 'vgl',
+    '*.vhd': 'vhdl',
+    '*.vhdl': 'vhdl',
+    '*.vim': 'vim',
+    '.exrc': 'vim',
+    '.gvimrc': 'vim',
+    '.vimrc': 'vim',
+    '_exrc': 'vim',
+    '_gvimrc': 'vim',
+    '_vimrc': 'vim',
+    'gvimrc': 'vim',
+    'vimrc': 'vim',
+    '*.wast': 'wast',
+    '*.wat': 'wast',
+    '*.wdiff': 'wdiff',
+    '*.webidl': 'webidl',
+    '*.whiley': 'whiley',
+    '*.x10': 'x10',
+    '*.rss': 'xml',
+    '*.wsdl': 'xml',
+    '*.wsf': 'xml',
+    '*.xsd': 'xml',
+    'xorg.conf': 'xorg.conf',
+    '*.xq': 'xquery',
+    '*.xql': 'xquery',
+    '*.xqm': 'xquery',
+    '*.xquery': 'xquery',
+    '*.xqy': 'xquery',
+    '*.xpl': 'xslt',
+    '*.xtend': 'xtend',
+    '*.xul.in': 'xul+mozpreproc',
+    '*.sls': 'yaml+jinja',
+    '*.yaml': 'yaml',
+    '*.yml': 'yaml',
+    '*.yang': 'yang',
+    '*.bro': 'zeek',
+    '*.zeek': 'zeek',
+    '*.zep': 'zephir',
+    '*.zig': 'zig',
+}
+ambiguous_ext2lexer = {
+    '*.c': 'c',
+    '*.h': 'c',
+    '*.cp': 'cpp',
+    '*.hh': 'cpp',
+    '*.html': 'cpp',
+    '*.xml': 'xml',
+    '*.xsl': 'xslt',
+    '*.xslt': 'xslt',
+    '*.sql': 'sql',
+    '*.r': 'rebol',
+
+}
+
+manual_tuning = dict()
+for ext, lexer in {**unique_ext2lexer, **ambiguous_ext2lexer, **manual_tuning}.items():
+    if ext in EXT_MAP:
+        # Already scooped some other way (e.g. *.txt) -> silently, this runs on every import (workers, server...)
+        continue
+    MINTED_EXTS.add(ext)
+    MINTED_LEXERS[ext] = lexer
+    EXT_MAP[ext] = scoop_minted_fcn(lexer)
+
+PANDAS_EXT_MAP = {
+    '*.csv': pandas_scoop_csv,
+    '*.tsv': pandas_scoop_tsv,
+}
+EXT_MAP.update(PANDAS_EXT_MAP)
 PANDAS_EXTS = set(PANDAS_EXT_MAP.keys())
 
 
@@ -848,9 +1007,7 @@ PANDAS_EXTS = set(PANDAS_EXT_MAP.keys())
 # -------------------------------------------------------------------------------------------------------------------- #
 def ext_match(file: pathlib.Path) -> T.Optional[str]:
     """Return the first valid exension string (key in EXT_MAP) that matches the file OR None if it was not known"""
-    l_name = file.name.lower()
-    return next((pat for pat in EXT_MAP if fnmatch.fnmatch(name=l_name, pat=pat.lower())),
-                None)
+    return EXT_MAP.matcher.match(file.name)
 
 
 def scoop(file: T.Union[pathlib.Path, TOCFile]) -> str:
@@ -865,6 +1022,228 @@ def scoop(file: T.Union[pathlib.Path, TOCFile]) -> str:
     raise TypeError(f"Invalid *file* type {file}")
 
 
+def get_handler(ext_key: str, options: ScoopOptions = DEFAULT_OPTIONS) -> T.Callable[[pathlib.Path], str]:
+    """The scooper for the files matched by *ext_key* (a key in EXT_MAP) with the given *options*"""
+    if options.highlighter == 'pygments' and ext_key in MINTED_LEXERS:
+        return scoop_pygments_fcn(MINTED_LEXERS[ext_key])
+    fcn = EXT_MAP[ext_key]
+    if fcn is scoop_img and options.image_dpi and deps.was_pil_found():
+        return scoop_img_prepared_fcn(options.image_dpi)
+    if fcn is scoop_text and options.text_mode == 'input':
+        return scoop_text_input
+    if fcn is scoop_text and options.text_mode == 'sampled-input':
+        return scoop_text_sampled_fcn(options.text_max_bytes, options.text_max_lines)
+    if fcn is scoop_text and (options.text_max_bytes, options.text_max_lines) != (DEFAULT_TEXT_MAX_BYTES,
+                                                                                  DEFAULT_TEXT_MAX_LINES):
+        return scoop_text_fcn(options.text_max_bytes, options.text_max_lines)
+    if fcn is pandas_scoop_csv and (options.table_max_rows, options.table_max_cols) != (DEFAULT_TABLE_MAX_ROWS,
+                                                                                        DEFAULT_TABLE_MAX_COLS):
+        return pandas_scoop_csv_fcn(options.table_max_rows, options.table_max_cols)
+    return fcn
+
+
+def scoop_entry(entry: TOCFile,
+                link: pathlib.Path,
+                cache: T.Optional[FragmentCache] = None,
+                options: ScoopOptions = DEFAULT_OPTIONS,
+                digest: T.Optional[str] = None,
+                link_dir_ref: T.Optional[str] = None,
+                ) -> str:
+    """
+    Like scoop (on *link*, which points to *entry*) but re-using the cached fragment if the file did not change
+
+    :param digest: of the contents of *entry* (computed if needed & not given)
+    :param link_dir_ref: how the fragment refers to the directory of *link* (absolute path if None)
+    """
+    fcn = get_handler(entry.ext_key, options)
+    link_str = sanitize_path(link.absolute())
+    if cache is None or not getattr(fcn, 'cacheable', False):
+        if getattr(fcn, 'with_assets', False):
+            # Next to the link, it lives as long as the run does
+            fragment = fcn(link, link.parent).replace(ASSETS_TOKEN, sanitize_path(link.parent.absolute()))
+        else:
+            fragment = fcn(link)
+    else:
+        digest = digest or file_digest(entry.filepath)
+        key = cache.make_key(entry.filepath, f"{handler_id(fcn)}:{options!r}", digest=digest)
+        cached = cache.get(key)
+        if cached is None and getattr(fcn, 'with_assets', False):
+            with tempfile.TemporaryDirectory() as tmp:
+                # Through a link named after the contents -> the assets are named the same whoever stores them
+                src = pathlib.Path(tmp) / f"{digest[:16]}{entry.filepath.suffix.lower()}"
+                src.symlink_to(link.absolute())
+                assets_dir = pathlib.Path(tmp) / 'assets'
+                assets_dir.mkdir()
+                fragment = fcn(src, assets_dir)
+                cached = cache.put(key, fragment.replace(sanitize_path(src.absolute()), LINK_TOKEN),
+                                   assets=sorted(assets_dir.iterdir()))
+        elif cached is None:
+            cached = cache.put(key, fcn(link).replace(link_str, LINK_TOKEN))
+        fragment = (cached.fragment.replace(LINK_TOKEN, link_str)
+                    .replace(ASSETS_TOKEN, sanitize_path(cached.assets_dir.absolute())))
+
+    if link_dir_ref is not None:
+        fragment = fragment.replace(sanitize_path(link.parent.absolute()), link_dir_ref)
+    return fragment
+
+
+def link_name(entry: TOCFile, digest: str) -> str:
+    """A name for the link to *entry* that only changes if its path or its contents do"""
+    key_src = f"{entry.filepath.absolute()}\0{digest}".encode('utf8', 'surrogateescape')
+    return f"{hashlib.sha256(key_src).hexdigest()[:16]}{entry.filepath.suffix.lower()}"
+
+
+def _prerender_entry(entry: TOCFile,
+                     cache: FragmentCache,
+                     options: ScoopOptions,
+                     digest: T.Optional[str],
+                     ) -> T.Tuple[str, int, float, float]:
+    """
+    Runs in a worker process, returns the digest of *entry* (computed if not given), the bytes it added to *cache*
+    (the worker's copy of it -> the parent has to count them) & its (wall, cpu) time [s]
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    digest = digest or file_digest(entry.filepath)
+    added_bytes = cache.added_bytes
+    # Through a link named like the one iter_tex_fragments uses -> the same (LaTeX-safe) fragment & assets
+    with tempfile.TemporaryDirectory() as tmp:
+        link = pathlib.Path(tmp) / link_name(entry, digest)
+        link.symlink_to(entry.filepath.absolute())
+        scoop_entry(entry, link, cache=cache, options=options, digest=digest)
+    return digest, cache.added_bytes - added_bytes, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def prerender_fragments(entries: T.Iterable[TOCFile],
+                        cache: FragmentCache,
+                        options: ScoopOptions = DEFAULT_OPTIONS,
+                        max_workers: T.Optional[int] = None,
+                        profiler: T.Optional[Profiler] = None,
+                        pool: T.Optional[cf.ProcessPoolExecutor] = None,
+                        digests: T.Optional[T.Dict[pathlib.Path, str]] = None,
+                        ) -> int:
+    """
+    Render the fragments of the cacheable *entries* into *cache* in parallel worker processes
+
+    The document is still written sequentially by iter_tex_fragments, which then only has to read them back
+
+    :param entries: as returned by toc_trie.iter_entries
+    :param cache:
+    :param options:
+    :param max_workers: number of worker processes (ProcessPoolExecutor's default if None)
+    :param profiler: gets the time spent on each entry
+    :param pool: run on these worker processes (e.g. shared by the jobs of a batch) instead of starting new ones
+    :param digests: {path: digest} of the entries already hashed (e.g. by dedup), gets the ones hashed here
+    :return: number of entries that were rendered
+    """
+    todo = [e for e in entries if getattr(get_handler(e.ext_key, options), 'cacheable', False)]
+    if len(todo) < 2 or max_workers == 1:
+        return 0
+
+    digests = digests if digests is not None else dict()
+    n_done = 0
+    with contextlib.nullcontext(pool) if pool is not None else cf.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_prerender_entry, e, cache, options, digests.get(e.filepath)): e for e in todo}
+        for fut in cf.as_completed(futures):
+            try:
+                digest, added_bytes, wall, cpu = fut.result()
+                digests[futures[fut].filepath] = digest
+                cache.added_bytes += added_bytes
+                n_done += 1
+                if profiler is not None:
+                    profiler.add_entry(futures[fut].filepath, futures[fut].ext_key, wall=wall, cpu=cpu)
+            except Exception as e:
+                # Rendered (or reported) again when the document is written
+                debug(f"Could not pre-render {futures[fut].filepath}: {e}")
+    return n_done
+
+
+def duplicate_label(idx: int) -> str:
+    return f"scooper-original-{idx}"
+
+
+def iter_tex_fragments(entries: T.Sequence[TOCFile],
+                       link_dir: pathlib.Path,
+                       cache: T.Optional[FragmentCache] = None,
+                       options: ScoopOptions = DEFAULT_OPTIONS,
+                       duplicates: T.Optional[T.Mapping[int, Duplicate]] = None,
+                       ref_pages: bool = True,
+                       tex_dir: T.Optional[pathlib.Path] = None,
+                       profiler: T.Optional[Profiler] = None,
+                       digests: T.Optional[T.Mapping[pathlib.Path, str]] = None,
+                       ) -> T.Iterator[str]:
+    """
+    Yields the LaTeX code for every entry (preceded by the TOC headings it opens) one fragment at a time
+
+    :param entries: as returned by toc_trie.iter_entries
+    :param link_dir: where to create the links to the files
+    :param cache: re-use the fragments from previous runs (if given)
+    :param options: see ScoopOptions
+    :param duplicates: as returned by dedup.find_duplicates -> they are replaced by a reference to their original
+    :param ref_pages: the references include the page of the original (only valid if the originals are in *entries*)
+    :param tex_dir: where the document is compiled -> the links are referred to relative to it (absolute if None)
+    :param profiler: gets the time spent on each entry (& the document logs the TeX time, see Profiler.add_tex_times)
+    :param digests: {path: digest} of the entries hashed already (see prerender_fragments), the others are hashed here
+    :return:
+    """
+    link_dir_ref = sanitize_path(os.path.relpath(link_dir, tex_dir)) if tex_dir is not None else None
+    used_names = set()
+    duplicates = duplicates or dict()
+    originals = {d.original for d in duplicates.values()} if ref_pages else set()
+    toc_lvl_map = {idx: idx for idx in range(DEEPEST_TOC_LVL + 1)}
+    curr_path = []
+    for entry_idx, entry in enumerate(entries):
+        last_path = curr_path
+        curr_path = entry.keypath
+        toc_lvl = toc_lvl_map.get(len(entry.keypath), DEEPEST_TOC_LVL)
+
+        # TOC NESTING
+        update_map = {toc_lvl: entry.filepath.name}
+        diff_detected = False
+        for idx in range(toc_lvl):
+            last_val = last_path[idx] if idx < len(last_path) else None
+            curr_val = curr_path[idx] if idx < len(curr_path) else None
+
+            diff_detected = diff_detected or (curr_val is not None
+                                              and curr_val != last_val)
+            if diff_detected:
+                update_map[idx] = curr_path[idx]
+
+        for idx in sorted(update_map):
+            yield TOC_HEADING_FCN_MAP[idx](update_map[idx]) + '\n'
+
+        if profiler is not None:
+            # Before the duplicates too -> their TeX time is not added to the previous entry
+            yield tex_marker(entry_idx)
+        if entry_idx in duplicates:
+            dup = duplicates[entry_idx]
+            yield scoop_duplicate(dup.original_path, duplicate_label(dup.original) if ref_pages else None)
+            continue
+        if entry_idx in originals:
+            yield r'\label{' + duplicate_label(entry_idx) + '}\n'
+
+        # Include a LINK to the file -> avoids filename issues (like with spaces)
+        # Named after the file -> the same inputs give the same document
+        digest = digests.get(entry.filepath) if digests is not None else None
+        digest = digest or file_digest(entry.filepath)
+        name = base_name = link_name(entry, digest)
+        n_collisions = 0
+        while name in used_names:
+            n_collisions += 1
+            name = f"{pathlib.Path(base_name).stem}-{n_collisions}{entry.filepath.suffix.lower()}"
+        used_names.add(name)
+        link = link_dir / name
+        link.symlink_to(entry.filepath.absolute())
+        if profiler is None:
+            yield scoop_entry(entry, link, cache=cache, options=options, digest=digest, link_dir_ref=link_dir_ref)
+            continue
+        with profiler.entry(entry.filepath, entry.ext_key):
+            fragment = scoop_entry(entry, link, cache=cache, options=options, digest=digest, link_dir_ref=link_dir_ref)
+        yield fragment
+
+    if profiler is not None:
+        yield tex_marker(len(entries))
+
+
 if __name__ == '__main__':
     ext_match(pathlib.Path('/ho/hi/ho/Dockerfile'))
     print(scoop('/path/to/your/image.jpg'))
@@ -0,0 +1,110 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import json
+import pathlib
+
+from pyscooper.cli_utils import info, error
+
+YAML_SUFFIXES = ('.yaml', '.yml')
+
+
+class BatchJob(T.NamedTuple):
+    name: str
+    sources: T.List[pathlib.Path]
+    output: pathlib.Path
+    options: T.Dict[str, T.Any]  # The CLI flags of this job, e.g. {'compress': 'ebook', 'jobs': 4}
+
+
+class JobResult(T.NamedTuple):
+    name: str
+    output: pathlib.Path
+    ok: bool
+    seconds: float
+    error: T.Optional[str] = None
+
+
+def load_manifest(path: pathlib.Path) -> T.List[BatchJob]:
+    """
+    Read the jobs of a batch from a JSON or YAML (needs PyYAML) manifest:
+
+        defaults:                   # optional, the options of every job
+          compress: ebook
+        jobs:                       # or the list of jobs alone
+          - sources: [customer-a/]  # or a single string
+            output: customer-a.pdf
+            name: a                 # optional, the output's name by default
+            options: {keep_duplicates: true}
+
+    The relative paths are relative to the manifest's directory
+
+    :param path:
+    :return:
+    :raises ValueError: if the manifest is not valid
+    """
+    with open(path, 'r') as fp:
+        if path.suffix.lower() in YAML_SUFFIXES:
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"PyYAML is needed to read {path} (or write the manifest as JSON)")
+            manifest = yaml.safe_load(fp)
+        else:
+            manifest = json.load(fp)
+
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs'), list):
+        raise ValueError(f"{path} does not have a list of jobs")
+    defaults = manifest.get('defaults') or dict()
+    if not isinstance(defaults, dict):
+        raise ValueError(f"The defaults of {path} must be a mapping of options, not {defaults!r}")
+
+    base_dir = path.parent
+    jobs = []
+    for idx, job in enumerate(manifest['jobs']):
+        if not isinstance(job, dict) or not job.get('sources') or not job.get('output'):
+            raise ValueError(f"Job #{idx} of {path} needs its 'sources' and its 'output'")
+        sources = job['sources'] if isinstance(job['sources'], list) else [job['sources']]
+        if not all(isinstance(s, str) for s in sources) or not isinstance(job['output'], str):
+            raise ValueError(f"The 'sources' and the 'output' of job #{idx} of {path} must be paths")
+        options = job.get('options') or dict()
+        if not isinstance(options, dict):
+            raise ValueError(f"The options of job #{idx} of {path} must be a mapping, not {options!r}")
+        output = base_dir / pathlib.Path(job['output']).expanduser()
+        jobs.append(BatchJob(name=str(job.get('name', output.name)),
+                             sources=[base_dir / pathlib.Path(s).expanduser() for s in sources],
+                             output=output,
+                             options={**defaults, **options}))
+
+    names = [j.name for j in jobs]
+    repeated = sorted({n for n in names if names.count(n) > 1})
+    if repeated:
+        raise ValueError(f"Repeated job names in {path}: {repeated}")
+    return jobs
+
+
+def report_batch(results: T.Sequence[JobResult]) -> None:
+    n_failed = sum(1 for r in results if not r.ok)
+    info(f"{'job':<24}{'status':>8}{'time [s]':>10}  output")
+    for r in results:
+        line = f"{r.name:<24}{'ok' if r.ok else 'FAILED':>8}{r.seconds:>10.1f}  {r.output}"
+        if r.ok:
+            info(line)
+        else:
+            error(line + (f" ({r.error})" if r.error else ''))
+    (error if n_failed else info)(f"{len(results) - n_failed}/{len(results)} jobs succeeded"
+                                  f" in {sum(r.seconds for r in results):.1f} [s]")
+
+
+def store_summary(results: T.Sequence[JobResult], path: pathlib.Path) -> None:
+    with open(path, 'w') as fp:
+        json.dump([{**r._asdict(), 'output': str(r.output)} for r in results], fp, indent=2)
+
+
+if __name__ == '__main__':
+    import sys
+
+    for manifest_job in load_manifest(pathlib.Path(sys.argv[1])):
+        print(manifest_job)
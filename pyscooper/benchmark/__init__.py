@@ -0,0 +1,6 @@
+#! /usr/bin/env python3
+
+import pathlib
+
+BENCHMARK_DIR = pathlib.Path(__file__).parent.absolute()
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baseline.json'
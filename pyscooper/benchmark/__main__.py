@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+
+# std imports
+import sys
+import pathlib
+import argparse
+
+from pyscooper.benchmark import DEFAULT_BASELINE
+from pyscooper.benchmark.runner import (run_benchmark, compare_results, load_results, store_results,
+                                        DEFAULT_THRESHOLD)
+from pyscooper.benchmark.synthetic import TreeSpec
+from pyscooper.cli_utils import info, warning, error
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='python -m pyscooper.benchmark',
+        description="Time each phase of scooper on a synthetic input tree",
+    )
+    # One option per TreeSpec field (--n-images, --depth...)
+    for field, default in TreeSpec._field_defaults.items():
+        flag = '--' + field.replace('_', '-')
+        if isinstance(default, bool):
+            parser.add_argument(flag, type=lambda s: s.lower() in ('1', 'true', 'yes'), default=default,
+                                help=f"(default: {default})")
+        else:
+            parser.add_argument(flag, type=type(default), default=default, help=f"(default: {default})")
+
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs of the pipeline, the best time of each phase is kept",
+    )
+
+    parser.add_argument(
+        "--no-compile", action="store_true", help="Do not time compile_doc",
+    )
+
+    parser.add_argument(
+        "-o", "--output", type=pathlib.Path, default=None, help="Where to write the results (JSON)",
+    )
+
+    parser.add_argument(
+        "--baseline", type=pathlib.Path, default=DEFAULT_BASELINE, help="Results to compare against (JSON)",
+    )
+
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as the new baseline",
+    )
+
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="Relative slow-down of a phase that counts as a regression (0.1 -> 10%%)",
+    )
+
+    args = parser.parse_args()
+
+    spec = TreeSpec(**{field: getattr(args, field) for field in TreeSpec._fields})
+    results = run_benchmark(spec, repeat=args.repeat, compile_pdf=not args.no_compile)
+
+    if args.output is not None:
+        store_results(results, args.output)
+        info(f"Wrote {args.output}")
+
+    regressions = []
+    if args.save_baseline:
+        store_results(results, args.baseline)
+        info(f"Stored the new baseline {args.baseline}")
+    elif args.baseline.is_file():
+        regressions = compare_results(results, load_results(args.baseline), threshold=args.threshold)
+    else:
+        warning(f"No baseline at {args.baseline} (use --save-baseline to store one)")
+        for phase, seconds in results['phases'].items():
+            info(f"{phase:<12}{seconds if seconds is not None else '-':>14}")
+
+    if regressions:
+        error(f"Regressions (> {args.threshold:.0%}): {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import sys
+import json
+import time
+import platform
+import pathlib
+import tempfile
+import contextlib
+
+from pyscooper import deps
+from pyscooper.attachments import ext_match, iter_tex_fragments, ScoopOptions, TOCFile
+from pyscooper.benchmark.synthetic import TreeSpec, generate_tree
+from pyscooper.cache import FragmentCache
+from pyscooper.cli_utils import debug, info, warning, error
+from pyscooper.scan import scan_tree
+from pyscooper.toc_trie import build_trie, fold_trie, iter_entries
+from pyscooper.tex_utils import export_tex_doc, compile_doc
+
+RESULTS_VERSION = 1
+PHASES = ('scan', 'ext_match', 'extract', 'tex', 'compile')
+DEFAULT_THRESHOLD = 0.10  # Slower than the baseline by more than this (relative) -> regression
+MIN_REGRESSION_S = 0.05  # Phases this fast are too noisy to flag
+
+
+@contextlib.contextmanager
+def timed(timings: T.Dict[str, float], phase: str) -> T.Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def run_phases(tree_dir: pathlib.Path,
+               work_dir: pathlib.Path,
+               compile_pdf: bool = True,
+               ) -> T.Dict[str, T.Optional[float]]:
+    """
+    Run the scooper pipeline on *tree_dir* timing each phase
+
+    :param tree_dir: the input tree
+    :param work_dir: an empty directory for the LaTeX files
+    :param compile_pdf: also time compile_doc (skipped if pdflatex is missing)
+    :return: {phase: wall time [s] or None if it did not run}
+    """
+    timings = dict.fromkeys(PHASES)
+
+    with timed(timings, 'scan'):
+        filemap = scan_tree(tree_dir, filemap=dict())
+
+    file_paths = [entry.filepath for entry in iter_leaves(filemap)]
+    with timed(timings, 'ext_match'):
+        for path in file_paths:
+            ext_match(path)
+
+    with timed(timings, 'extract'):
+        entries = list(iter_entries(fold_trie(build_trie(filemap))))
+
+    link_dir = work_dir / 'links'
+    link_dir.mkdir()
+    src_tex = work_dir / 'src.tex'
+    # A fresh cache -> the fragments are really rendered
+    cache = FragmentCache(root=work_dir / 'fragments', max_bytes=sys.maxsize)
+    # Highlighted in-process (plain text without Pygments) -> the compile needs no -shell-escape
+    options = ScoopOptions(highlighter='pygments')
+    with timed(timings, 'tex'):
+        export_tex_doc(tex_body=iter_tex_fragments(entries, link_dir, cache=cache, options=options, tex_dir=work_dir),
+                       out_path=src_tex,
+                       use_pandas=deps.was_pandas_found(),
+                       use_pygments=deps.was_pygments_found(),
+                       )
+
+    if compile_pdf and deps.was_pdflatex_found():
+        with timed(timings, 'compile'):
+            pdf_path = compile_doc(src_tex, work_dir, shell_escape=False, quiet=True)
+        if pdf_path is None:
+            warning(f"Could not compile the benchmark document {src_tex}")
+    return timings
+
+
+def iter_leaves(filemap: dict) -> T.Iterator[TOCFile]:
+    stack = [filemap]
+    while stack:
+        node = stack.pop()
+        for v in node.values():
+            if isinstance(v, dict):
+                stack.append(v)
+            else:
+                yield v
+
+
+def run_benchmark(spec: TreeSpec = TreeSpec(),
+                  repeat: int = 3,
+                  compile_pdf: bool = True,
+                  ) -> dict:
+    """
+    Generate the synthetic tree described by *spec* and time the pipeline on it *repeat* times
+
+    :return: the results (JSON-serializable), with the best time of each phase
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = pathlib.Path(tmp)
+        tree_dir = tmp_dir / 'tree'
+        counts = generate_tree(tree_dir, spec)
+        debug(f"Generated {sum(counts.values())} files: {counts}")
+
+        runs = []
+        for run_idx in range(repeat):
+            work_dir = tmp_dir / f'run-{run_idx}'
+            work_dir.mkdir()
+            runs.append(run_phases(tree_dir, work_dir, compile_pdf=compile_pdf))
+
+    best = {phase: min((r[phase] for r in runs if r[phase] is not None), default=None) for phase in PHASES}
+    return {
+        'version': RESULTS_VERSION,
+        'spec': spec._asdict(),
+        'counts': counts,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'phases': best,
+        'runs': runs,
+    }
+
+
+def compare_results(results: dict,
+                    baseline: dict,
+                    threshold: float = DEFAULT_THRESHOLD,
+                    ) -> T.List[str]:
+    """
+    Print the phase timings of *results* next to the *baseline* ones
+
+    :param results: from run_benchmark
+    :param baseline: from run_benchmark (on the same spec)
+    :param threshold: relative slow-down that counts as a regression
+    :return: the phases that regressed
+    """
+    if baseline.get('spec') != results.get('spec'):
+        warning("The baseline was measured on a different tree: the comparison is not meaningful")
+
+    regressions = []
+    info(f"{'phase':<12}{'baseline [s]':>14}{'now [s]':>14}{'change':>10}")
+    for phase in PHASES:
+        prev, curr = baseline['phases'].get(phase), results['phases'].get(phase)
+        if prev is None or curr is None:
+            debug(f"{phase:<12}{prev if prev is not None else '-':>14}{curr if curr is not None else '-':>14}")
+            continue
+        change = (curr - prev) / max(prev, 1e-9)
+        line = f"{phase:<12}{prev:>14.3f}{curr:>14.3f}{change:>+10.1%}"
+        if change > threshold and curr - prev > MIN_REGRESSION_S:
+            regressions.append(phase)
+            error(line)
+        else:
+            info(line)
+    return regressions
+
+
+def load_results(path: pathlib.Path) -> dict:
+    with open(path, 'r') as fp:
+        return json.load(fp)
+
+
+def store_results(results: dict, path: pathlib.Path) -> None:
+    with open(path, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import re
+import zlib
+import base64
+import random
+import struct
+import pathlib
+import itertools
+
+from pyscooper.attachments import EXT_MAP, MINTED_EXTS, PANDAS_EXTS, ext_match
+
+# An 8x8 JPEG -> pdflatex embeds JPEGs as they are, their size barely matters
+TINY_JPEG = base64.b64decode(
+    '/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1RV19i'
+    'Z2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2Nj'
+    'Y2NjY2NjY2P/wAARCAAIAAgDASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAAAgEDAwIEAwUF'
+    'BAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6Q0RFRkdISUpTVFVW'
+    'V1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXGx8jJytLT1NXW19jZ2uHi'
+    '4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREAAgECBAQDBAcFBAQAAQJ3AAEC'
+    'AxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5OkNERUZHSElKU1RVVldYWVpjZGVm'
+    'Z2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPExcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq'
+    '8vP09fb3+Pn6/9oADAMBAAIRAxEAPwCtRRRXmHvH/9k='
+)
+
+CODE_LINES = [
+    'def f(x):',
+    '    return {"key": [x, x ** 2]}  # comment',
+    'for i in range(10): print(i, "%s" % i)',
+    'if (a && b) { c = d[0]; }',
+    'SELECT * FROM table WHERE id = 42;',
+]
+
+
+class TreeSpec(T.NamedTuple):
+    n_images: int = 20
+    n_pdfs: int = 10
+    n_logs: int = 10
+    n_csvs: int = 5
+    n_code: int = 0  # Besides one file per code extension (if all_code_exts)
+    all_code_exts: bool = True
+    depth: int = 3  # Directory levels
+    width: int = 3  # Sub-directories per directory
+    image_px: int = 256  # Side of the (noise) PNGs, pdflatex re-deflates them
+    pdf_pages: int = 2
+    log_lines: int = 2_000
+    csv_rows: int = 500
+    seed: int = 0
+
+
+def png_bytes(side: int, rng: random.Random) -> bytes:
+    """A valid RGB PNG of *side* x *side* pixels of noise (barely compressible, like a photo)"""
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    raw = b''.join(b'\x00' + rng.randbytes(side * 3) for _ in range(side))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6))
+            + chunk(b'IEND', b''))
+
+
+def pdf_bytes(n_pages: int, label: str) -> bytes:
+    """A valid PDF with *n_pages* pages that show *label* (with a correct xref table)"""
+    objs = [b'<< /Type /Catalog /Pages 2 0 R >>',
+            b'<< /Type /Pages /Kids [' + b' '.join(f'{4 + 2 * i} 0 R'.encode() for i in range(n_pages))
+            + f'] /Count {n_pages} >>'.encode(),
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+            ]
+    for i in range(n_pages):
+        stream = f'BT /F1 24 Tf 72 720 Td ({label} - page {i + 1}) Tj ET'.encode()
+        objs.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {5 + 2 * i} 0 R'
+                    f' /Resources << /Font << /F1 3 0 R >> >> >>'.encode())
+        objs.append(f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream')
+
+    out = b'%PDF-1.4\n'
+    offsets = []
+    for idx, obj in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f'{idx} 0 obj\n'.encode() + obj + b'\nendobj\n'
+    xref_offset = len(out)
+    out += f'xref\n0 {len(objs) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{o:010d} 00000 n \n'.encode() for o in offsets)
+    out += f'trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+    return out
+
+
+def concrete_name(ext_key: str, idx: int) -> str:
+    """A file name matched by the EXT_MAP pattern *ext_key* ('*.py' -> 'file3.py')"""
+    name = re.sub(r'\[(.)[^\]]*\]', r'\1', ext_key)  # [1234567] -> 1
+    return name.replace('*', f'file{idx}', 1).replace('*', 'x').replace('?', 'x')
+
+
+def iter_dirs(root: pathlib.Path, depth: int, width: int) -> T.Iterator[pathlib.Path]:
+    """Every directory of a *width*-ary tree with *depth* levels under *root* (breadth first)"""
+    level = [root]
+    for _ in range(depth + 1):
+        yield from level
+        level = [d / f'dir{i}' for d in level for i in range(width)]
+
+
+def generate_tree(root: pathlib.Path, spec: TreeSpec = TreeSpec()) -> T.Dict[str, int]:
+    """
+    Write a synthetic input tree for scooper under *root*
+
+    The files are spread round-robin over the directories of a *spec.width*-ary tree with *spec.depth* levels
+
+    :param root:
+    :param spec:
+    :return: number of files written of each kind
+    """
+    rng = random.Random(spec.seed)
+    dirs = list(iter_dirs(root, spec.depth, spec.width))
+    dir_cycle = itertools.cycle(dirs)
+    counts = dict()
+
+    def write(kind: str, name: str, data: T.Union[bytes, str]) -> None:
+        path = next(dir_cycle) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(data, str):
+            path.write_text(data)
+        else:
+            path.write_bytes(data)
+        counts[kind] = counts.get(kind, 0) + 1
+
+    for i in range(spec.n_images):
+        if i % 2:
+            write('images', f'photo{i}.jpg', TINY_JPEG)
+        else:
+            write('images', f'image{i}.png', png_bytes(spec.image_px, rng))
+
+    for i in range(spec.n_pdfs):
+        write('pdfs', f'report{i}.pdf', pdf_bytes(spec.pdf_pages, f'report {i}'))
+
+    for i in range(spec.n_logs):
+        write('logs', f'run{i}.log', ''.join(f'[{j:08d}] INFO step {rng.randrange(1000)} done\n'
+                                             for j in range(spec.log_lines)))
+
+    csv_exts = sorted(e.lstrip('*') for e in PANDAS_EXTS)
+    for i in range(spec.n_csvs):
+        ext = csv_exts[i % len(csv_exts)]
+        sep = '\t' if ext == '.tsv' else ','
+        rows = [sep.join(['id', 'name', 'value'])] + [sep.join([str(j), f'row{j}', f'{rng.random():.4f}'])
+                                                      for j in range(spec.csv_rows)]
+        write('tables', f'table{i}{ext}', '\n'.join(rows) + '\n')
+
+    code_keys = sorted(MINTED_EXTS) if spec.all_code_exts else []
+    code_keys += [k for k, _ in zip(itertools.cycle(['*.py', '*.c', '*.js', '*.sh']), range(spec.n_code))]
+    for i, ext_key in enumerate(code_keys):
+        name = concrete_name(ext_key, i)
+        if ext_match(pathlib.Path(name)) is None:
+            continue
+        write('code', name, '\n'.join(CODE_LINES * 4) + '\n')
+
+    return counts
+
+
+if __name__ == '__main__':
+    import sys
+
+    out_root = pathlib.Path(sys.argv[1] if len(sys.argv) > 1 else 'synthetic-tree')
+    print(generate_tree(out_root))
+    print(f"{len(EXT_MAP)} known extensions")
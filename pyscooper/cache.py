@@ -0,0 +1,270 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import json
+import shutil
+import hashlib
+import pathlib
+import tempfile
+
+from pyscooper import CACHE_DIR
+from pyscooper.cli_utils import debug, info
+
+FRAGMENT_CACHE_DIR = CACHE_DIR / 'fragments'
+MINTED_CACHE_DIR = CACHE_DIR / 'minted'
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3  # [bytes]
+CACHE_VERSION = 3  # Bump whenever the fragments generated for the same inputs change
+
+# Placeholders for the run-dependent paths inside the cached fragments
+LINK_TOKEN = '@@SCOOPER-LINK@@'
+ASSETS_TOKEN = '@@SCOOPER-ASSETS@@'
+
+FRAGMENT_FILENAME = 'fragment.tex'
+ASSETS_DIRNAME = 'assets'
+TOTAL_FILENAME = 'total.json'  # Running size of the fragment cache -> evict only walks it when it is too big
+
+
+def file_digest(path: T.Union[str, pathlib.Path],
+                chunk_size: int = 1024 ** 2,
+                ) -> str:
+    """SHA-256 of the contents of *path* (read in chunks)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def handler_id(fcn: T.Callable) -> str:
+    """A name that identifies a scooper across runs"""
+    return getattr(fcn, 'cache_id', f"{fcn.__module__}.{fcn.__qualname__}")
+
+
+class CachedFragment(T.NamedTuple):
+    fragment: str  # Refers to its assets through ASSETS_TOKEN
+    assets_dir: pathlib.Path
+
+
+class FragmentCache:
+    """
+    Content-addressed store of the LaTeX fragments (and derived files) generated for each attachment
+
+    The entries are keyed by (file contents, scooper, template options) and evicted least-recently-used first
+    """
+
+    def __init__(self,
+                 root: pathlib.Path = FRAGMENT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_CACHE_SIZE,
+                 options: T.Optional[T.Dict[str, T.Any]] = None,
+                 ):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.options = options or dict()
+        self.added_bytes = 0  # Stored by this instance since the last evict
+
+    def make_key(self, file: pathlib.Path, handler: str, digest: T.Optional[str] = None) -> str:
+        digest = digest or file_digest(file)
+        key_src = json.dumps([CACHE_VERSION, digest, handler, self.options], sort_keys=True, default=str)
+        return hashlib.sha256(key_src.encode('utf8')).hexdigest()
+
+    def entry_dir(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> T.Optional[CachedFragment]:
+        entry_dir = self.entry_dir(key)
+        fragment_path = entry_dir / FRAGMENT_FILENAME
+        try:
+            with open(fragment_path, 'r') as fp:
+                fragment = fp.read()
+            os.utime(fragment_path)  # Recently used
+        except OSError:
+            return None
+        return CachedFragment(fragment=fragment, assets_dir=entry_dir / ASSETS_DIRNAME)
+
+    def put(self,
+            key: str,
+            fragment: str,
+            assets: T.Iterable[pathlib.Path] = (),
+            ) -> CachedFragment:
+        """
+        Store *fragment* (and copies of the *assets* files) under *key*
+
+        References to the assets inside *fragment* should use ASSETS_TOKEN as their directory
+        """
+        entry_dir = self.entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+
+        # Build it somewhere else first -> concurrent runs never see half-written entries
+        tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=f".{key}-"))
+        (tmp_dir / ASSETS_DIRNAME).mkdir()
+        size = 0
+        for asset in assets:
+            shutil.copy2(asset, tmp_dir / ASSETS_DIRNAME / asset.name)
+            size += asset.stat().st_size
+        with open(tmp_dir / FRAGMENT_FILENAME, 'w') as fp:
+            fp.write(fragment)
+        size += (tmp_dir / FRAGMENT_FILENAME).stat().st_size
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+            self.added_bytes += size
+        except OSError:
+            # Somebody else stored it first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return CachedFragment(fragment=fragment, assets_dir=entry_dir / ASSETS_DIRNAME)
+
+    def _load_total(self) -> T.Optional[int]:
+        try:
+            with open(self.root / TOTAL_FILENAME, 'r') as fp:
+                return int(json.load(fp)['bytes'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _store_total(self, total: int) -> None:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.root / f".{TOTAL_FILENAME}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as fp:
+                json.dump({'bytes': total}, fp)
+            os.replace(tmp_path, self.root / TOTAL_FILENAME)
+        except OSError as e:
+            debug(f"Could not store the size of the fragment cache {self.root}: {e}")
+
+    def evict(self) -> int:
+        """
+        Delete the least-recently-used entries until the cache fits in *max_bytes*
+
+        The size of the cache is kept as a running total (approximate if runs share it): the entries are only
+        walked (and the total corrected) when it says the cache is too big
+
+        :return: number of bytes freed
+        """
+        total = self._load_total()
+        if total is not None and total + self.added_bytes <= self.max_bytes:
+            if self.added_bytes:
+                self._store_total(total + self.added_bytes)
+                self.added_bytes = 0
+            return 0
+
+        entries = []
+        for entry_dir in self.root.glob('*/*'):
+            if entry_dir.name.startswith('.'):
+                continue
+            try:
+                last_used = (entry_dir / FRAGMENT_FILENAME).stat().st_mtime
+                size = sum(f.stat().st_size for f in entry_dir.rglob('*') if f.is_file())
+            except OSError:
+                continue
+            entries.append((last_used, size, entry_dir))
+
+        freed = evict_lru(entries, self.max_bytes)
+        self._store_total(sum(size for _, size, _ in entries) - freed)
+        self.added_bytes = 0
+        if freed:
+            debug(f"Evicted {freed / 1e6:.2f} [Mb] from the fragment cache {self.root}")
+        return freed
+
+
+def evict_lru(entries: T.Iterable[T.Tuple[float, int, pathlib.Path]],
+              max_bytes: int,
+              ) -> int:
+    """
+    Delete the least-recently-used paths until the rest fit in *max_bytes*
+
+    :param entries: (last used, size, path)
+    :param max_bytes:
+    :return: number of bytes freed
+    """
+    entries = sorted(entries)
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in entries:
+        if total - freed <= max_bytes:
+            break
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            # Runs that share the cache may evict it at the same time
+            path.unlink(missing_ok=True)
+        freed += size
+    return freed
+
+
+class MintedCache:
+    """
+    Persistent store of minted's highlighted files (.pygtex/.pygstyle) shared by every run
+
+    minted already names them after a hash of the code, the lexer and the style, but it deletes the ones a
+    document did not use -> each compilation gets its own cache dir with links to the store, and the new files
+    are collected afterwards
+    """
+
+    def __init__(self,
+                 root: pathlib.Path = MINTED_CACHE_DIR,
+                 max_bytes: int = DEFAULT_CACHE_SIZE,
+                 ):
+        self.root = pathlib.Path(root).absolute()
+        self.max_bytes = max_bytes
+
+    def populate(self, run_cache_dir: pathlib.Path) -> int:
+        """Link every stored file into *run_cache_dir*, returns how many"""
+        run_cache_dir.mkdir(parents=True, exist_ok=True)
+        n_linked = 0
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        (run_cache_dir / entry.name).symlink_to(entry.path)
+                        n_linked += 1
+                    except FileExistsError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return n_linked
+
+    def harvest(self, run_cache_dir: pathlib.Path) -> int:
+        """Store the files that were highlighted during the run & mark the re-used ones as used, returns how many"""
+        if not run_cache_dir.is_dir():
+            return 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        n_new = 0
+        for f in run_cache_dir.iterdir():
+            stored = self.root / f.name
+            if f.is_dir():
+                continue
+            if f.is_symlink():
+                try:
+                    os.utime(stored)
+                except OSError:
+                    pass
+                continue
+            tmp_path = self.root / f".{f.name}.{os.getpid()}.tmp"
+            shutil.copy2(f, tmp_path)
+            os.replace(tmp_path, stored)
+            n_new += 1
+        return n_new
+
+    def evict(self) -> int:
+        """Delete the least-recently-used files until the store fits in *max_bytes*"""
+        entries = []
+        for f in self.root.glob('*'):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        freed = evict_lru(entries, self.max_bytes)
+        if freed:
+            debug(f"Evicted {freed / 1e6:.2f} [Mb] from the minted cache {self.root}")
+        return freed
+
+
+if __name__ == '__main__':
+    cache = FragmentCache()
+    info(f"Fragment cache at {cache.root}")
+    cache.evict()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import re
+import hashlib
+import pathlib
+import collections
+import concurrent.futures as cf
+
+from pyscooper.cli_utils import info
+
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')  # Page objects, not the /Pages tree nodes
+PDF_PAGE_OVERLAP = 32  # [bytes] kept between chunks -> no page object is missed at a boundary
+
+
+class Duplicate(T.NamedTuple):
+    original: int  # Index of the first entry with the same contents
+    original_path: pathlib.Path
+    n_bytes: int
+    n_pages: int  # Rough number of pages it would have taken
+
+
+def digest_and_pages(path: pathlib.Path,
+                     chunk_size: int = 1024 ** 2,
+                     ) -> T.Tuple[str, int]:
+    """
+    SHA-256 of the contents of *path* and its number of pages, in a single read
+
+    :return: (hex digest, number of page objects if it is a PDF, 1 otherwise)
+    """
+    is_pdf = path.suffix.lower() == '.pdf'
+    h = hashlib.sha256()
+    n_pages, tail = 0, b''
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            h.update(chunk)
+            if is_pdf:
+                window = tail + chunk
+                # Only the matches that end in the new bytes (the rest were counted already)
+                n_pages += sum(1 for m in PDF_PAGE_RE.finditer(window) if m.end() > len(tail))
+                tail = window[-PDF_PAGE_OVERLAP:]
+    return h.hexdigest(), (max(n_pages, 1) if is_pdf else 1)
+
+
+def find_duplicates(entries: T.Sequence['TOCFile'],
+                    max_workers: T.Optional[int] = None,
+                    digests: T.Optional[T.Dict[pathlib.Path, str]] = None,
+                    ) -> T.Dict[int, Duplicate]:
+    """
+    Find the *entries* whose contents are identical to an earlier one
+
+    Only the files that share their size with another one are read (and hashed, in a thread pool)
+
+    :param entries: as returned by toc_trie.iter_entries
+    :param max_workers: number of threads (ThreadPoolExecutor's default if None)
+    :param digests: gets the digests that were computed {path: digest} -> the files are not hashed again later
+    :return: {index of the duplicate: Duplicate}
+    """
+    by_size = collections.defaultdict(list)
+    for idx, entry in enumerate(entries):
+        try:
+            size = entry.filepath.stat().st_size
+        except OSError:
+            continue
+        if size:
+            by_size[size].append(idx)
+
+    candidates = sorted(idx for group in by_size.values() if len(group) > 1 for idx in group)
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        file_digests = dict(zip(candidates, pool.map(lambda i: digest_and_pages(entries[i].filepath), candidates)))
+
+    originals = dict()
+    duplicates = dict()
+    for idx in candidates:
+        digest, n_pages = file_digests[idx]
+        if digests is not None:
+            digests[entries[idx].filepath] = digest
+        original = originals.setdefault(digest, idx)
+        if original != idx:
+            duplicates[idx] = Duplicate(original=original,
+                                        original_path=entries[original].filepath,
+                                        n_bytes=entries[idx].filepath.stat().st_size,
+                                        n_pages=n_pages)
+    return duplicates
+
+
+def shift_duplicates(duplicates: T.Mapping[int, Duplicate],
+                     start: int,
+                     stop: int,
+                     ) -> T.Dict[int, Duplicate]:
+    """The *duplicates* among entries[start:stop], re-indexed from *start* (their originals keep their index)"""
+    return {idx - start: d for idx, d in duplicates.items() if start <= idx < stop}
+
+
+def report_duplicates(duplicates: T.Mapping[int, Duplicate]) -> None:
+    if not duplicates:
+        return
+    n_bytes = sum(d.n_bytes for d in duplicates.values())
+    n_pages = sum(d.n_pages for d in duplicates.values())
+    info(f"Found {len(duplicates)} duplicate files: included once, saving {n_bytes / 1e6:.2f} [Mb]"
+         f" and ~{n_pages} pages")
+
+
+if __name__ == '__main__':
+    import sys
+
+    from pyscooper.attachments import TOCFile
+
+    found = [TOCFile(filepath=pathlib.Path(p), keypath=()) for p in sys.argv[1:]]
+    for dup_idx, dup in find_duplicates(found).items():
+        print(f"{found[dup_idx].filepath} == {dup.original_path}")
@@ -2,46 +2,152 @@
 
 import typing as T
 import re
+import os
+import json
+import shutil
 import tempfile
 import pathlib
-import subprocess
+import functools
 import itertools
+import importlib.util
 
+from pyscooper import CACHE_DIR
+from pyscooper import procs
 from pyscooper.cli_utils import debug, info
 
+PROBE_CACHE_PATH = CACHE_DIR / 'deps.json'
 
+# {probe name: the command that checks the executable}
+EXECUTABLE_PROBES = {
+    'pdflatex': ['pdflatex', '-v'],
+    'gs': ['gs', '-v'],
+    'pygmentize': ['pygmentize', '-h'],
+}
+
+
+def _probe_result(p: procs.ProcResult) -> bool:
+    if p.timed_out:
+        debug(f"{p.cmd[0]} did not answer in {procs.PROBE_TIMEOUT} [s]")
+        return False
+    debug(f"{p.cmd[0]} results:"
+          f"\n\tSTDOUT:\n{p.stdout.decode('utf8', 'replace')}\n"
+          f"\n\tSTDERR:\n{p.stderr.decode('utf8', 'replace')}\n")
+    return p.ok
+
+
+def _probe_executable(cmd: T.List[str]) -> bool:
+    """Run *cmd* (e.g. `gs -v`) and report whether it succeeded"""
+    try:
+        return _probe_result(procs.run(cmd, timeout=procs.PROBE_TIMEOUT))
+    except OSError:
+        return False
+
+
+def _load_probe_cache() -> T.Dict[str, T.Dict]:
+    try:
+        with open(PROBE_CACHE_PATH, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _store_probe_cache(cache: T.Dict[str, T.Dict]) -> None:
+    try:
+        PROBE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = PROBE_CACHE_PATH.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as fp:
+            json.dump(cache, fp, indent=2, sort_keys=True)
+        os.replace(tmp_path, PROBE_CACHE_PATH)
+    except OSError as e:
+        debug(f"Could not store the dependency probes in {PROBE_CACHE_PATH}: {e}")
+
+
+def cached_probe(name: str,
+                 target: T.Optional[str],
+                 probe_fcn: T.Callable[[], bool],
+                 ) -> bool:
+    """
+    Returns the result of *probe_fcn* re-using the on-disk result if *target* has not changed since
+
+    :param name: key in the probe cache
+    :param target: path of the executable/module being probed (None -> it does not exist)
+    :param probe_fcn: the (expensive) check
+    :return: bool
+    """
+    entry = _probe_entry(target)
+    if entry is None:
+        return False
+
+    cache = _load_probe_cache()
+    cached = cache.get(name, dict())
+    if cached.get('path') == entry['path'] and cached.get('mtime') == entry['mtime']:
+        return cached['ok']
+
+    ok = probe_fcn()
+    cache[name] = {**entry, 'ok': ok}
+    _store_probe_cache(cache)
+    return ok
+
+
+def _probe_entry(target: T.Optional[str]) -> T.Optional[T.Dict[str, T.Any]]:
+    """What identifies *target* in the probe cache (None if it does not exist)"""
+    if target is None:
+        return None
+    target = os.path.realpath(target)
+    try:
+        return {'path': target, 'mtime': os.stat(target).st_mtime}
+    except OSError:
+        return None
+
+
+def prefetch_probes(names: T.Iterable[str] = tuple(EXECUTABLE_PROBES)) -> None:
+    """
+    Run the executable probes that are not in the probe cache yet concurrently, instead of one after the other
+    on first access of each was_*_found()
+
+    :param names: keys of EXECUTABLE_PROBES
+    """
+    cache = _load_probe_cache()
+    pending = dict()
+    for name in names:
+        entry = _probe_entry(shutil.which(EXECUTABLE_PROBES[name][0]))
+        cached = cache.get(name, dict())
+        if entry is not None and (cached.get('path'), cached.get('mtime')) != (entry['path'], entry['mtime']):
+            pending[name] = entry
+    if not pending:
+        return
+
+    results = procs.run_many([EXECUTABLE_PROBES[name] for name in pending], timeout=procs.PROBE_TIMEOUT)
+    for (name, entry), p in zip(pending.items(), results):
+        cache[name] = {**entry, 'ok': isinstance(p, procs.ProcResult) and _probe_result(p)}
+    _store_probe_cache(cache)
+
+
+@functools.lru_cache(maxsize=None)
 def was_pdflatex_found() -> bool:
-    p = subprocess.run(['pdflatex', '-v'], capture_output=True, check=True)
-    debug(f"Ghostscript results:"
-          f"\n\tSTDOUT:\n{p.stdout.decode('utf8')}\n"
-          f"\n\tSTDERR:\n{p.stderr.decode('utf8')}\n")
-    return p.returncode == 0
+    return cached_probe('pdflatex', shutil.which('pdflatex'),
+                        lambda: _probe_executable(EXECUTABLE_PROBES['pdflatex']))
 
 
+@functools.lru_cache(maxsize=None)
 def was_ghostscript_found() -> bool:
-    p = subprocess.run(['gs', '-v'], capture_output=True, check=True)
-    debug(f"Ghostscript results:"
-          f"\n\tSTDOUT:\n{p.stdout.decode('utf8')}\n"
-          f"\n\tSTDERR:\n{p.stderr.decode('utf8')}\n")
-    return p.returncode == 0
+    return cached_probe('gs', shutil.which('gs'), lambda: _probe_executable(EXECUTABLE_PROBES['gs']))
 
 
+@functools.lru_cache(maxsize=None)
 def was_pygmentize_found() -> bool:
     """
         # from pygments.formatters import LatexFormatter
         # print(LatexFormatter().get_style_defs())
     :return:
     """
-    p = subprocess.run(['pygmentize', '-h'], capture_output=True, check=True)
-    debug(f"Pygmentize results:"
-          f"\n\tSTDOUT:\n{p.stdout.decode('utf8')}\n"
-          f"\n\tSTDERR:\n{p.stderr.decode('utf8')}\n")
-    return p.returncode == 0
+    return cached_probe('pygmentize', shutil.which('pygmentize'),
+                        lambda: _probe_executable(EXECUTABLE_PROBES['pygmentize']))
 
 
 def get_pygmentize_lexers() -> T.Dict[str, T.Set[str]]:
     # Assumes pygmentize was found...
-    p = subprocess.run(['pygmentize', '-L', 'lexers'], capture_output=True, check=True)
+    p = procs.run(['pygmentize', '-L', 'lexers'], timeout=procs.PROBE_TIMEOUT)
     lexer_stdout = p.stdout.decode('utf8')
 
     regex_iter = re.finditer(
@@ -50,7 +156,7 @@ def get_pygmentize_lexers() -> T.Dict[str, T.Set[str]]:
         flags=re.MULTILINE,
     )
 
-    if p.returncode != 0:
+    if not p.ok:
         raise OSError("Calling pygmentize to get the lexers FAILED!")
 
     lexer_map = dict()
@@ -62,21 +168,81 @@ def get_pygmentize_lexers() -> T.Dict[str, T.Set[str]]:
     return lexer_map
 
 
-def was_pandas_found() -> bool:
+def _import_pandas() -> bool:
     try:
         import pandas as pd
         return True
-    except ModuleNotFoundError:
+    except ImportError:
+        pass
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def was_pandas_found() -> bool:
+    try:
+        spec = importlib.util.find_spec('pandas')
+    except (ImportError, ValueError):
+        spec = None
+    return cached_probe('pandas', spec.origin if spec is not None else None, _import_pandas)
+
+
+def _import_pygments() -> bool:
+    try:
+        from pygments.formatters import LatexFormatter
+        return True
+    except ImportError:
+        pass
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def was_pygments_found() -> bool:
+    """The python package (no pygmentize executable or -shell-escape required)"""
+    try:
+        spec = importlib.util.find_spec('pygments')
+    except (ImportError, ValueError):
+        spec = None
+    return cached_probe('pygments', spec.origin if spec is not None else None, _import_pygments)
+
+
+def _import_pil() -> bool:
+    try:
+        from PIL import Image, ImageOps
+        return True
+    except ImportError:
         pass
     return False
 
 
-PYGMENTIZE_OK = was_pygmentize_found()
-PANDAS_OK = was_pandas_found()
-PDFLATEX_OK = was_pdflatex_found()
-GHOSTSCRIPT_OK = was_ghostscript_found()
+@functools.lru_cache(maxsize=None)
+def was_pil_found() -> bool:
+    """Pillow, to pre-process the images"""
+    try:
+        spec = importlib.util.find_spec('PIL')
+    except (ImportError, ValueError):
+        spec = None
+    return cached_probe('PIL', spec.origin if spec is not None else None, _import_pil)
+
+
+# The old import-time flags are now computed on first access
+LAZY_FLAGS = {
+    'PYGMENTIZE_OK': was_pygmentize_found,
+    'PANDAS_OK': was_pandas_found,
+    'PDFLATEX_OK': was_pdflatex_found,
+    'GHOSTSCRIPT_OK': was_ghostscript_found,
+    'PYGMENTS_OK': was_pygments_found,
+    'PIL_OK': was_pil_found,
+}
+
+
+def __getattr__(name: str) -> bool:
+    if name in LAZY_FLAGS:
+        return LAZY_FLAGS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    prefetch_probes()
     was_pdflatex_found()
     was_ghostscript_found()
     was_pygmentize_found()
@@ -86,26 +252,24 @@ if __name__ == '__main__':
         MINTED_LEXERS = get_pygmentize_lexers()
         MINTED_EXTS = set()
         EXT2LEXER = dict()
-        if PYGMENTIZE_OK:
-            MINTED_LEXERS = get_pygmentize_lexers()
-            repeated_globs = set()
-            for lexer, exts in MINTED_LEXERS.items():
-                for ext in exts:
-                    if ext in MINTED_EXTS:
-                        repeated_globs.add(ext)
-                    else:
-                        MINTED_EXTS.add(ext)
-                        EXT2LEXER[ext] = lexer
-                        # EXT_MAP[ext] = scoop_minted_fcn(lexer)
-
-            if repeated_globs:
-                MINTED_EXTS = MINTED_EXTS.difference(repeated_globs)
-                for k in repeated_globs:
-                    EXT2LEXER.pop(k)
-            info("Unique extensions")
-            info('\n'.join([f"'{k}' : '{vs}' , " for k, vs in EXT2LEXER.items()]))
-
-            if repeated_globs:
-                debug('\n\t> '.join([f"[{len(repeated_globs)}] Non-unique extensions"] + sorted(repeated_globs)))
-                # debug('\n'.join([f"'{k}' :{vs}, " for k, vs in MINTED_LEXERS.items()
-                #                  if any(v for v in vs if v in repeated_globs)]))
+        repeated_globs = set()
+        for lexer, exts in MINTED_LEXERS.items():
+            for ext in exts:
+                if ext in MINTED_EXTS:
+                    repeated_globs.add(ext)
+                else:
+                    MINTED_EXTS.add(ext)
+                    EXT2LEXER[ext] = lexer
+                    # EXT_MAP[ext] = scoop_minted_fcn(lexer)
+
+        if repeated_globs:
+            MINTED_EXTS = MINTED_EXTS.difference(repeated_globs)
+            for k in repeated_globs:
+                EXT2LEXER.pop(k)
+        info("Unique extensions")
+        info('\n'.join([f"'{k}' : '{vs}' , " for k, vs in EXT2LEXER.items()]))
+
+        if repeated_globs:
+            debug('\n\t> '.join([f"[{len(repeated_globs)}] Non-unique extensions"] + sorted(repeated_globs)))
+            # debug('\n'.join([f"'{k}' :{vs}, " for k, vs in MINTED_LEXERS.items()
+            #                  if any(v for v in vs if v in repeated_globs)]))
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import re
+import fnmatch
+
+GLOB_CHARS = frozenset('*?[')
+# fnmatch.translate names groups of its own before Python 3.11 ('g0', 'g1'... for patterns with several '*')
+GROUP_PREFIX = '_scooper'
+
+
+class ExtMatcher:
+    """
+    Prebuilt index equivalent to trying `fnmatch.fnmatch(name.lower(), pat.lower())` for every *pat* in order
+
+        * '*.ext' patterns      -> exact suffix dict (one lookup per '.' in the name)
+        * 'makefile' patterns   -> exact name dict
+        * anything else         -> a single compiled regex with one named group per glob
+    """
+
+    def __init__(self, patterns: T.Iterable[str]):
+        self.patterns: T.List[str] = []
+        self.suffixes: T.Dict[str, int] = dict()
+        self.names: T.Dict[str, int] = dict()
+
+        globs = []
+        for idx, pat in enumerate(patterns):
+            self.patterns.append(pat)
+            l_pat = pat.lower()
+            if not GLOB_CHARS.intersection(l_pat):
+                self.names.setdefault(l_pat, idx)
+            elif l_pat.startswith('*.') and not GLOB_CHARS.intersection(l_pat[1:]):
+                self.suffixes.setdefault(l_pat[1:], idx)
+            else:
+                globs.append(f"(?P<{GROUP_PREFIX}{idx}>{fnmatch.translate(l_pat)})")
+
+        self.globs_re = re.compile('|'.join(globs)) if globs else None
+
+    def match_idx(self, l_name: str) -> T.Optional[int]:
+        """Index (in insertion order) of the first pattern that matches the lower-case *l_name*"""
+        candidates = []
+
+        idx = self.names.get(l_name)
+        if idx is not None:
+            candidates.append(idx)
+
+        dot = l_name.find('.')
+        while dot >= 0:
+            idx = self.suffixes.get(l_name[dot:])
+            if idx is not None:
+                candidates.append(idx)
+            dot = l_name.find('.', dot + 1)
+
+        if self.globs_re is not None:
+            # Alternatives are tried in order -> the group is the first matching glob
+            m = self.globs_re.match(l_name)
+            if m is not None:
+                candidates.append(int(m.lastgroup[len(GROUP_PREFIX):]))
+
+        return min(candidates) if candidates else None
+
+    def match(self, name: str) -> T.Optional[str]:
+        """Return the first pattern that matches *name* OR None"""
+        idx = self.match_idx(name.lower())
+        return None if idx is None else self.patterns[idx]
+
+
+class ExtMap(dict):
+    """
+    Plain dict of {pattern: handler} that lazily (re)builds its ExtMatcher whenever it is modified
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._matcher: T.Optional[ExtMatcher] = None
+
+    @property
+    def matcher(self) -> ExtMatcher:
+        if self._matcher is None:
+            self._matcher = ExtMatcher(self.keys())
+        return self._matcher
+
+    def _invalidate(self) -> None:
+        self._matcher = None
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._invalidate()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._invalidate()
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        self._invalidate()
+        return super().__ior__(other)
+
+    def clear(self):
+        self._invalidate()
+        super().clear()
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._invalidate()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._invalidate()
+        super().update(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    ext_map = ExtMap({'*.txt': None, 'makefile': None, 'kconfig*': None, '*.[1234567]': None})
+    for n in ['a.TXT', 'Makefile', 'Kconfig.debug', 'ls.1', 'nothing.here']:
+        print(n, '->', ext_map.matcher.match(n))
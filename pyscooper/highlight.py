@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import pathlib
+import functools
+
+# One of Pygments' built-in styles
+PYGMENTS_STYLE = 'default'
+
+
+@functools.lru_cache(maxsize=None)
+def get_formatter(style: str = PYGMENTS_STYLE):
+    from pygments.formatters import LatexFormatter
+    return LatexFormatter(style=style)
+
+
+@functools.lru_cache(maxsize=None)
+def get_lexer(lexer: str):
+    from pygments.lexers import get_lexer_by_name
+    from pygments.lexers.special import TextLexer
+    from pygments.util import ClassNotFound
+
+    try:
+        return get_lexer_by_name(lexer, stripnl=False, ensurenl=True)
+    except ClassNotFound:
+        return TextLexer()
+
+
+def style_defs(style: str = PYGMENTS_STYLE) -> str:
+    """The \\PY... macros that the highlighted Verbatim blocks use (goes in the preamble)"""
+    return get_formatter(style).get_style_defs()
+
+
+def highlight_file(file: pathlib.Path,
+                   lexer: str,
+                   style: str = PYGMENTS_STYLE,
+                   ) -> str:
+    """
+    Highlight the contents of *file* in-process with the Pygments API
+
+    :param file:
+    :param lexer: a Pygments/minted lexer name ('python', 'make'...) -> plain text if unknown
+    :param style:
+    :return: a fancyvrb Verbatim environment
+    """
+    from pygments import highlight
+
+    with open(file, 'r', errors='replace') as fp:
+        code = fp.read()
+    return highlight(code, get_lexer(lexer), get_formatter(style))
+
+
+if __name__ == '__main__':
+    print(style_defs()[:200])
+    print(highlight_file(pathlib.Path(__file__), 'python')[:500])
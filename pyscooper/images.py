@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import re
+import pathlib
+
+DEFAULT_IMAGE_DPI = 150  # Enough to print the page, far less than a phone photo
+PAGE_WIDTH_IN = 7.5  # \linewidth of the template (letter paper with 0.5in margins) [in]
+JPEG_QUALITY = 85
+PNG_TO_JPEG_MIN_BYTES = 1024 ** 2  # Smaller PNGs are cheap enough for pdflatex as they are
+EXIF_ORIENTATION_TAG = 0x0112
+UNSAFE_NAME_CHARS_RE = re.compile(r'[^A-Za-z0-9-]+')  # Spaces, #, %, _, ~, non-ASCII... break \includegraphics
+
+
+def prepared_name(src: pathlib.Path, suffix: str) -> str:
+    """A name for the copy of *src* that is safe to use in LaTeX (scooper passes links, already named safely)"""
+    return f"{UNSAFE_NAME_CHARS_RE.sub('-', src.stem) or 'image'}-scooped{suffix}"
+
+
+def max_width_px(dpi: int = DEFAULT_IMAGE_DPI) -> int:
+    return int(dpi * PAGE_WIDTH_IN)
+
+
+def prepare_image(src: pathlib.Path,
+                  dst_dir: pathlib.Path,
+                  dpi: int = DEFAULT_IMAGE_DPI,
+                  ) -> T.Optional[pathlib.Path]:
+    """
+    Write a right-sized copy of the image *src* to *dst_dir* (if it needs one)
+
+    The copy is downscaled to *dpi* at the page width, rotated as its EXIF orientation says (pdflatex ignores it)
+    and, for big PNGs without transparency, re-encoded as JPEG (pdflatex re-deflates PNGs)
+
+    :param src: its name is made safe for LaTeX (see prepared_name)
+    :param dst_dir:
+    :param dpi:
+    :return: the path to the copy or None if *src* can be used as it is
+    :raises OSError: if *src* cannot be read (e.g. truncated or not an image, see PIL.UnidentifiedImageError)
+    :raises PIL.Image.DecompressionBombError: if *src* is too big to be decoded safely
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as img:
+        is_png = img.format == 'PNG'
+        rotated = img.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        to_jpeg = is_png and not has_alpha and src.stat().st_size > PNG_TO_JPEG_MIN_BYTES
+        # Width as it ends up on the page (rotated by 90 degrees -> the height of the stored image)
+        out = ImageOps.exif_transpose(img) if rotated else img
+        too_wide = out.width > max_width_px(dpi)
+        if not (rotated or too_wide or to_jpeg):
+            return None
+
+        if too_wide:
+            out = out.resize((max_width_px(dpi), round(out.height * max_width_px(dpi) / out.width)),
+                             Image.LANCZOS)
+
+        if is_png and not to_jpeg:
+            dst = dst_dir / prepared_name(src, '.png')
+            out.save(dst, format='PNG', optimize=True)
+        else:
+            dst = dst_dir / prepared_name(src, '.jpg')
+            out.convert('RGB').save(dst, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return dst
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for arg in sys.argv[1:]:
+            print(arg, '->', prepare_image(pathlib.Path(arg), pathlib.Path(tmp)))
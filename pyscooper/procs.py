@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import time
+import signal
+import asyncio
+import pathlib
+
+PDFLATEX_TIMEOUT = 1800.0  # [s] per pass
+GS_TIMEOUT = 1800.0  # [s]
+PROBE_TIMEOUT = 30.0  # [s] e.g. `pdflatex -v`
+KILL_GRACE_S = 2.0  # SIGTERM -> SIGKILL
+DEFAULT_CONCURRENCY = os.cpu_count() or 1
+
+# Process groups of the tools running in this process -> killed too if it is terminated (see install_cleanup)
+_RUNNING_GROUPS: T.Set[int] = set()
+# Where they are also logged for other processes (see log_groups)
+_GROUPS_LOG: T.Optional[pathlib.Path] = None
+
+
+class ProcResult(T.NamedTuple):
+    cmd: T.List[str]
+    returncode: T.Optional[int]  # None if it timed out
+    stdout: bytes  # Empty if the output was not captured
+    stderr: bytes
+    timed_out: bool
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+def _track_group(pgid: int, running: bool) -> None:
+    if running:
+        _RUNNING_GROUPS.add(pgid)
+    else:
+        _RUNNING_GROUPS.discard(pgid)
+    if _GROUPS_LOG is not None:
+        with open(_GROUPS_LOG, 'a') as fp:
+            fp.write(f"{'+' if running else '-'}{pgid}\n")
+
+
+async def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    """SIGTERM (then SIGKILL) the whole process group of *proc*: its children (e.g. pygmentize) too"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            break
+        try:
+            await asyncio.wait_for(proc.wait(), KILL_GRACE_S)
+            break
+        except asyncio.TimeoutError:
+            continue
+    _track_group(proc.pid, running=False)
+
+
+async def _pump(stream: asyncio.StreamReader,
+                chunks: T.List[bytes],
+                on_line: T.Optional[T.Callable[[bytes], None]],
+                ) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        chunks.append(line)
+        if on_line is not None:
+            on_line(line)
+
+
+async def run_async(cmd: T.Sequence[str],
+                    cwd: T.Optional[pathlib.Path] = None,
+                    timeout: T.Optional[float] = None,
+                    capture: bool = True,
+                    on_line: T.Optional[T.Callable[[bytes], None]] = None,
+                    limit: T.Optional[asyncio.Semaphore] = None,
+                    ) -> ProcResult:
+    """
+    Run *cmd* in a process group of its own, killing the whole group if it times out or if the task is cancelled
+
+    :param cmd:
+    :param cwd:
+    :param timeout: [s], None -> no limit
+    :param capture: capture stdout & stderr (and close stdin -> it never waits for input). Otherwise they are
+                    inherited (e.g. to see and answer pdflatex)
+    :param on_line: called with each captured line (stdout & stderr) as soon as it is read
+    :param limit: wait for this semaphore before starting -> caps the number of concurrent processes
+    :raises OSError: if *cmd* could not be started (e.g. not found)
+    """
+    async with limit if limit is not None else _NO_LIMIT:
+        start = time.perf_counter()
+        pipe = asyncio.subprocess.PIPE if capture else None
+        proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd,
+                                                    stdin=asyncio.subprocess.DEVNULL if capture else None,
+                                                    stdout=pipe, stderr=pipe,
+                                                    start_new_session=True)
+        _track_group(proc.pid, running=True)
+        stdout, stderr = [], []
+        waits = [proc.wait()]
+        if capture:
+            waits += [_pump(proc.stdout, stdout, on_line), _pump(proc.stderr, stderr, on_line)]
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _kill_group(proc)
+        except BaseException:
+            # Cancelled (or interrupted) -> no orphaned pdflatex/gs
+            await _kill_group(proc)
+            raise
+        _track_group(proc.pid, running=False)
+        return ProcResult(cmd=list(cmd), returncode=None if timed_out else proc.returncode,
+                          stdout=b''.join(stdout), stderr=b''.join(stderr),
+                          timed_out=timed_out, seconds=time.perf_counter() - start)
+
+
+class _NoLimit:
+    """async nullcontext (python < 3.10)"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_NO_LIMIT = _NoLimit()
+
+
+def run(cmd: T.Sequence[str], **kwargs) -> ProcResult:
+    """Blocking version of run_async (for the callers that are not async)"""
+    return asyncio.run(run_async(cmd, **kwargs))
+
+
+async def run_many_async(cmds: T.Sequence[T.Sequence[str]],
+                         concurrency: int = DEFAULT_CONCURRENCY,
+                         **kwargs,
+                         ) -> T.List[T.Union[ProcResult, OSError]]:
+    """
+    Run all the *cmds* with at most *concurrency* of them at the same time
+
+    :param cmds:
+    :param concurrency:
+    :param kwargs: see run_async
+    :return: the result of each command (or the OSError if it could not be started), in order
+    """
+    limit = asyncio.Semaphore(max(concurrency, 1))
+    return await asyncio.gather(*(run_async(cmd, limit=limit, **kwargs) for cmd in cmds),
+                                return_exceptions=True)
+
+
+def run_many(cmds: T.Sequence[T.Sequence[str]], **kwargs) -> T.List[T.Union[ProcResult, OSError]]:
+    results = asyncio.run(run_many_async(cmds, **kwargs))
+    for r in results:
+        if not isinstance(r, (ProcResult, OSError)):
+            raise r
+    return results
+
+
+def _terminate(signum, frame):
+    for pgid in list(_RUNNING_GROUPS):
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    os._exit(128 + signum)
+
+
+def log_groups(path: pathlib.Path) -> None:
+    """
+    Also log the process groups of the tools started by this process (and by the workers it forks) to *path*
+
+    -> another process can kill them with kill_logged_groups, even if this one was SIGKILLed before its cleanup
+    """
+    global _GROUPS_LOG
+    _GROUPS_LOG = path
+
+
+def kill_logged_groups(path: pathlib.Path) -> None:
+    """SIGKILL the process groups in the log *path* (see log_groups) that did not finish"""
+    try:
+        lines = path.read_text().split()
+    except OSError:
+        return
+    running = set()
+    for line in lines:
+        (running.add if line[0] == '+' else running.discard)(int(line[1:]))
+    for pgid in running:
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def install_cleanup() -> None:
+    """
+    Kill the tools started by this process when it is terminated (SIGTERM)
+
+    They run in process groups of their own (so that a timeout kills their children too) -> killing the group
+    of this process (e.g. cancelling a server job) would not reach them otherwise.
+    Also used as the initializer of the worker processes.
+    """
+    signal.signal(signal.SIGTERM, _terminate)
+
+
+if __name__ == '__main__':
+    print(run(['sh', '-c', 'echo one; sleep 1; echo two'], on_line=lambda line: print('>', line.decode().rstrip())))
+    print(run(['sh', '-c', 'sleep 10 & sleep 10'], timeout=0.5))
+    for res in run_many([['sleep', '0.5']] * 4, concurrency=2):
+        print(res.cmd, res.returncode, f"{res.seconds:.2f}")
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import re
+import json
+import time
+import pathlib
+import contextlib
+import collections
+
+from pyscooper.cli_utils import debug, info
+
+if T.TYPE_CHECKING:
+    from pyscooper.attachments import TOCFile
+
+DEFAULT_TOP_N = 10
+# Written to the pdflatex log before each entry (see tex_marker) -> the TeX time of each file
+TEX_MARKER = 'SCOOPER-PROFILE'
+TEX_MARKER_RE = re.compile(TEX_MARKER + r' (?P<idx>\d+) (?P<elapsed>\d+)')
+PDF_ELAPSED_UNIT = 65536  # \pdfelapsedtime counts in 1/65536 [s]
+
+
+def cpu_time() -> float:
+    """CPU time of this process and of its (finished) children, like pdflatex [s]"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def tex_marker(idx: int) -> str:
+    """LaTeX code that logs the time elapsed since pdflatex started, tagged with *idx*"""
+    return r'\ifdefined\pdfelapsedtime\typeout{' + f'{TEX_MARKER} {idx} ' + r'\the\pdfelapsedtime}\fi' + '\n'
+
+
+def parse_tex_times(log_path: pathlib.Path) -> T.Dict[int, float]:
+    """
+    The pdflatex time spent after each marker (see tex_marker) until the next one
+
+    :param log_path:
+    :return: {marker idx: [s]}
+    """
+    try:
+        with open(log_path, 'r', errors='replace') as fp:
+            marks = [(int(m['idx']), int(m['elapsed'])) for m in TEX_MARKER_RE.finditer(fp.read())]
+    except OSError:
+        return dict()
+    return {idx: (next_elapsed - elapsed) / PDF_ELAPSED_UNIT
+            for (idx, elapsed), (_, next_elapsed) in zip(marks, marks[1:])}
+
+
+class Profiler:
+    """Wall & CPU time of each phase of a run and of each scooped file"""
+
+    def __init__(self):
+        self.phases = dict()  # {name: {'wall': [s], 'cpu': [s]}}
+        self.entries = dict()  # {path: {'ext_key', 'wall', 'cpu', 'tex'}}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> T.Iterator[None]:
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield
+        finally:
+            timing = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            timing['wall'] += time.perf_counter() - wall
+            timing['cpu'] += cpu_time() - cpu
+
+    @contextlib.contextmanager
+    def entry(self, path: pathlib.Path, ext_key: str) -> T.Iterator[None]:
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_entry(path, ext_key, wall=time.perf_counter() - wall, cpu=time.process_time() - cpu)
+
+    def add_entry(self,
+                  path: pathlib.Path,
+                  ext_key: str,
+                  wall: float = 0.0,
+                  cpu: float = 0.0,
+                  tex: T.Optional[float] = None,
+                  ) -> None:
+        """Add the times of an entry (an entry can be timed in several steps, e.g. pre-rendering + writing)"""
+        timing = self.entries.setdefault(str(path), {'ext_key': ext_key, 'wall': 0.0, 'cpu': 0.0, 'tex': None})
+        timing['wall'] += wall
+        timing['cpu'] += cpu
+        if tex is not None:
+            timing['tex'] = (timing['tex'] or 0.0) + tex
+
+    def add_tex_times(self, entries: T.Sequence['TOCFile'], log_path: pathlib.Path) -> int:
+        """Add the pdflatex time of each of *entries* from the markers in *log_path*, returns how many"""
+        tex_times = parse_tex_times(log_path)
+        for idx, seconds in tex_times.items():
+            if idx < len(entries):
+                self.add_entry(entries[idx].filepath, entries[idx].ext_key, tex=seconds)
+        return len(tex_times)
+
+    def merge(self, other: dict) -> None:
+        """Add the times in *other* (see to_dict), e.g. measured in a worker process"""
+        for name, timing in other.get('phases', dict()).items():
+            mine = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            mine['wall'] += timing['wall']
+            mine['cpu'] += timing['cpu']
+        for path, timing in other.get('entries', dict()).items():
+            self.add_entry(path, timing['ext_key'], wall=timing['wall'], cpu=timing['cpu'], tex=timing['tex'])
+
+    def to_dict(self) -> dict:
+        return {'phases': self.phases, 'entries': self.entries}
+
+    def write(self, path: pathlib.Path) -> None:
+        with open(path, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=2, sort_keys=True)
+
+    def report(self, top_n: int = DEFAULT_TOP_N) -> None:
+        """Print the phases, the slowest files and the slowest extensions"""
+        info(f"{'phase':<24}{'wall [s]':>10}{'cpu [s]':>10}")
+        for name, timing in self.phases.items():
+            info(f"{name:<24}{timing['wall']:>10.2f}{timing['cpu']:>10.2f}")
+
+        def total(timing: dict) -> float:
+            return timing['wall'] + (timing['tex'] or 0.0)
+
+        slowest = sorted(self.entries.items(), key=lambda kv: total(kv[1]), reverse=True)[:top_n]
+        if slowest:
+            info(f"Slowest {len(slowest)} files:")
+            info(f"{'scoop [s]':>10}{'cpu [s]':>10}{'tex [s]':>10}  file")
+            for path, timing in slowest:
+                tex = f"{timing['tex']:.2f}" if timing['tex'] is not None else '-'
+                debug(f"{timing['wall']:>10.2f}{timing['cpu']:>10.2f}{tex:>10}  {path}")
+
+        by_ext = collections.defaultdict(lambda: [0, 0.0])
+        for timing in self.entries.values():
+            by_ext[timing['ext_key']][0] += 1
+            by_ext[timing['ext_key']][1] += total(timing)
+        if by_ext:
+            info(f"Slowest {min(top_n, len(by_ext))} extensions:")
+            info(f"{'files':>10}{'total [s]':>10}  extension")
+            for ext_key, (n_files, seconds) in sorted(by_ext.items(), key=lambda kv: kv[1][1], reverse=True)[:top_n]:
+                debug(f"{n_files:>10}{seconds:>10.2f}  {ext_key}")
+
+
+if __name__ == '__main__':
+    profiler = Profiler()
+    with profiler.phase('sleep'):
+        time.sleep(0.1)
+    with profiler.entry(pathlib.Path(__file__), '*.py'):
+        sum(range(10 ** 6))
+    profiler.report()
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import pathlib
+import concurrent.futures as cf
+
+from pyscooper.attachments import EXT_MAP, TOCFile
+from pyscooper.cli_utils import debug
+
+
+def scan_dir(dir_path: str) -> T.Tuple[T.List[T.Tuple[str, str]], T.List[str]]:
+    """
+    List a single directory with os.scandir (the DirEntry type info avoids the extra stat calls)
+
+    :param dir_path:
+    :return: ([(name, ext_key) of the known files], names of the sub-directories)
+    """
+    matcher = EXT_MAP.matcher
+    files, subdirs = [], []
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    # Like pathlib's rglob -> do not follow symlinked directories
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        ext_key = matcher.match(entry.name)
+                        if ext_key is not None and entry.is_file():
+                            files.append((entry.name, ext_key))
+                except OSError:
+                    continue
+    except OSError as e:
+        debug(f"Could not scan {dir_path}: {e}")
+    return files, subdirs
+
+
+def prune_empty_nodes(recd: dict) -> dict:
+    """Remove (in place & iteratively) every directory node that did not end up containing any files"""
+    stack = [(recd, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            for k in [k for k, v in node.items() if isinstance(v, dict) and not v]:
+                node.pop(k)
+        else:
+            stack.append((node, True))
+            stack.extend((v, False) for v in node.values() if isinstance(v, dict))
+    return recd
+
+
+def scan_tree(top_dir: pathlib.Path,
+              filemap: T.Optional[dict] = None,
+              max_workers: T.Optional[int] = None,
+              ) -> dict:
+    """
+    Walk *top_dir* listing every sub-directory in a thread pool
+
+    Files are added to *filemap* as {dir: {subdir: {filename: TOCFile}}}, the nested
+    format that toc_trie.build_trie expects. The TOCFile carry the ext_key matched while scanning
+    (their keypath is only set by toc_trie.iter_entries)
+
+    :param top_dir:
+    :param filemap: the results are merged into it (a new dict by default)
+    :param max_workers: number of threads (ThreadPoolExecutor's default if None)
+    :return: filemap
+    """
+    filemap = filemap if filemap is not None else dict()
+
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(scan_dir, str(top_dir)): (top_dir, filemap)}
+        while pending:
+            done, _ = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                dir_path, node = pending.pop(fut)
+                files, subdirs = fut.result()
+                files = dict(files)
+                # Sorted -> the TOC does not depend on the filesystem's listing order
+                for name in sorted(files.keys() | set(subdirs)):
+                    if name not in files:
+                        child_path = dir_path / name
+                        pending[pool.submit(scan_dir, str(child_path))] = (child_path,
+                                                                           node.setdefault(name, dict()))
+                    else:
+                        node[name] = TOCFile(filepath=dir_path / name, keypath=(), ext_key=files[name])
+
+    return prune_empty_nodes(filemap)
+
+
+if __name__ == '__main__':
+    import pprint
+
+    pprint.pprint(scan_tree(pathlib.Path(__file__).parent.parent))
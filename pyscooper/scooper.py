@@ -10,8 +10,10 @@ import pathlib
 import glob
 import shutil
 import argparse
+import concurrent.futures as cf
+import contextlib
 import itertools
-import subprocess
+import time
 import tempfile
 import uuid
 
@@ -21,14 +23,31 @@ from pyscooper.attachments import (scoop,
                                    ext_match,
                                    TOCFile,
                                    EXT_MAP,
+                                   iter_tex_fragments,
+                                   prerender_fragments,
+                                   ScoopOptions,
                                    )
 from pyscooper import deps
+from pyscooper import procs
+from pyscooper.scan import scan_tree
+from pyscooper.toc_trie import build_trie, fold_trie, iter_entries, folding_fcn
+from pyscooper.sharding import compile_sharded
+from pyscooper.cache import FragmentCache, MintedCache, DEFAULT_CACHE_SIZE
+from pyscooper.text_sample import DEFAULT_TEXT_MAX_BYTES, DEFAULT_TEXT_MAX_LINES
+from pyscooper.tables import DEFAULT_TABLE_MAX_ROWS, DEFAULT_TABLE_MAX_COLS
+from pyscooper.images import DEFAULT_IMAGE_DPI
+from pyscooper.dedup import find_duplicates, report_duplicates
+from pyscooper.profiling import Profiler, DEFAULT_TOP_N
+from pyscooper.batch import load_manifest, report_batch, store_summary, JobResult
+from pyscooper.watch import take_snapshot, wait_for_change, DEFAULT_POLL_INTERVAL, DEFAULT_DEBOUNCE
 from pyscooper.cli_utils import debug, info, warning, error
 # from pyscooper.tableofcontents import build_toc_tree, build_filetree, sort_toc_maps, filemap2tocmap
-from pyscooper.tex_utils import (sanitize_tex, export_tex_doc, compile_doc, compress_doc,
+from pyscooper.tex_utils import (sanitize_tex, export_tex_doc, compile_doc, compress_doc, build_format,
                                  tex_section, tex_subsection, tex_subsubsection,
                                  TOC_HEADING_FCN_MAP,
                                  DEEPEST_TOC_LVL,
+                                 DEFAULT_MAX_PASSES,
+                                 COMPRESS_PRESETS,
                                  )
 
 
@@ -45,57 +64,10 @@ def get_search_root(entry: TOCFile, default: str = '/') -> str:
     return default
 
 
-def folding_fcn(s1: str, s2: str) -> str:
-    return f"{s1}/{s2}"
-
-
-def fold_empty_nodes(recd: dict,
-                     ) -> T.Tuple[T.Dict, bool]:
-    """
-    RECURSIVE!
-
-    :param recd:
-    :return: updated recd, helper bool)
-    """
-    # preparation
-    dks = [k for k, v in recd.items() if isinstance(v, dict)]
-    foldable = len(recd) == 1 and len(dks) == 1
-
-    for k in dks:
-        ld, lf = fold_empty_nodes(recd[k])
-
-        if lf:
-            [lk] = ld.keys()
-            recd[folding_fcn(k, lk)] = recd.pop(k).pop(lk)
-            # recd[f"{k}/{lk}"] = recd.pop(k).pop(lk)
-
-    return recd, foldable
-
-
-def extract_entries(recd,
-                    keypath=None,
-                    ) -> T.List[TOCFile]:
-    # preparation
-    keypath = keypath or []
-    vs = list(recd.values())
-
-    # Exit condition
-    if len(vs) == 1 and isinstance(vs[0], pathlib.Path):
-        return [TOCFile(filepath=vs[0], keypath=keypath, )]
-
-    res = []
-    for k, v in recd.items():
-        if isinstance(v, pathlib.Path):
-            res.append(TOCFile(filepath=v, keypath=keypath, ))
-        else:
-            res.extend(extract_entries(v, keypath=keypath + [k]))
-
-    return res
-
-
 DFEAULT_OUTPDF = pathlib.Path().cwd() / 'out.pdf'
 
-if __name__ == "__main__":
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "sources",
@@ -119,33 +91,206 @@ if __name__ == "__main__":
         "-o", "--output", type=pathlib.Path, help="Where to save the output PDF", default=DFEAULT_OUTPDF,
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of parallel worker processes (pdflatex, highlighting...)",
+    )
+
+    parser.add_argument(
+        "--shards", type=int, default=None,
+        help="Split the document into this many separately compiled parts (defaults to --jobs)",
+    )
 
-    # Check deps
-    use_minted = deps.PYGMENTIZE_OK
-    if not use_minted:
-        warning("Pygmentize was not found")
-        # warning('\n\t> '.join([f"Removing {len(MINTED_EXTS)} extensions"] + sorted(MINTED_EXTS)))
-        # VALID_EXTS = set(EXT_MAP).difference(MINTED_EXTS)
-    elif args.debug:
-        debug("Found Pygmentize!")
+    parser.add_argument(
+        "--max-passes", type=int, default=DEFAULT_MAX_PASSES,
+        help="pdflatex is re-run until the document is stable, but at most this many times",
+    )
 
-    use_pandas = deps.PANDAS_OK
-    if not use_pandas:
-        warning("Pandas not found")
-    else:
-        debug("Found Pandas")
+    parser.add_argument(
+        "--timeout", type=float, default=procs.PDFLATEX_TIMEOUT,
+        help="Stop each pdflatex pass & Ghostscript run (and what it started) after this long [s], 0 for no limit",
+    )
 
-    # Start the search
-    sources = args.sources if isinstance(args.sources, list) else [args.sources]
+    parser.add_argument(
+        "--no-precompile", action="store_true",
+        help="Do not load the LaTeX preamble from a precompiled (and cached) format file",
+    )
+
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Render (and highlight) every file again instead of re-using the results from previous runs",
+    )
+
+    parser.add_argument(
+        "--cache-size", type=float, default=DEFAULT_CACHE_SIZE / 1024 ** 2,
+        help="Maximum size of the fragment cache (and of the minted cache) [MiB]",
+    )
+
+    parser.add_argument(
+        "--highlighter", choices=['minted', 'pygments'], default='minted',
+        help="Highlight the code with minted (needs pygmentize & -shell-escape) or in-process with Pygments",
+    )
+
+    parser.add_argument(
+        "--text-max-bytes", type=int, default=DEFAULT_TEXT_MAX_BYTES,
+        help="Text files longer than this are sampled (their start & end are kept) [bytes], 0 for no limit",
+    )
+
+    parser.add_argument(
+        "--text-max-lines", type=int, default=DEFAULT_TEXT_MAX_LINES,
+        help="Text files with more lines than this are sampled, 0 for no limit",
+    )
+
+    parser.add_argument(
+        "--text-mode", choices=['inline', 'input', 'sampled-input'], default='inline',
+        help="Copy the (sampled) text files into the LaTeX source, let LaTeX read them directly"
+             " or let it read a sampled copy written next to their links",
+    )
+
+    parser.add_argument(
+        "--table-max-rows", type=int, default=DEFAULT_TABLE_MAX_ROWS,
+        help="Only the first rows of the CSV/TSV files are included, 0 for no limit",
+    )
+
+    parser.add_argument(
+        "--table-max-cols", type=int, default=DEFAULT_TABLE_MAX_COLS,
+        help="Only the first columns of the CSV/TSV files are included, 0 for no limit",
+    )
+
+    parser.add_argument(
+        "--image-dpi", type=int, default=DEFAULT_IMAGE_DPI,
+        help="Downscale (& rotate) the images for this resolution at the page width before compiling (needs Pillow)"
+             ", 0 to include them as they are",
+    )
+
+    parser.add_argument(
+        "--compress", nargs='?', choices=COMPRESS_PRESETS, const='ebook', default=None,
+        help="Compress the PDF with Ghostscript using this preset (each shard in parallel, 'ebook' if omitted)",
+    )
+
+    parser.add_argument(
+        "--keep-duplicates", action="store_true",
+        help="Include every copy of identical files instead of a reference to the first one",
+    )
+
+    parser.add_argument(
+        "--profile", nargs='?', type=pathlib.Path, const=True, default=None,
+        help="Time each phase and each file and write the report as JSON (<output>.profile.json if omitted)",
+    )
+
+    parser.add_argument(
+        "--profile-top", type=int, default=DEFAULT_TOP_N,
+        help="Number of the slowest files & extensions to print with --profile",
+    )
+
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and rebuild the PDF whenever the sources change (re-uses the unchanged shards)",
+    )
+
+    parser.add_argument(
+        "--watch-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+        help="How often to check the sources for changes with --watch [s]",
+    )
+
+    parser.add_argument(
+        "--watch-debounce", type=float, default=DEFAULT_DEBOUNCE,
+        help="Wait until the sources have not changed for this long before rebuilding with --watch [s]",
+    )
+
+    parser.add_argument(
+        "--batch", type=pathlib.Path, default=None, metavar="MANIFEST",
+        help="Build every PDF listed in this JSON/YAML manifest in a single process (see batch.load_manifest)"
+             ", the other flags are the defaults of its jobs",
+    )
+
+    parser.add_argument(
+        "--batch-summary", type=pathlib.Path, default=None,
+        help="Also write the result of each --batch job to this file (JSON)",
+    )
+
+    return parser
+
+
+def options_argv(options: T.Mapping[str, T.Any]) -> T.List[str]:
+    """
+    The command line flags for *options* given as data (e.g. {'jobs': 4, 'keep_duplicates': True})
+
+    True -> the bare flag, False/None -> left out (its default)
+    """
+    argv = []
+    for name, value in options.items():
+        flag = '--' + name.replace('_', '-')
+        if value is True:
+            argv.append(flag)
+        elif value is not None and value is not False:
+            argv.extend([flag, str(value)])
+    return argv
+
+
+def job_args(sources: T.Sequence[T.Union[str, pathlib.Path]],
+             output: T.Union[str, pathlib.Path],
+             options: T.Optional[T.Mapping[str, T.Any]] = None,
+             ) -> argparse.Namespace:
+    """
+    The command line options of a job described as data (a server request, a batch manifest entry...)
+
+    The *options* are parsed like the command line flags -> the same checks & defaults
+
+    :param sources: see the CLI
+    :param output: where to write the PDF
+    :param options: {option: value} with the names of the CLI flags
+    :return: like build_parser().parse_args()
+    :raises ValueError: if the job is not valid
+    """
+    if not sources:
+        raise ValueError("A job needs at least one source")
+    if not isinstance(sources, (list, tuple)) or not all(isinstance(s, (str, pathlib.Path)) for s in sources):
+        raise ValueError(f"The sources of a job must be a list of paths, not {sources!r}")
+    if not isinstance(output, (str, pathlib.Path)):
+        raise ValueError(f"The output of a job must be a path, not {output!r}")
+    if not isinstance(options, (T.Mapping, type(None))):
+        raise ValueError(f"The options of a job must be a mapping, not {options!r}")
+    options = dict(options or dict())
+    for name in ('output', 'watch', 'batch', 'batch_summary'):
+        if name in options:
+            raise ValueError(f"{name!r} cannot be set as an option of a job")
+
+    parser = build_parser()
+    for name, value in options.items():
+        if not isinstance(name, str) or not isinstance(value, (str, int, float, type(None))):
+            raise ValueError(f"Invalid option {name!r}: {value!r}")
+        if parser.get_default(name) is False and not isinstance(value, bool):
+            # A flag without a value (e.g. keep_duplicates)
+            raise ValueError(f"The option {name!r} must be true or false, not {value!r}")
+    try:
+        args, unknown = parser.parse_known_args(options_argv(options) + ['--'] + [str(s) for s in sources])
+    except SystemExit:
+        # argparse already printed the reason
+        raise ValueError(f"Invalid options {options}")
+    if unknown:
+        raise ValueError(f"Unknown options {unknown}")
+    args.output = pathlib.Path(output).expanduser()
+    return args
+
+
+def find_sources(sources: T.Iterable[T.Union[str, pathlib.Path]],
+                 ) -> T.Tuple[T.Dict[pathlib.Path, str], T.Set[pathlib.Path]]:
+    """
+    Split the command line *sources* into files and directories
+
+    :param sources:
+    :return: ({known file: ext_key}, directories)
+    """
     sources = [pathlib.Path(s).expanduser() for s in sources]  # For pre-expanded globs
 
     # Top-level files (can be overwritten by the glob matches)
-    top_files = {f for f in sources if f.is_file() and ext_match(f)}
+    top_files = dict()  # {path: ext_key} -> matched a single time
+    for f in sources:
+        ext_key = ext_match(f) if f.is_file() else None
+        if ext_key is not None:
+            top_files[f] = ext_key
     top_dirs = {d for d in sources if d.is_dir()}
-    other_strings = sorted(
-        map(str, set(sources).difference(top_files).difference(top_dirs))
-    )
+    # other_strings = sorted(map(str, set(sources).difference(top_files).difference(top_dirs)))
     # glob_strings = [s for s in other_strings if "*" in s]
     # other_strings = [s for s in other_strings if s not in glob_strings]
     if top_files:
@@ -173,93 +318,209 @@ if __name__ == "__main__":
     #             + other_strings
     #         )
     #     )
+    return top_files, top_dirs
+
+
+def collect_entries(top_files: T.Mapping[pathlib.Path, str],
+                    top_dirs: T.Iterable[pathlib.Path],
+                    profiler: T.Optional[Profiler] = None,
+                    ) -> T.List[TOCFile]:
+    """
+    Scan the *top_dirs* and return the entries of the table of contents, in order
+
+    :param top_files: {file: ext_key} -> top level entries
+    :param top_dirs:
+    :param profiler: gets the time of the 'scan' & 'extract' phases
+    :return:
+    """
+    profiler = profiler if profiler is not None else Profiler()
 
     # BUILD FILE DICT
 
     # Top files -> Top level
-    filemap = {f.name: f for f in top_files}
+    filemap = {f.name: TOCFile(filepath=f, keypath=(), ext_key=ext_key) for f, ext_key in top_files.items()}
 
     # Dirs and globs -> search!
-    for top_dir in top_dirs:
-        fs = (f for f in top_dir.rglob('*') if f.is_file())
-        fs = (f for f in fs if ext_match(f) is not None)
-        for f in fs:
-            relpath = f.relative_to(top_dir)
-            *ancestors, filename = relpath.parts
-            aux_dict = filemap
-            for ancestor in ancestors:
-                aux_dict = aux_dict.setdefault(ancestor, dict())
-            aux_dict[filename] = f
+    with profiler.phase('scan'):
+        for top_dir in sorted(top_dirs):
+            scan_tree(top_dir, filemap=filemap)
     # Collapse first!
 
-    filemap, _ = fold_empty_nodes(filemap)
-    if args.debug:
-        debug("Found the following files:")
-        debug(pprint.pformat(filemap))
-
-    # TODO flatten to max DEEPEST_TOC_LVL levels!
+    with profiler.phase('extract'):
+        trie = fold_trie(build_trie(filemap))
+        del filemap
+        # TODO flatten to max DEEPEST_TOC_LVL levels!
+        return list(iter_entries(trie))
 
-    entries = extract_entries(filemap)
 
-    # Don't include minted unless it is required
-    use_minted = use_minted and any(e for e in entries if e.ext_key in MINTED_EXTS)
-    use_pandas = use_pandas and any(e for e in entries if e.ext_key in PANDAS_EXTS)
+def build_pdf(entries: T.List[TOCFile],
+              args: argparse.Namespace,
+              profiler: T.Optional[Profiler] = None,
+              work_dir: T.Optional[pathlib.Path] = None,
+              pool: T.Optional[cf.ProcessPoolExecutor] = None,
+              ) -> bool:
+    """
+    Write, compile (& compress) the PDF of *entries* and (atomically) replace args.output with it
+
+    :param entries: as returned by collect_entries
+    :param args: the command line options (see build_parser)
+    :param profiler: gets the time of each phase (& of each file with args.profile)
+    :param work_dir: keep the LaTeX files there (a temporary directory by default) -> the shards that did not
+                     change since the last build are not compiled again
+    :param pool: the worker processes to use (e.g. shared by the jobs of a batch), new ones by default
+    :return: whether the PDF was written
+    """
+    profiler = profiler if profiler is not None else Profiler()
+    file_profiler = profiler if args.profile is not None else None
+    if args.debug:
+        debug("Found the following files:")
+        debug(pprint.pformat([f"{'/'.join(e.keypath)}: {e.filepath}" for e in entries]))
+
+    # Don't include minted unless it is required -> only probe the deps that the entries need
+    has_code = any(e for e in entries if e.ext_key in MINTED_EXTS)
+    use_minted, use_pygments = False, False
+    with profiler.phase('probe'):
+        # The executables that are needed are probed concurrently (the results are cached)
+        deps.prefetch_probes(name for name, needed in (('pygmentize', has_code and args.highlighter != 'pygments'),
+                                                       ('gs', args.compress is not None)) if needed)
+        if has_code and args.highlighter == 'pygments':
+            use_pygments = deps.was_pygments_found()
+            if not use_pygments:
+                warning("Pygments was not found: code files will be included as plain text")
+        elif has_code:
+            use_minted = deps.was_pygmentize_found()
+            if not use_minted:
+                warning("Pygmentize was not found: code files will be included as plain text")
+            elif args.debug:
+                debug("Found Pygmentize!")
+    # Each file is hashed once: by dedup, by the workers that pre-render it or while writing the document
+    digests = dict()
+    with profiler.phase('dedup'):
+        duplicates = dict() if args.keep_duplicates else find_duplicates(entries, digests=digests)
+    report_duplicates(duplicates)
+
+    compress = args.compress
+    with profiler.phase('probe'):
+        if compress is not None and not deps.was_ghostscript_found():
+            warning("Ghostscript was not found: the PDF will not be compressed")
+            compress = None
+
+    options = ScoopOptions(highlighter=args.highlighter,
+                           text_max_bytes=args.text_max_bytes,
+                           text_max_lines=args.text_max_lines,
+                           text_mode=args.text_mode,
+                           table_max_rows=args.table_max_rows,
+                           table_max_cols=args.table_max_cols,
+                           image_dpi=args.image_dpi,
+                           )
+
+    use_pandas = any(e for e in entries if e.ext_key in PANDAS_EXTS)
+    if use_pandas:
+        with profiler.phase('probe'):
+            use_pandas = deps.was_pandas_found()
+        if not use_pandas:
+            warning("Pandas not found: tables will be included as plain text")
+        else:
+            debug("Found Pandas")
+
+    timeout = args.timeout or None
+    cache, minted_cache = None, None
+    if not args.no_cache:
+        cache = FragmentCache(max_bytes=int(args.cache_size * 1024 ** 2),
+                              options={'use_minted': use_minted, 'use_pandas': use_pandas,
+                                       'use_pygments': use_pygments},
+                              )
+        if use_minted:
+            minted_cache = MintedCache(max_bytes=int(args.cache_size * 1024 ** 2))
 
     # Write LaTeX document
-    with tempfile.TemporaryDirectory() as tmp:
+    with (tempfile.TemporaryDirectory() if work_dir is None else contextlib.nullcontext(work_dir)) as tmp:
         tmp_dir = pathlib.Path(tmp)
         link_dir = tmp_dir / 'links'
-        link_dir.mkdir()
+        # A re-used work_dir still has the links of the previous build
+        shutil.rmtree(link_dir, ignore_errors=True)
+        link_dir.mkdir(parents=True)
 
-        # Build LaTeX source
+        if cache is None:
+            # Still needed to hand the fragments rendered in parallel to the writer
+            cache = FragmentCache(root=tmp_dir / 'fragments', max_bytes=sys.maxsize)
 
-        toc_lvl_map = {idx: idx for idx in range(DEEPEST_TOC_LVL + 1)}
-        tex_body = ""
-        curr_path = []
-        for entry in entries:
-            last_path = curr_path
-            curr_path = entry.keypath
-            toc_lvl = toc_lvl_map.get(len(entry.keypath), DEEPEST_TOC_LVL)
-
-            # TOC NESTING
-            update_map = {toc_lvl: entry.filepath.name}
-            diff_detected = False
-            for idx in range(toc_lvl):
-                last_val = last_path[idx] if idx < len(last_path) else None
-                curr_val = curr_path[idx] if idx < len(curr_path) else None
-
-                diff_detected = diff_detected or (curr_val is not None
-                                                  and curr_val != last_val)
-                if diff_detected:
-                    update_map[idx] = curr_path[idx]
-
-            for idx in sorted(update_map):
-                tex_body += TOC_HEADING_FCN_MAP[idx](update_map[idx])
-                tex_body += '\n'
-
-            # Include a LINK to the file -> avoids filename issues (like with spaces)
-            link = link_dir / f"{uuid.uuid4()}{entry.filepath.suffix.lower()}"
-            link.symlink_to(entry.filepath)
-            tex_body += scoop(link)
+        # Build LaTeX source
 
         src_tex = tmp_dir / "src.tex"
-        export_tex_doc(
-            tex_body=tex_body,
-            out_path=src_tex,
-            use_minted=use_minted,
-            use_pandas=use_pandas,
-        )
-
-        pdf_path = compile_doc(src_tex, tmp_dir)
-
-        shutil.copy(pdf_path, args.output)
+        n_shards = args.shards if args.shards is not None else args.jobs
+        if n_shards > 1:
+            pdf_path = compile_sharded(entries,
+                                       tmp_dir=tmp_dir,
+                                       n_shards=n_shards,
+                                       max_workers=args.jobs,
+                                       use_minted=use_minted,
+                                       use_pandas=use_pandas,
+                                       use_pygments=use_pygments,
+                                       cache=cache,
+                                       max_passes=args.max_passes,
+                                       precompile=not args.no_precompile,
+                                       minted_cache=minted_cache,
+                                       options=options,
+                                       compress=compress,
+                                       duplicates=duplicates,
+                                       profiler=file_profiler,
+                                       pool=pool,
+                                       timeout=timeout,
+                                       digests=digests,
+                                       )
+        else:
+            with profiler.phase('prerender'):
+                prerender_fragments([e for idx, e in enumerate(entries) if idx not in duplicates], cache,
+                                    options=options, max_workers=args.jobs, profiler=file_profiler, pool=pool,
+                                    digests=digests)
+            with profiler.phase('tex'):
+                export_tex_doc(
+                    tex_body=iter_tex_fragments(entries, link_dir, cache=cache, options=options,
+                                                duplicates=duplicates, tex_dir=tmp_dir, profiler=file_profiler,
+                                                digests=digests),
+                    out_path=src_tex,
+                    use_minted=use_minted,
+                    use_pandas=use_pandas,
+                    use_pygments=use_pygments,
+                )
+
+            with profiler.phase('compile'):
+                fmt = None if args.no_precompile else build_format(use_minted=use_minted, use_pandas=use_pandas,
+                                                                   use_pygments=use_pygments, timeout=timeout)
+                pdf_path = compile_doc(src_tex, tmp_dir, shell_escape=use_minted, max_passes=args.max_passes,
+                                       fmt=fmt, minted_cache=minted_cache, timeout=timeout)
+            if file_profiler is not None:
+                file_profiler.add_tex_times(entries, src_tex.with_suffix('.log'))
+            if pdf_path is not None and compress is not None:
+                compressed = tmp_dir / 'compressed.pdf'
+                with profiler.phase('compress'):
+                    if compress_doc(pdf_path, compressed, preset=compress, timeout=timeout):
+                        pdf_path = compressed
+
+        if cache is not None:
+            cache.evict()
+        if minted_cache is not None:
+            minted_cache.evict()
+
+        if args.profile is not None:
+            profile_path = (args.output.with_suffix('.profile.json') if args.profile is True
+                            else args.profile)
+            profiler.write(profile_path)
+            profiler.report(top_n=args.profile_top)
+            info(f"Wrote the profile to {profile_path}")
+
+        if pdf_path is None:
+            error("Could not build the PDF")
+            return False
+
+        # Copied next to the output first -> readers never see a half-written PDF
+        tmp_output = args.output.with_name(f".{args.output.name}.{os.getpid()}.tmp")
+        shutil.copy(pdf_path, tmp_output)
+        os.replace(tmp_output, args.output)
         info(f"Wrote {args.output} ({args.output.stat().st_size / 1e6:.2g} [Mb])")
 
-        # compress?
-        # if pdf_path:
-        #     compress_doc()
-
-        if args.debug:
+        if args.debug and work_dir is None:
             aux_debug_dir = pathlib.Path(tempfile.gettempdir()) / str(uuid.uuid4())
             # shutil.rmtree(aux_debug_dir, ignore_errors=True)
             shutil.copytree(tmp_dir, aux_debug_dir, symlinks=True)
@@ -270,3 +531,144 @@ if __name__ == "__main__":
         warning("It will NOT be cleaned up automatically!")
         shutil.copytree(aux_debug_dir, tmp_dir, symlinks=True)
         shutil.rmtree(aux_debug_dir, ignore_errors=True)
+    return True
+
+
+def watch_sources(top_files: T.Mapping[pathlib.Path, str],
+                  top_dirs: T.Iterable[pathlib.Path],
+                  args: argparse.Namespace,
+                  ) -> None:
+    """
+    Build the PDF and then build it again whenever the sources change (until interrupted)
+
+    The sources are polled with stat fingerprints. The scan is only repeated if files were added or removed, and
+    the LaTeX files are kept between builds -> only the changed files are rendered again (the others are in the
+    fragment cache) and, with shards, only the shards that changed are compiled again
+
+    :param top_files: see find_sources
+    :param top_dirs: see find_sources
+    :param args: see build_parser
+    """
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix='scooper-watch-'))
+    entries = collect_entries(top_files, top_dirs)
+
+    def snapshot_fcn():
+        return take_snapshot((e.filepath for e in entries), top_dirs)
+
+    snapshot = snapshot_fcn()
+    try:
+        while True:
+            try:
+                build_pdf(entries, args, profiler=Profiler(), work_dir=work_dir)
+            except Exception as e:
+                # e.g. a file removed in the middle of the build -> the next change triggers a new one
+                error(f"The build failed: {e.__class__.__name__}: {e}")
+            info(f"Watching {len(snapshot.files)} files for changes (Ctrl+C to stop)")
+            snapshot, changes = wait_for_change(snapshot_fcn, snapshot,
+                                                interval=args.watch_interval, debounce=args.watch_debounce)
+            if changes.files:
+                info("\n\t> ".join([f"[{len(changes.files)}] files changed:"] + changes.files))
+            if changes.structure:
+                info("Files were added or removed: scanning the sources again")
+                top_files = {f: ext_key for f, ext_key in top_files.items() if f.is_file()}
+                entries = collect_entries(top_files, top_dirs)
+                snapshot = snapshot_fcn()
+    except KeyboardInterrupt:
+        info("Stopped watching")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_batch(manifest_path: pathlib.Path,
+              defaults: T.Mapping[str, T.Any],
+              max_workers: T.Optional[int] = None,
+              ) -> T.List[JobResult]:
+    """
+    Build the PDFs of the jobs in a manifest one after the other, in this process
+
+    The jobs share the dependency probes, the extension matcher, the caches and a single pool of worker processes.
+    A job that fails is reported and the next one runs anyway.
+
+    :param manifest_path: see batch.load_manifest
+    :param defaults: the options of every job (the manifest can override them)
+    :param max_workers: size of the shared pool (its 'jobs' option still sets the number of shards of each job)
+    :return: the result of each job
+    """
+    jobs = load_manifest(manifest_path)
+    info(f"Running {len(jobs)} jobs from {manifest_path}")
+
+    results = []
+    pool = (cf.ProcessPoolExecutor(max_workers=max_workers, initializer=procs.install_cleanup)
+            if max_workers != 1 else None)
+    try:
+        for job_idx, job in enumerate(jobs):
+            info(f"[{job_idx + 1}/{len(jobs)}] {job.name}")
+            start = time.perf_counter()
+            try:
+                args = job_args(job.sources, job.output, {**defaults, **job.options})
+                top_files, top_dirs = find_sources(args.sources)
+                profiler = Profiler()
+                entries = collect_entries(top_files, top_dirs, profiler=profiler)
+                if not entries:
+                    raise ValueError(f"No files were found in {', '.join(map(str, job.sources))}")
+                ok, reason = build_pdf(entries, args, profiler=profiler, pool=pool), None
+            except Exception as e:
+                ok, reason = False, f"{e.__class__.__name__}: {e}"
+                error(f"Job {job.name} failed: {reason}")
+                if isinstance(e, cf.BrokenExecutor) and pool is not None:
+                    # A crashed worker takes the pool down with it -> a new one for the next jobs
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = cf.ProcessPoolExecutor(max_workers=max_workers, initializer=procs.install_cleanup)
+            results.append(JobResult(name=job.name, output=job.output, ok=ok,
+                                     seconds=time.perf_counter() - start, error=reason))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def main(argv: T.Optional[T.List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # pdflatex & gs run in process groups of their own -> not stopped with this one otherwise
+    procs.install_cleanup()
+
+    if args.batch is not None:
+        if isinstance(args.sources, list) and args.sources:
+            parser.error("The sources of a --batch are listed in its manifest")
+        if args.watch:
+            parser.error("--watch cannot be combined with --batch")
+        # The flags given on the command line -> the defaults of every job
+        defaults = {k: str(v) if isinstance(v, pathlib.Path) else v for k, v in vars(args).items()
+                    if k not in ('sources', 'output', 'batch', 'batch_summary') and v != parser.get_default(k)}
+        if isinstance(defaults.get('profile'), str):
+            # Every job would overwrite the same file
+            warning(f"Each job of a batch writes its profile next to its output (<output>.profile.json),"
+                    f" not to {defaults['profile']}")
+            defaults['profile'] = True
+        try:
+            results = run_batch(args.batch, defaults, max_workers=args.jobs)
+        except (OSError, ValueError) as e:
+            error(f"Could not run the batch {args.batch}: {e}")
+            return 1
+        report_batch(results)
+        if args.batch_summary is not None:
+            store_summary(results, args.batch_summary)
+            info(f"Wrote the summary to {args.batch_summary}")
+        return 0 if all(r.ok for r in results) else 1
+
+    sources = args.sources if isinstance(args.sources, list) else [args.sources]
+    top_files, top_dirs = find_sources(sources)
+
+    if args.watch:
+        watch_sources(top_files, top_dirs, args)
+        return 0
+
+    # The phases are always timed (it is cheap), the files only with --profile
+    profiler = Profiler()
+    entries = collect_entries(top_files, top_dirs, profiler=profiler)
+    return 0 if build_pdf(entries, args, profiler=profiler) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,431 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import shutil
+import signal
+import socket
+import pathlib
+import argparse
+import tempfile
+import threading
+import collections
+import multiprocessing as mp
+import http.server
+import socketserver
+
+from pyscooper import deps
+from pyscooper import procs
+from pyscooper.profiling import Profiler
+from pyscooper.cli_utils import debug, info, warning
+from pyscooper.scooper import job_args, find_sources, collect_entries, build_pdf
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 16
+MAX_FINISHED_JOBS = 100  # The oldest finished jobs (& their directories) are forgotten after this many
+KILL_GRACE_S = 5.0  # SIGTERM -> SIGKILL
+RETRY_AFTER_S = 10  # Suggested to the clients when the queue is full
+LOG_FILENAME = 'job.log'
+PDF_FILENAME = 'out.pdf'
+GROUPS_FILENAME = 'groups.log'  # The process groups of its pdflatex, gs... (see procs.log_groups)
+
+FINISHED = frozenset(['done', 'failed', 'cancelled'])
+
+
+def _path_inside(root: pathlib.Path, path: T.Any, what: str, allow_absolute: bool = False) -> pathlib.Path:
+    """
+    *path* (relative to *root*) as an absolute path that cannot lead out of *root* (not even through links)
+
+    :raises ValueError: if it does or if it is not a path
+    """
+    if not isinstance(path, (str, pathlib.Path)):
+        raise ValueError(f"The {what} of a job must be a path, not {path!r}")
+    path = pathlib.Path(path)
+    if (path.is_absolute() and not allow_absolute) or '..' in path.parts:
+        raise ValueError(f"The {what} of a job must be a relative path without '..', not {str(path)!r}")
+    resolved = (root / path).resolve()
+    if not resolved.is_relative_to(root.resolve()):
+        raise ValueError(f"The {what} of a job must be inside {root}, not {str(path)!r}")
+    return resolved
+
+
+def _run_job(args: argparse.Namespace, job_dir: pathlib.Path) -> None:
+    """Runs in a process of its own: its process group is killed to cancel the job (pdflatex included)"""
+    os.setpgrp()
+    procs.install_cleanup()
+    procs.log_groups(job_dir / GROUPS_FILENAME)
+    with open(job_dir / LOG_FILENAME, 'ab', buffering=0) as fp:
+        sys.stdout.flush()
+        os.dup2(fp.fileno(), sys.stdout.fileno())
+        os.dup2(fp.fileno(), sys.stderr.fileno())
+    top_files, top_dirs = find_sources(args.sources)
+    profiler = Profiler()
+    entries = collect_entries(top_files, top_dirs, profiler=profiler)
+    ok = build_pdf(entries, args, profiler=profiler, work_dir=job_dir / 'work')
+    sys.stdout.flush()
+    os._exit(0 if ok else 1)
+
+
+class Job:
+    __slots__ = ('id', 'args', 'job_dir', 'status', 'submitted', 'started', 'finished', 'process')
+
+    def __init__(self, args: argparse.Namespace, job_dir: pathlib.Path):
+        self.id = job_dir.name
+        self.args = args
+        self.job_dir = job_dir
+        self.status = 'queued'  # -> 'running' -> 'done' | 'failed' | 'cancelled'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.process = None
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'sources': [str(s) for s in self.args.sources],
+            'output': str(self.args.output),
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'returncode': self.process.exitcode if self.process is not None else None,
+        }
+
+
+class ScoopServer:
+    """
+    Runs the scoop jobs submitted to it on a bounded pool of workers
+
+    Each job gets a temporary directory and runs in a process forked from a warm server (modules imported, EXT_MAP
+    built, dependencies probed) -> cancelling a job kills its whole process group
+
+    The clients can only read the sources inside *source_root* and only write their PDF inside *output_root* (or
+    the job's directory if None)
+    """
+
+    def __init__(self,
+                 root: pathlib.Path,
+                 n_workers: int = DEFAULT_WORKERS,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 source_root: T.Optional[pathlib.Path] = None,
+                 output_root: T.Optional[pathlib.Path] = None,
+                 ):
+        self.root = root
+        self.source_root = pathlib.Path(source_root if source_root is not None else os.getcwd()).absolute()
+        self.output_root = pathlib.Path(output_root).absolute() if output_root is not None else None
+        self.n_workers = n_workers
+        self.max_queue = max_queue
+        self.jobs: T.Dict[str, Job] = collections.OrderedDict()
+        self.lock = threading.Lock()
+        # Not a queue.Queue: a cancelled job must give its place back right away
+        self.pending: T.Deque[Job] = collections.deque()
+        self.job_ready = threading.Condition(self.lock)
+        self.stopping = False
+        # No threads are forked: the jobs are forked from a single-threaded server process
+        self.mp_context = mp.get_context('forkserver')
+        self.mp_context.set_forkserver_preload(['pyscooper.scooper'])
+        self.workers = [threading.Thread(target=self._work, name=f'scoop-worker-{idx}', daemon=True)
+                        for idx in range(n_workers)]
+
+    def start(self) -> None:
+        # Probed once here -> the jobs read the results from the probe cache
+        deps.prefetch_probes()
+        for probe in deps.LAZY_FLAGS.values():
+            probe()
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self) -> None:
+        with self.lock:
+            jobs = [j for j in self.jobs.values() if j.status not in FINISHED]
+        for job in jobs:
+            self.cancel(job.id)
+        with self.lock:
+            self.stopping = True
+            self.job_ready.notify_all()
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, request: dict) -> Job:
+        """
+        Queue the job described by *request*: {'sources': [...], 'output': path (optional), 'options': {...}}
+
+        The sources are relative to source_root (or absolute paths inside it), the output is relative to output_root
+        (or to the job's directory)
+
+        :raises ValueError: if the request is not valid
+        :raises queue.Full: if there are already max_queue jobs waiting
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A job must be a JSON object")
+        job_dir = self.root / uuid.uuid4().hex
+        sources = request.get('sources') or []
+        if not isinstance(sources, list):
+            raise ValueError(f"The sources of a job must be a list of paths, not {sources!r}")
+        sources = [_path_inside(self.source_root, s, 'sources', allow_absolute=True) for s in sources]
+        output = request.get('output') or PDF_FILENAME
+        output = _path_inside(self.output_root or job_dir, output, 'output')
+        options = request.get('options')
+        if isinstance(options, dict) and not isinstance(options.get('profile'), (bool, type(None))):
+            # A path -> it could be written anywhere
+            raise ValueError("The 'profile' option of a job can only be true (written next to its output)")
+        args = job_args(sources, output, options)
+        job = Job(args, job_dir)
+        with self.lock:
+            if len(self.pending) >= self.max_queue:
+                raise queue.Full
+            job_dir.mkdir(parents=True)
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            self.pending.append(job)
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+            self.job_ready.notify()
+        info(f"Queued job {job.id}: {' '.join(map(str, args.sources))} -> {args.output}")
+        return job
+
+    def get(self, job_id: str) -> T.Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> T.Optional[Job]:
+        """Cancel a queued or running job (a finished one is left as it is)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            if job.status == 'queued':
+                self.pending.remove(job)
+            job.status = 'cancelled'
+            job.finished = time.time()
+            process = job.process
+        if process is not None:
+            self._kill(process, job.job_dir)
+        info(f"Cancelled job {job.id}")
+        return job
+
+    def stats(self) -> dict:
+        with self.lock:
+            counts = collections.Counter(j.status for j in self.jobs.values())
+        return {'workers': self.n_workers, 'max_queue': self.max_queue, 'jobs': dict(counts)}
+
+    def _work(self) -> None:
+        while True:
+            with self.lock:
+                while not self.pending and not self.stopping:
+                    self.job_ready.wait()
+                if self.stopping:
+                    return
+                job = self.pending.popleft()
+                job.status = 'running'
+                job.started = time.time()
+                job.process = self.mp_context.Process(target=_run_job, args=(job.args, job.job_dir))
+                job.process.start()
+            job.process.join()
+            with self.lock:
+                if job.status == 'running':
+                    job.status = 'done' if job.process.exitcode == 0 else 'failed'
+                    job.finished = time.time()
+            (info if job.status == 'done' else warning)(
+                f"Job {job.id} {job.status} in {job.finished - job.started:.1f} [s]")
+            # Only the PDF & the log are kept
+            shutil.rmtree(job.job_dir / 'work', ignore_errors=True)
+
+    @staticmethod
+    def _kill(process: mp.Process, job_dir: pathlib.Path) -> None:
+        for sig, kill_process in ((signal.SIGTERM, process.terminate), (signal.SIGKILL, process.kill)):
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                # Cancelled before it called setpgrp (or already gone) -> it has no group (nor children) yet
+                kill_process()
+            except PermissionError:
+                break
+            process.join(KILL_GRACE_S)
+            if process.exitcode is not None:
+                break
+        # pdflatex & co. run in process groups of their own: only stopped by the job's cleanup, which a SIGKILL skips
+        procs.kill_logged_groups(job_dir / GROUPS_FILENAME)
+
+    def _forget_old_jobs(self) -> None:
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            self.jobs.pop(job.id)
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+
+
+class ScoopRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    POST   /jobs           {"sources": [...], "output": "...", "options": {"jobs": 2, ...}} -> 202 the job
+                           (503 + Retry-After if the queue is full, 400 if a path leads out of the server's roots)
+    GET    /jobs           all the jobs
+    GET    /jobs/<id>      the job
+    GET    /jobs/<id>/log  its output
+    GET    /jobs/<id>/pdf  its PDF (if no output was given)
+    DELETE /jobs/<id>      cancel it
+    GET    /health         number of jobs per status
+    """
+    server: 'ScoopHTTPServer'
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['health']:
+            return self._send_json(200, self.server.scoop.stats())
+        if parts == ['jobs']:
+            with self.server.scoop.lock:
+                jobs = [j.to_dict() for j in self.server.scoop.jobs.values()]
+            return self._send_json(200, jobs)
+        job = self._get_job(parts)
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self._send_json(200, job.to_dict())
+        if parts[2] == 'log':
+            return self._send_file(job.job_dir / LOG_FILENAME, 'text/plain; charset=utf-8')
+        if parts[2] == 'pdf':
+            if job.status != 'done':
+                return self._send_json(409, {'error': f"Job {job.id} is {job.status}"})
+            return self._send_file(job.args.output, 'application/pdf')
+        self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path.strip('/') != 'jobs':
+            return self._send_json(404, {'error': f"Unknown path {self.path}"})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.scoop.submit(request)
+        except ValueError as e:
+            return self._send_json(400, {'error': str(e)})
+        except queue.Full:
+            return self._send_json(503, {'error': "Too many queued jobs, try again later"},
+                                   headers={'Retry-After': str(RETRY_AFTER_S)})
+        self._send_json(202, job.to_dict())
+
+    def do_DELETE(self):
+        parts = self.path.strip('/').split('/')
+        job = self._get_job(parts)
+        if job is None:
+            return
+        if len(parts) != 2:
+            return self._send_json(404, {'error': f"Unknown path {self.path}"})
+        self._send_json(200, self.server.scoop.cancel(job.id).to_dict())
+
+    def _get_job(self, parts: T.List[str]) -> T.Optional[Job]:
+        job = self.server.scoop.get(parts[1]) if len(parts) in (2, 3) and parts[0] == 'jobs' else None
+        if job is None:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+        return job
+
+    def _send_json(self, code: int, body: T.Any, headers: T.Optional[T.Mapping[str, str]] = None) -> None:
+        data = json.dumps(body, indent=2).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_file(self, path: pathlib.Path, content_type: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            fp = open(path, 'rb')
+        except OSError:
+            return self._send_json(404, {'error': f"{path} does not exist"})
+        with fp:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            shutil.copyfileobj(fp, self.wfile)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+    def log_message(self, format: str, *args) -> None:
+        debug(f"{self.address_string()} {format % args}")
+
+
+class ScoopHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scoop: ScoopServer):
+        self.scoop = scoop
+        super().__init__(address, ScoopRequestHandler)
+
+
+class ScoopUnixHTTPServer(ScoopHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(scoop: ScoopServer,
+          host: str = '127.0.0.1',
+          port: int = DEFAULT_PORT,
+          unix_socket: T.Optional[pathlib.Path] = None,
+          ) -> None:
+    """Run *scoop* behind an HTTP API on *host*:*port* (or on *unix_socket*) until interrupted (SIGINT/SIGTERM)"""
+    if unix_socket is not None:
+        unix_socket.unlink(missing_ok=True)
+        httpd = ScoopUnixHTTPServer(str(unix_socket), scoop)
+        # Only its owner can submit jobs
+        os.chmod(unix_socket, 0o600)
+        where = str(unix_socket)
+    else:
+        httpd = ScoopHTTPServer((host, port), scoop)
+        where = f"http://{host}:{httpd.server_port}"
+
+    # Stopped like Ctrl+C by a service manager too
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    scoop.start()
+    info(f"Serving scoop jobs on {where} with {scoop.n_workers} workers (Ctrl+C to stop)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        info("Stopping the server")
+    finally:
+        httpd.server_close()
+        scoop.stop()
+        if unix_socket is not None:
+            unix_socket.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='python -m pyscooper.server',
+        description="Keep scooper warm and run the jobs submitted over a local HTTP API",
+    )
+    parser.add_argument("--host", default='127.0.0.1', help="Only bind to other interfaces on trusted networks")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", type=pathlib.Path, default=None, help="Listen on this socket instead")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Jobs that run at the same time")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="Jobs that can wait for a worker, more are rejected (HTTP 503)")
+    parser.add_argument("--source-root", type=pathlib.Path, default=None,
+                        help="The jobs can only scoop the files in here (the current directory by default)")
+    parser.add_argument("--output-root", type=pathlib.Path, default=None,
+                        help="The jobs write their PDFs in here (in their temporary directories by default)")
+    args = parser.parse_args()
+
+    # From the module (not __main__) -> the job processes can find _run_job
+    from pyscooper import server
+
+    with tempfile.TemporaryDirectory(prefix='scooper-server-') as tmp:
+        server.serve(server.ScoopServer(pathlib.Path(tmp), n_workers=args.workers, max_queue=args.max_queue,
+                                        source_root=args.source_root, output_root=args.output_root),
+                     host=args.host, port=args.port, unix_socket=args.unix_socket)
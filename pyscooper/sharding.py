@@ -0,0 +1,351 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import re
+import os
+import json
+import time
+import contextlib
+import shutil
+import itertools
+import pathlib
+import concurrent.futures as cf
+
+from pyscooper import procs
+from pyscooper.cache import FragmentCache, MintedCache, file_digest
+from pyscooper.dedup import Duplicate, shift_duplicates
+from pyscooper.profiling import Profiler
+from pyscooper.attachments import (TOCFile, MINTED_EXTS, PANDAS_EXTS, ScoopOptions, DEFAULT_OPTIONS,
+                                   iter_tex_fragments, sanitize_path)
+from pyscooper.cli_utils import debug, info, warning, error
+from pyscooper.tex_utils import export_tex_doc, compile_doc, compress_doc, build_format, DEFAULT_MAX_PASSES
+
+# Rough pdflatex cost of each file type: (fixed cost, cost per MB)
+EXT_COSTS = {
+    '*.pdf': (2.0, 1.0),
+    '*.jpg': (1.0, 0.5),
+    '*.jpeg': (1.0, 0.5),
+    '*.png': (1.0, 2.0),  # pdflatex has to re-deflate PNGs
+    '*.txt': (0.5, 5.0),
+    '*.log': (0.5, 5.0),
+}
+MINTED_COST = (3.0, 20.0)  # One pygmentize call per file
+PANDAS_COST = (1.0, 10.0)
+DEFAULT_COST = (1.0, 1.0)
+
+TOC_LINE_RE = re.compile(r'\\contentsline \{(?P<level>\w+)\}'
+                         r'\{\\numberline \{(?P<number>[^{}]*)\}\{(?P<title>.*?)\}\}'
+                         r'\{(?P<page>\d+)\}')
+PROFILE_FILENAME = 'profile.json'
+STAMP_FILENAME = 'src.stamp'  # What the shard PDF was built from (see compile_shard)
+PAGE_COUNT_RE = re.compile(r'Output written on .*?\((?P<n_pages>\d+) pages?')
+
+
+class TOCLine(T.NamedTuple):
+    level: str  # section, subsection...
+    number: str
+    title: str
+    page: int
+
+
+class Shard(T.NamedTuple):
+    idx: int
+    entries: T.List[TOCFile]
+    section_offset: int  # Number of sections in the previous shards
+
+
+class ShardResult(T.NamedTuple):
+    pdf_path: T.Optional[pathlib.Path]  # None if it failed
+    toc_lines: T.List[TOCLine]
+    n_pages: int
+    cached_bytes: int  # Added to the fragment cache by the worker (its copy of it -> the parent has to count them)
+
+
+def estimate_cost(entry: TOCFile) -> float:
+    """Guess how long pdflatex will spend on *entry* from its extension and size"""
+    if entry.ext_key in EXT_COSTS:
+        fixed, per_mb = EXT_COSTS[entry.ext_key]
+    elif entry.ext_key in MINTED_EXTS:
+        fixed, per_mb = MINTED_COST
+    elif entry.ext_key in PANDAS_EXTS:
+        fixed, per_mb = PANDAS_COST
+    else:
+        fixed, per_mb = DEFAULT_COST
+
+    try:
+        size_mb = entry.filepath.stat().st_size / 1e6
+    except OSError:
+        size_mb = 0.0
+    return fixed + per_mb * size_mb
+
+
+def section_key(entry: TOCFile) -> T.Any:
+    """Entries with the same key are part of the same (top-level) section"""
+    return entry.keypath[0] if entry.keypath else entry
+
+
+def split_entries(entries: T.List[TOCFile],
+                  n_shards: int,
+                  ) -> T.List[Shard]:
+    """
+    Split *entries* into (at most) *n_shards* consecutive shards with a similar cost. Sections are never split.
+
+    :param entries: as returned by toc_trie.iter_entries
+    :param n_shards:
+    :return:
+    """
+    sections = [list(g) for _, g in itertools.groupby(entries, key=section_key)]
+    costs = [sum(map(estimate_cost, s)) for s in sections]
+
+    shards = []
+    curr, curr_cost, curr_sections, n_sections = [], 0.0, 0, 0
+    remaining_cost = sum(costs)
+    for section, cost in zip(sections, costs):
+        remaining_shards = n_shards - len(shards)
+        target = remaining_cost / max(remaining_shards, 1)
+        # Close the current shard when adding this section would overshoot the target by more than it falls short
+        if curr and remaining_shards > 1 and curr_cost + cost / 2 > target:
+            shards.append(Shard(idx=len(shards), entries=curr, section_offset=n_sections))
+            n_sections += curr_sections
+            remaining_cost -= curr_cost
+            curr, curr_cost, curr_sections = [], 0.0, 0
+        curr.extend(section)
+        curr_cost += cost
+        curr_sections += 1
+
+    if curr:
+        shards.append(Shard(idx=len(shards), entries=curr, section_offset=n_sections))
+    return shards
+
+
+def parse_toc_lines(aux_path: pathlib.Path) -> T.List[TOCLine]:
+    """Return the table of contents entries written to the .aux file by \\addcontentsline"""
+    with open(aux_path, 'r', errors='replace') as fp:
+        return [TOCLine(level=m['level'], number=m['number'], title=m['title'], page=int(m['page']))
+                for m in TOC_LINE_RE.finditer(fp.read())]
+
+
+def parse_page_count(log_path: pathlib.Path) -> int:
+    """Number of pages in the PDF according to the pdflatex log"""
+    with open(log_path, 'r', errors='replace') as fp:
+        # pdflatex wraps the log lines at 79 chars
+        m = PAGE_COUNT_RE.search(fp.read().replace('\n', ''))
+    return int(m['n_pages']) if m else 0
+
+
+def compile_shard(shard: Shard,
+                  shard_dir: pathlib.Path,
+                  use_minted: bool = False,
+                  use_pandas: bool = False,
+                  use_pygments: bool = False,
+                  cache: T.Optional[FragmentCache] = None,
+                  fmt: T.Optional[pathlib.Path] = None,
+                  minted_cache: T.Optional[MintedCache] = None,
+                  options: ScoopOptions = DEFAULT_OPTIONS,
+                  compress: T.Optional[str] = None,
+                  duplicates: T.Optional[T.Mapping[int, Duplicate]] = None,
+                  profile: bool = False,
+                  timeout: T.Optional[float] = procs.PDFLATEX_TIMEOUT,
+                  digests: T.Optional[T.Mapping[pathlib.Path, str]] = None,
+                  ) -> ShardResult:
+    """
+    Write & compile the body pages of *shard* in *shard_dir* (runs in a worker process)
+
+    With *compress* (a preset for compress_doc), the shard PDF is also compressed -> the merge only copies its pages
+
+    The *duplicates* (indexed within the shard) are referenced without a page: the shard does not know the final ones
+
+    With *profile*, the timings of the shard are written to PROFILE_FILENAME in *shard_dir* (see Profiler.merge)
+
+    If *shard_dir* is re-used (e.g. by watch mode) and the shard's LaTeX source did not change, the previous PDF is
+    kept instead of compiling it again
+
+    *timeout* [s] applies to each pdflatex and Ghostscript run (None -> no limit), see procs.run
+
+    *digests* are those of the entries hashed already (see iter_tex_fragments)
+
+    :return:
+    """
+    cached_bytes = cache.added_bytes if cache is not None else 0
+    link_dir = shard_dir / 'links'
+    shutil.rmtree(link_dir, ignore_errors=True)
+    link_dir.mkdir(parents=True)
+    stamp_path = shard_dir / STAMP_FILENAME
+    try:
+        prev_stamp = stamp_path.read_text()
+        stamp_path.unlink()
+    except OSError:
+        prev_stamp = None
+
+    profiler = Profiler()
+    src_tex = shard_dir / 'src.tex'
+    with profiler.phase('shards: tex'):
+        export_tex_doc(
+            tex_body=itertools.chain([r'\setcounter{section}{' + str(shard.section_offset) + '}\n'],
+                                     iter_tex_fragments(shard.entries, link_dir, cache=cache, options=options,
+                                                        duplicates=duplicates, ref_pages=False, tex_dir=shard_dir,
+                                                        profiler=profiler if profile else None,
+                                                        digests=digests)),
+            out_path=src_tex,
+            use_minted=use_minted,
+            use_pandas=use_pandas,
+            shard=True,
+            use_pygments=use_pygments,
+        )
+
+    cached_bytes = cache.added_bytes - cached_bytes if cache is not None else 0
+
+    stamp = f"{file_digest(src_tex)} {compress}"
+    pdf_path = shard_dir / 'src.pdf'
+    compressed = shard_dir / 'src-compressed.pdf'
+    if stamp == prev_stamp and pdf_path.is_file():
+        debug(f"Shard {shard.idx} did not change: re-using {pdf_path}")
+        pdf_path = compressed if compressed.is_file() else pdf_path
+        n_pages = parse_page_count(src_tex.with_suffix('.log'))
+    else:
+        compressed.unlink(missing_ok=True)
+        # No references to resolve -> a single pass is enough
+        with profiler.phase('shards: compile'):
+            pdf_path = compile_doc(src_tex, shard_dir, shell_escape=use_minted, max_passes=1, quiet=True,
+                                   fmt=fmt, minted_cache=minted_cache, timeout=timeout)
+        n_pages = parse_page_count(src_tex.with_suffix('.log')) if pdf_path is not None else 0
+        if n_pages == 0:
+            return ShardResult(pdf_path=None, toc_lines=[], n_pages=0, cached_bytes=cached_bytes)
+        if compress is not None:
+            with profiler.phase('shards: compress'):
+                if compress_doc(pdf_path, compressed, preset=compress, quiet=True, timeout=timeout):
+                    pdf_path = compressed
+        stamp_path.write_text(stamp)
+    if profile:
+        profiler.add_tex_times(shard.entries, src_tex.with_suffix('.log'))
+        profiler.write(shard_dir / PROFILE_FILENAME)
+    return ShardResult(pdf_path=pdf_path, toc_lines=parse_toc_lines(src_tex.with_suffix('.aux')), n_pages=n_pages,
+                       cached_bytes=cached_bytes)
+
+
+def iter_merge_fragments(pdf_path: pathlib.Path,
+                         toc_lines: T.List[TOCLine],
+                         n_pages: int,
+                         ) -> T.Iterator[str]:
+    """
+    Yields the \\includepdf commands that insert the pages of a shard in the final document
+
+    The pages that start a TOC entry are included on their own so that the entry (and its hyperlink) can be added
+    from their pagecommand. The headers & footers are drawn by the final document -> continuous page numbers.
+
+    *pdf_path* is written as given (relative to the merge document's directory, where it is compiled)
+    """
+    pdf_str = sanitize_path(pdf_path)
+    entries_by_page = {p: list(ls) for p, ls in itertools.groupby(toc_lines, key=lambda line: line.page)}
+    starts = sorted(set(entries_by_page).union({1}))
+
+    for start, end in zip(starts, starts[1:] + [n_pages + 1]):
+        page_cmds = ''
+        for line in entries_by_page.get(start, []):
+            if line.level == 'section':
+                # Global & from the pagecommand -> only the pages from this one on get the new header
+                page_cmds += r'\gdef\sectiontitle{' + line.title + '}'
+            page_cmds += (r'\phantomsection\addcontentsline{toc}{' + line.level + r'}'
+                          r'{\protect\numberline{' + line.number + '}{' + line.title + '}}')
+        yield r'\includepdf[pages={' + str(start) + r'},pagecommand={' + page_cmds + r'}]{' + pdf_str + '}\n'
+        if end - start > 1:
+            yield r'\includepdf[pages={' + f"{start + 1}-{end - 1}" + r'},pagecommand={}]{' + pdf_str + '}\n'
+
+
+def compile_sharded(entries: T.List[TOCFile],
+                    tmp_dir: pathlib.Path,
+                    n_shards: int,
+                    max_workers: T.Optional[int] = None,
+                    use_minted: bool = False,
+                    use_pandas: bool = False,
+                    use_pygments: bool = False,
+                    cache: T.Optional[FragmentCache] = None,
+                    max_passes: int = DEFAULT_MAX_PASSES,
+                    precompile: bool = True,
+                    minted_cache: T.Optional[MintedCache] = None,
+                    options: ScoopOptions = DEFAULT_OPTIONS,
+                    compress: T.Optional[str] = None,
+                    duplicates: T.Optional[T.Mapping[int, Duplicate]] = None,
+                    profiler: T.Optional[Profiler] = None,
+                    pool: T.Optional[cf.ProcessPoolExecutor] = None,
+                    timeout: T.Optional[float] = procs.PDFLATEX_TIMEOUT,
+                    digests: T.Optional[T.Mapping[pathlib.Path, str]] = None,
+                    ) -> T.Optional[pathlib.Path]:
+    """
+    Compile the shards of *entries* in parallel and merge them (with a single table of contents) into one PDF
+
+    :param entries: as returned by toc_trie.iter_entries
+    :param tmp_dir: each shard gets its own sub-directory
+    :param n_shards:
+    :param max_workers: number of parallel pdflatex processes
+    :param use_minted:
+    :param use_pandas:
+    :param use_pygments: the code is highlighted with the Pygments package (it was found)
+    :param cache: see iter_tex_fragments
+    :param max_passes: for the final document (the shards only need one)
+    :param precompile: load the preamble from a precompiled format (see build_format)
+    :param minted_cache: see compile_doc
+    :param options: see ScoopOptions
+    :param compress: compress the shards with this compress_doc preset before merging them
+    :param duplicates: as returned by dedup.find_duplicates for *entries*
+    :param profiler: gets the timings of the shards (phases summed over the workers) and of the final compilation
+    :param pool: compile the shards on these worker processes instead of starting *max_workers* new ones
+                 (started with procs.install_cleanup as initializer -> terminating them stops their pdflatex)
+    :param timeout: for each pdflatex & Ghostscript run [s] (None -> no limit)
+    :param digests: {path: digest} of the entries hashed already (e.g. by dedup)
+    :return: the path to the merged PDF or None if the compilation failed
+    """
+    shards = split_entries(entries, n_shards)
+    info(f"Compiling {len(entries)} entries in {len(shards)} shards"
+         f" ({', '.join(str(len(s.entries)) for s in shards)})")
+
+    digests = digests or dict()
+    # Built once, before the workers need it
+    shard_fmt = (build_format(use_minted=use_minted, use_pandas=use_pandas, use_pygments=use_pygments,
+                              timeout=timeout)
+                 if precompile else None)
+
+    start = time.perf_counter()
+    with (contextlib.nullcontext(pool) if pool is not None
+          else cf.ProcessPoolExecutor(max_workers=max_workers, initializer=procs.install_cleanup)) as pool:
+        futures = [pool.submit(compile_shard, s, tmp_dir / f'shard-{s.idx:04d}', use_minted, use_pandas,
+                               use_pygments, cache, shard_fmt, minted_cache, options, compress,
+                               shift_duplicates(duplicates or dict(), start, start + len(s.entries)),
+                               profiler is not None, timeout,
+                               {e.filepath: digests[e.filepath] for e in s.entries if e.filepath in digests})
+                   for s, start in zip(shards, itertools.accumulate([0] + [len(s.entries) for s in shards]))]
+        results = [f.result() for f in futures]
+    if cache is not None:
+        cache.added_bytes += sum(r.cached_bytes for r in results)
+    compile_time = time.perf_counter() - start
+    if profiler is not None:
+        for s in shards:
+            profile_path = tmp_dir / f'shard-{s.idx:04d}' / PROFILE_FILENAME
+            if profile_path.is_file():
+                with open(profile_path, 'r') as fp:
+                    profiler.merge(json.load(fp))
+
+    failed = [s.idx for s, r in zip(shards, results) if r.pdf_path is None]
+    if failed:
+        error(f"{len(failed)} shards failed to compile: {failed}")
+        return None
+
+    if compress is not None:
+        prev_size = sum((r.pdf_path.parent / 'src.pdf').stat().st_size for r in results) / 1e6
+        post_size = sum(r.pdf_path.stat().st_size for r in results) / 1e6
+        info(f"Compressed the shards ({compress}): {prev_size:.2f} -> {post_size:.2f} [Mb]"
+             f" ({(post_size - prev_size) / max(prev_size, 1e-9):+.1%}), compiled & compressed in {compile_time:.1f} [s]")
+
+    merge_tex = tmp_dir / 'src.tex'
+    export_tex_doc(
+        # Relative to the merge document -> the same shards give the same document
+        tex_body=itertools.chain.from_iterable(iter_merge_fragments(pathlib.Path(os.path.relpath(r.pdf_path, tmp_dir)),
+                                                                    r.toc_lines, r.n_pages)
+                                               for r in results),
+        out_path=merge_tex,
+    )
+    merge_fmt = build_format(timeout=timeout) if precompile else None
+    with profiler.phase('merge: compile') if profiler is not None else contextlib.nullcontext():
+        return compile_doc(merge_tex, tmp_dir, shell_escape=False, max_passes=max_passes, fmt=merge_fmt,
+                           timeout=timeout)
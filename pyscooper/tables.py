@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import pathlib
+
+from pyscooper.tex_utils import escape_tex
+
+DEFAULT_TABLE_MAX_ROWS = 2_000  # Beyond this, the rest of the rows are elided
+DEFAULT_TABLE_MAX_COLS = 12  # Wider tables do not fit in the page anyway
+MAX_CELL_CHARS = 40
+CHUNK_ROWS = 500  # Rows parsed at a time
+
+
+def count_lines(file: pathlib.Path,
+                stop_after: T.Optional[int] = None,
+                chunk_size: int = 1024 ** 2,
+                ) -> int:
+    """
+    Number of newlines in *file* (read in binary chunks, quoted newlines are counted too)
+
+    :param file:
+    :param stop_after: stop reading once there are more newlines than this (the count is then only a lower bound)
+    :param chunk_size:
+    :return:
+    """
+    n_lines = 0
+    with open(file, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            n_lines += chunk.count(b'\n')
+            if stop_after is not None and n_lines > stop_after:
+                break
+    return n_lines
+
+
+def format_cell(value: object, max_chars: int = MAX_CELL_CHARS) -> str:
+    value = str(value).replace('\n', ' ')
+    if len(value) > max_chars:
+        value = value[:max_chars - 3] + '...'
+    return escape_tex(value)
+
+
+def format_row(values: T.Iterable[object]) -> str:
+    return ' & '.join(map(format_cell, values)) + r' \\' + '\n'
+
+
+def iter_longtable(header: T.Sequence[str],
+                   rows: T.Iterable[T.Sequence[object]],
+                   n_hidden_cols: int = 0,
+                   elided_after: int = 0,
+                   ) -> T.Iterator[str]:
+    """
+    Yields the lines of a (booktabs) longtable: it breaks across pages and repeats *header* on each of them
+
+    :param header: column names
+    :param rows: consumed lazily
+    :param n_hidden_cols: columns left out (noted in the header)
+    :param elided_after: the rows after this many were left out (noted after the last one), 0 -> none were
+    :return:
+    """
+    header = list(header)
+    n_cols = len(header) + (1 if n_hidden_cols else 0)
+    header_line = format_row(header + ([f"(+{n_hidden_cols} columns)"] if n_hidden_cols else []))
+
+    yield r'{\small' + '\n'
+    yield r'\begin{longtable}{' + 'l' * n_cols + '}\n'
+    yield r'\toprule' + '\n' + header_line + r'\midrule' + '\n' + r'\endfirsthead' + '\n'
+    yield r'\toprule' + '\n' + header_line + r'\midrule' + '\n' + r'\endhead' + '\n'
+    yield (r'\midrule' + '\n' + r'\multicolumn{' + str(n_cols) + r'}{r}{\emph{Continued on the next page}} \\'
+           + '\n' + r'\endfoot' + '\n')
+    yield r'\bottomrule' + '\n' + r'\endlastfoot' + '\n'
+    for row in rows:
+        yield format_row(list(row) + ([''] if n_hidden_cols else []))
+    if elided_after:
+        yield (r'\midrule' + '\n' + r'\multicolumn{' + str(n_cols) + r'}{c}{\emph{[... '
+               + f"more than {elided_after} rows, the rest were elided by scooper" + r' ...]}} \\' + '\n')
+    yield r'\end{longtable}' + '\n'
+    yield r'}' + '\n'
+
+
+def pandas_longtable(file: pathlib.Path,
+                     max_rows: int = DEFAULT_TABLE_MAX_ROWS,
+                     max_cols: int = DEFAULT_TABLE_MAX_COLS,
+                     chunk_rows: int = CHUNK_ROWS,
+                     ) -> str:
+    """
+    Render (at most) the first *max_rows* x *max_cols* cells of the CSV/TSV *file* as a longtable
+
+    The rows are parsed by pandas *chunk_rows* at a time -> time & memory do not depend on the size of the file
+
+    :param file: a .tsv file is split on tabs, anything else on commas
+    :param max_rows: 0 -> no limit
+    :param max_cols: 0 -> no limit
+    :param chunk_rows:
+    :return: the LaTeX code
+    """
+    import pandas as pd
+
+    read_kwargs = dict(sep='\t' if file.suffix.lower() == '.tsv' else ',',
+                       dtype=str,
+                       keep_default_na=False,
+                       skipinitialspace=True,
+                       on_bad_lines='skip',
+                       encoding_errors='replace',
+                       )
+
+    columns = list(pd.read_csv(file, nrows=0, **read_kwargs).columns)
+    n_hidden_cols = max(len(columns) - max_cols, 0) if max_cols else 0
+    usecols = list(range(len(columns) - n_hidden_cols))
+
+    def iter_rows() -> T.Iterator[T.Sequence[object]]:
+        with pd.read_csv(file, usecols=usecols, nrows=max_rows or None, chunksize=chunk_rows,
+                         **read_kwargs) as reader:
+            for chunk in reader:
+                yield from chunk.itertuples(index=False, name=None)
+
+    elided_after = 0
+    # Only read until the first row past the cap (+1 -> the header) -> the rest of the file does not matter
+    if max_rows and count_lines(file, stop_after=max_rows + 1) > max_rows + 1:
+        elided_after = max_rows
+
+    return ''.join(iter_longtable(header=columns[:len(usecols)],
+                                  rows=iter_rows(),
+                                  n_hidden_cols=n_hidden_cols,
+                                  elided_after=elided_after,
+                                  ))
+
+
+if __name__ == '__main__':
+    print(''.join(iter_longtable(header=['a', 'b_c'], rows=[(1, '50%'), (2, '&')], n_hidden_cols=3, elided_after=2)))
@@ -2,10 +2,25 @@
 
 import typing as T
 
+# Everything before this command only depends on the packages -> can be dumped into a format file (see tex_utils)
+# It does nothing in a normal compilation but, in the format, \documentclass skips everything up to it
+PRECOMPILED_SPLIT = r'\scooperendofdump'
+
 
 def build_tex_template(use_minted: bool = False,
                        use_pandas: bool = True,
+                       shard: bool = False,
+                       use_pygments: bool = False,
                        ) -> T.Tuple[str, str]:
+    """
+    Returns the LaTeX code that goes before and after the document's body
+
+    :param use_minted:
+    :param use_pandas:
+    :param shard: only the body pages (no table of contents, headers or footers) -> they are added when merging
+    :param use_pygments: define the macros of the Verbatim blocks highlighted in-process (see highlight.py)
+    :return: (tex_prefix, tex_suffix)
+    """
     tex_suffix = r"""
 % ---- PYTHON AUTO-SPLIT ----
 %% Done
@@ -16,6 +31,7 @@ def build_tex_template(use_minted: bool = False,
     tex_prefix = r"""
 % !TeX TXS-program:compile = txs:///pdflatex/[--shell-escape]
 % end of magic comamands for TeXStudio
+\def""" + PRECOMPILED_SPLIT + r"""{}
 \documentclass[]{article}
 
 % Smaller margins
@@ -25,20 +41,16 @@ def build_tex_template(use_minted: bool = False,
 \usepackage{color}
     """
 
-    if use_minted:
-        tex_prefix += r"""
-        
-\usepackage{minted}
-%\usemintedstyle{friendly}
-%\usemintedstyle{colorfull}
-\usemintedstyle{strata}
+    if use_pygments:
+        from pyscooper.highlight import style_defs
 
-        """
+        tex_prefix += "\n" + style_defs() + "\n"
 
     if use_pandas:
         tex_prefix += r"""
         
 \usepackage{booktabs}
+\usepackage{longtable}
 
         """
 
@@ -64,6 +76,20 @@ def build_tex_template(use_minted: bool = False,
 % Include PDF's
 \usepackage{pdfpages}
 
+""" + PRECOMPILED_SPLIT + r"""
+"""
+
+    if use_minted:
+        tex_prefix += r"""
+        
+\usepackage{minted}
+%\usemintedstyle{friendly}
+%\usemintedstyle{colorfull}
+\usemintedstyle{strata}
+
+        """
+
+    tex_prefix += r"""
 % Hyperrefs with nicer styles
 \usepackage{hyperref}
 \usepackage{xcolor}
@@ -103,6 +129,14 @@ urlcolor={blue!80!black}
 
 
 \begin{document}
+    """
+
+    if shard:
+        tex_prefix += r"""
+    \pagestyle{empty}
+    """
+    else:
+        tex_prefix += r"""
     \thispagestyle{empty}
     \phantomsection
     \tableofcontents
@@ -126,6 +160,9 @@ urlcolor={blue!80!black}
 %	\pagestyle{headings} puts the numbers at the top of the page; the precise style and content depends on the document class
 %	\pagenumbering{roman} numbers pages using Roman numerals; use arabic to switch it back
 
+    """
+
+    tex_prefix += r"""
     \setcounter{secnumdepth}{0} %% no section numbering
 % ---- PYTHON AUTO-SPLIT ----
 
@@ -134,6 +171,17 @@ urlcolor={blue!80!black}
     return tex_prefix, tex_suffix
 
 
+def split_preamble(tex_prefix: str) -> T.Tuple[str, str]:
+    """
+    Split the *tex_prefix* from build_tex_template into the part that can be precompiled and the rest
+
+    :param tex_prefix:
+    :return: (precompilable preamble, rest of the prefix)
+    """
+    split_idx = tex_prefix.rindex(PRECOMPILED_SPLIT)
+    return tex_prefix[:split_idx], tex_prefix[split_idx:]
+
+
 if __name__ == '__main__':
     tex_prefix, tex_suffix = build_tex_template(use_minted=True)
     print(tex_prefix + tex_suffix)
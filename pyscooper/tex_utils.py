@@ -1,12 +1,29 @@
 #! /usr/bin/env python3
 
 import typing as T
+import re
+import os
+import shutil
+import hashlib
 import tempfile
 import pathlib
-import subprocess
 import itertools
+import time
 
-from pyscooper.tex_template import build_tex_template
+from pyscooper import CACHE_DIR
+from pyscooper import deps
+from pyscooper import procs
+from pyscooper.cli_utils import debug, info, warning
+from pyscooper.cache import MintedCache
+from pyscooper.tex_template import build_tex_template, split_preamble, PRECOMPILED_SPLIT
+
+DEFAULT_MAX_PASSES = 4
+AUX_SUFFIXES = ('.aux', '.toc', '.out')
+FORMAT_CACHE_DIR = CACHE_DIR / 'formats'
+COMPRESS_PRESETS = ('screen', 'ebook', 'printer')  # Ghostscript's -dPDFSETTINGS, from smallest to best quality
+RERUN_RE = re.compile(r'Rerun to get|Label\(s\) may have changed|Rerun LaTeX')
+NEXT_PASS_RE = re.compile(rb'\\(?:newlabel|@writefile|bibcite|@input)\b')  # Read back from the .aux
+FAILED_FORMAT_RETRY_S = 7 * 24 * 3600  # A preamble that could not be precompiled is tried again after this long
 
 
 def sanitize_tex(in_str: object) -> str:
@@ -23,44 +40,178 @@ def sanitize_tex(in_str: object) -> str:
             )
 
 
-def export_tex_doc(tex_body: str,
+TEX_SPECIAL_CHARS = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+TEX_SPECIAL_RE = re.compile('|'.join(map(re.escape, TEX_SPECIAL_CHARS)))
+
+
+def escape_tex(in_str: object) -> str:
+    """
+    Escape (instead of removing, like sanitize_tex) every character of *in_str* that is special for LaTeX
+
+    :param in_str:
+    :return: str
+    """
+    return TEX_SPECIAL_RE.sub(lambda m: TEX_SPECIAL_CHARS[m.group()], str(in_str))
+
+
+def export_tex_doc(tex_body: T.Union[str, T.Iterable[str]],
                    out_path: T.Union[str, pathlib.Path],
                    use_minted: bool = False,
                    use_pandas: bool = False,
+                   shard: bool = False,
+                   use_pygments: bool = False,
                    ) -> bool:
     """
     Outputs a tex. document at *out_path* with the contents in *tex_body* surrounded by the LaTeX template
 
-    :param tex_body:
+    :param tex_body: either the full body or an iterator of fragments (written to the file as they are produced)
     :param out_path:
+    :param shard: see build_tex_template
+    :param use_pygments: see build_tex_template
     :return:
     """
 
     tex_prefix, tex_suffix = build_tex_template(
         use_minted=use_minted,
         use_pandas=use_pandas,
+        shard=shard,
+        use_pygments=use_pygments,
     )
 
+    if isinstance(tex_body, str):
+        tex_body = [tex_body]
+
     with open(out_path, 'w') as fp:
-        fp.write('\n'.join([tex_prefix, tex_body, tex_suffix]))
+        fp.write(tex_prefix)
+        fp.write('\n')
+        for fragment in tex_body:
+            fp.write(fragment)
+        fp.write('\n')
+        fp.write(tex_suffix)
 
     return True
 
 
+def tex_tree_mtime(timeout: T.Optional[float] = procs.PROBE_TIMEOUT) -> float:
+    """Last time the file databases (ls-R) of the TeX installation changed, e.g. by tlmgr (0 if unknown)"""
+    try:
+        p = procs.run(['kpsewhich', '-all', 'ls-R'], timeout=timeout)
+    except OSError:
+        return 0.0
+    mtimes = []
+    for line in p.stdout.decode('utf8', 'replace').splitlines():
+        try:
+            mtimes.append(os.stat(line.strip()).st_mtime)
+        except OSError:
+            pass
+    return max(mtimes, default=0.0)
+
+
+def build_format(use_minted: bool = False,
+                 use_pandas: bool = False,
+                 use_pygments: bool = False,
+                 timeout: T.Optional[float] = procs.PDFLATEX_TIMEOUT,
+                 ) -> T.Optional[pathlib.Path]:
+    """
+    Dump the package-loading part of the preamble into a pdflatex format file (cached across runs)
+
+    Compiling with *fmt* set to it skips re-loading the whole package stack on every pass
+
+    A format that failed to build is not tried again until its preamble or pdflatex change, until packages are
+    installed (see tex_tree_mtime) or until FAILED_FORMAT_RETRY_S have passed
+
+    :param use_minted:
+    :param use_pandas:
+    :param use_pygments:
+    :param timeout: for `pdflatex -ini` [s] (None -> no limit)
+    :return: the path to the .fmt file or None if it could not be built
+    """
+    pdflatex = shutil.which('pdflatex')
+    if pdflatex is None:
+        return None
+
+    tex_prefix, _ = build_tex_template(use_minted=use_minted, use_pandas=use_pandas, use_pygments=use_pygments)
+    fmt_part, _ = split_preamble(tex_prefix)
+
+    # A new pdflatex also needs a new format
+    pdflatex = os.path.realpath(pdflatex)
+    key_src = f"{fmt_part}\n{pdflatex}\n{os.stat(pdflatex).st_mtime}"
+    fmt_name = f"scooper-{hashlib.sha256(key_src.encode('utf8')).hexdigest()[:16]}"
+    fmt_path = FORMAT_CACHE_DIR / f"{fmt_name}.fmt"
+    failed_path = fmt_path.with_suffix('.failed')
+    if fmt_path.is_file():
+        return fmt_path
+    if failed_path.is_file():
+        failed_at = failed_path.stat().st_mtime
+        if time.time() - failed_at < FAILED_FORMAT_RETRY_S and tex_tree_mtime() <= failed_at:
+            debug(f"The preamble could not be precompiled before (see {failed_path}): compiling without it")
+            return None
+        debug(f"The preamble could not be precompiled before (see {failed_path}), but the TeX installation changed"
+              f" since (or it was long ago): trying again")
+
+    FORMAT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=FORMAT_CACHE_DIR) as tmp:
+        tmp_dir = pathlib.Path(tmp)
+        fmt_tex = tmp_dir / f"{fmt_name}.tex"
+        with open(fmt_tex, 'w') as fp:
+            fp.write(fmt_part)
+            # From now on \documentclass skips the (already loaded) preamble of the documents
+            fp.write('\n\\def\\documentclass#1' + PRECOMPILED_SPLIT + '{}\n\\dump\n')
+
+        cmd = ['pdflatex', '-ini', '-interaction=nonstopmode', '-halt-on-error',
+               f'-jobname={fmt_name}',
+               '-output-directory', str(tmp_dir),
+               '&pdflatex', str(fmt_tex),
+               ]
+        p = procs.run(cmd, timeout=timeout)
+        if p.timed_out:
+            warning(f"Precompiling the preamble took more than {timeout} [s]: stopped")
+            return None
+        if not p.ok or not (tmp_dir / fmt_path.name).is_file():
+            output = p.stdout.decode('utf8', 'replace')[-2000:]
+            # Same preamble -> same failure (a timeout may not be, it is tried again)
+            failed_path.write_text(output)
+            warning(f"Could not precompile the preamble (see {failed_path}): compiling without it")
+            debug(output)
+            return None
+        os.replace(tmp_dir / fmt_path.name, fmt_path)
+    failed_path.unlink(missing_ok=True)
+
+    return fmt_path
+
+
 def compress_doc(in_pdf: pathlib.Path,
                  out_pdf: pathlib.Path,
+                 preset: T.Optional[str] = None,
+                 quiet: bool = False,
+                 timeout: T.Optional[float] = procs.GS_TIMEOUT,
                  ) -> bool:
-    # TODO Skip if ghostscript is missing...
-
-    # # MOVE
-    # if dst_path.is_file():
-    #     os.remove(dst_path)
-    # shutil.move(src=str(pdf_path), dst=str(dst_path))
+    """
+    Re-write *in_pdf* with Ghostscript into a (hopefully) smaller *out_pdf* (see also github.com/pts/pdfsizeopt)
 
-    # COMPRESS
-    # https://github.com/pts/pdfsizeopt
-    print("Trying to compress the pdf...")
+    :param in_pdf:
+    :param out_pdf:
+    :param preset: one of COMPRESS_PRESETS (Ghostscript's default if None)
+    :param quiet: only report the sizes as debug messages
+    :param timeout: Ghostscript is killed after this long [s] (None -> no limit)
+    :return: True if *out_pdf* was written and is smaller than *in_pdf* (use *in_pdf* otherwise)
+    """
+    if not deps.was_ghostscript_found():
+        warning("Ghostscript was not found: the PDF will not be compressed")
+        return False
 
+    start = time.perf_counter()
     prev_size = in_pdf.stat().st_size / 1e6  # [Mb]
     compress_cmd = ['gs',
                     '-sDEVICE=pdfwrite',
@@ -69,42 +220,178 @@ def compress_doc(in_pdf: pathlib.Path,
                     '-dQUIET',
                     '-dBATCH',
                     '-dPrinted=false',
-                    f'-sOutputFile="{out_pdf}"',
-                    f'"{in_pdf}"',
                     ]
-    p3 = subprocess.run(compress_cmd)
+    if preset is not None:
+        compress_cmd.append(f'-dPDFSETTINGS=/{preset}')
+    # No quotes -> each item is already a single argument
+    compress_cmd += [f'-sOutputFile={out_pdf}', str(in_pdf)]
+
+    p = procs.run(compress_cmd, timeout=timeout)
+    if p.timed_out:
+        warning(f"Compressing {in_pdf} took more than {timeout} [s]: stopped")
+        out_pdf.unlink(missing_ok=True)
+        return False
+    if not p.ok or not out_pdf.is_file():
+        warning(f"Compressing {in_pdf} failed: {p.stderr.decode('utf8', 'replace')[-500:]}")
+        return False
+
     post_size = out_pdf.stat().st_size / 1e6  # [Mb]
-    # gs -sDEVICE=pdfwrite -dCompatibilityLevel=1.5 -dNOPAUSE -dQUIET -dBATCH -dPrinted=false -sOutputFile=foo-compressed.pdf foo.pdf
-    if p3.returncode == 0:
-        print(f"Compression reduced the output PDF size by {(post_size - prev_size) / prev_size:+.1%})")
-        print(f"Wrote {out_pdf} ({post_size:.2f} [Mb])")
-        return True
-    print("Compression failed!")
+    report = debug if quiet else info
+    report(f"Compressed {in_pdf.name}: {prev_size:.2f} -> {post_size:.2f} [Mb]"
+           f" ({(post_size - prev_size) / max(prev_size, 1e-9):+.1%}) in {time.perf_counter() - start:.1f} [s]")
+    if post_size >= prev_size:
+        out_pdf.unlink()
+        return False
+    return True
+
+
+def _aux_digest(out_dir: pathlib.Path, stem: str) -> str:
+    """Digest of the auxiliary files that feed the next pdflatex pass"""
+    h = hashlib.sha256()
+    for suffix in AUX_SUFFIXES:
+        try:
+            h.update((out_dir / f"{stem}{suffix}").read_bytes())
+        except OSError:
+            h.update(b'missing')
+    return h.hexdigest()
+
+
+def _feeds_next_pass(out_dir: pathlib.Path, stem: str) -> bool:
+    """Do the auxiliary files have anything for the next pass to read? (labels, TOC entries, citations...)"""
+    for suffix in AUX_SUFFIXES:
+        try:
+            data = (out_dir / f"{stem}{suffix}").read_bytes()
+        except OSError:
+            continue
+        # The .aux always has some boilerplate (\relax...), the .toc & .out only have entries
+        if (NEXT_PASS_RE.search(data) if suffix == '.aux' else data.strip()):
+            return True
     return False
 
 
+def needs_rerun(log_path: pathlib.Path) -> bool:
+    """Did pdflatex ask for another pass? (e.g. "Label(s) may have changed. Rerun to get cross-references right")"""
+    try:
+        with open(log_path, 'r', errors='replace') as fp:
+            # pdflatex wraps the log lines at 79 chars
+            return RERUN_RE.search(fp.read().replace('\n', '')) is not None
+    except OSError:
+        return True
+
+
+def _run_passes(cmd: T.List[str],
+                src_tex: pathlib.Path,
+                out_dir: pathlib.Path,
+                max_passes: int,
+                quiet: bool,
+                timeout: T.Optional[float] = procs.PDFLATEX_TIMEOUT,
+                ) -> procs.ProcResult:
+    """
+    Run *cmd* (pdflatex ...) until the document is stable, return the last pass (it failed if not ok)
+
+    It is stable when a pass did not change the auxiliary files or when it neither read nor wrote anything in them
+    (e.g. the first pass of a document without labels or TOC entries)
+    """
+    stem = src_tex.stem
+    for _ in range(max(max_passes, 1)):
+        aux_before = _aux_digest(out_dir, stem)
+        fed_before = _feeds_next_pass(out_dir, stem)
+        # From the output dir -> minted's cache ends up there too
+        p = procs.run(cmd, cwd=out_dir, capture=quiet, timeout=timeout)
+        if p.timed_out:
+            warning(f"pdflatex took more than {timeout} [s] on {src_tex.name}: stopped")
+            return p
+        if not p.ok:
+            return p
+        if needs_rerun(out_dir / f"{stem}.log"):
+            continue
+        if _aux_digest(out_dir, stem) == aux_before or not (fed_before or _feeds_next_pass(out_dir, stem)):
+            break
+    else:
+        if max_passes > 1:
+            warning(f"{src_tex.name} was still changing after {max_passes} pdflatex passes")
+    return p
+
+
 def compile_doc(src_tex: pathlib.Path,
                 out_dir: pathlib.Path,
                 shell_escape: bool = True,
+                max_passes: int = DEFAULT_MAX_PASSES,
+                quiet: bool = False,
+                fmt: T.Optional[pathlib.Path] = None,
+                minted_cache: T.Optional[MintedCache] = None,
+                timeout: T.Optional[float] = procs.PDFLATEX_TIMEOUT,
                 ) -> T.Union[pathlib.Path, None]:
+    """
+    Runs pdflatex on *src_tex* until the auxiliary files (.aux, .toc...) stop changing
+
+    :param src_tex:
+    :param out_dir: where the PDF (and the .aux, .log...) end up
+    :param shell_escape: required by minted
+    :param max_passes: the compilation stops after this many passes even if it is not stable yet
+    :param quiet: capture the pdflatex output (and never stop to ask for input) -> for parallel compilations
+    :param fmt: precompiled preamble (see build_format). If the compilation fails with it, it is retried without
+                (unless it timed out: it would most likely hang without it too)
+    :param minted_cache: re-use (and extend) the code highlighted by minted in previous runs
+    :param timeout: each pdflatex pass is killed (with what it started, e.g. pygmentize) after this long [s]
+    :return: the path to the PDF or None if the compilation failed
+    """
+    src_tex = src_tex.absolute()
+    out_dir = out_dir.absolute()
+
+    # minted's default cache dir
+    run_minted_dir = out_dir / f"_minted-{src_tex.stem}"
+    if minted_cache is not None:
+        minted_cache.populate(run_minted_dir)
+    try:
+        return _compile_doc(src_tex, out_dir, shell_escape=shell_escape, max_passes=max_passes, quiet=quiet, fmt=fmt,
+                            timeout=timeout)
+    finally:
+        if minted_cache is not None:
+            n_new = minted_cache.harvest(run_minted_dir)
+            if n_new:
+                info(f"Added {n_new} highlighted files to the minted cache")
+
+
+def _compile_doc(src_tex: pathlib.Path,
+                 out_dir: pathlib.Path,
+                 shell_escape: bool,
+                 max_passes: int,
+                 quiet: bool,
+                 fmt: T.Optional[pathlib.Path],
+                 timeout: T.Optional[float],
+                 ) -> T.Union[pathlib.Path, None]:
     cmd = ['pdflatex']
 
     if shell_escape:
         cmd += ['-shell-escape']
 
+    if quiet:
+        cmd += ['-interaction=nonstopmode', '-halt-on-error']
+
     cmd += [
         '-output-directory',
         str(out_dir),
         str(src_tex),
     ]
-    p1 = subprocess.run(cmd)
-    p2 = subprocess.run(cmd)
 
-    if p1.returncode == 0 and p2.returncode == 0:
-        pdf_path = next(out_dir.glob('*.pdf'))
-        # dst_path = pathlib.Path().cwd() / pdf_path.name
+    pdf_path = out_dir / f"{src_tex.stem}.pdf"
+    # dst_path = pathlib.Path().cwd() / pdf_path.name
+
+    if fmt is not None:
+        fmt_cmd = cmd[:1] + [f'-fmt={fmt.with_suffix("")}'] + cmd[1:]
+        p = _run_passes(fmt_cmd, src_tex, out_dir, max_passes, quiet, timeout)
+        if p.ok:
+            return pdf_path
+        if p.timed_out:
+            warning(f"Compilation Stopped! (see {out_dir / src_tex.stem}.log)")
+            return None
+        warning(f"Compilation with the precompiled preamble {fmt.name} failed, retrying without it")
+
+    p = _run_passes(cmd, src_tex, out_dir, max_passes, quiet, timeout)
+    if p.ok:
         return pdf_path
-    print("Compilation Failed!")
+    warning(f"Compilation {'Stopped' if p.timed_out else 'Failed'}! (see {out_dir / src_tex.stem}.log)")
     return None
 
 
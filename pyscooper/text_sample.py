@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import io
+import os
+import re
+import itertools
+import collections
+
+DEFAULT_TEXT_MAX_BYTES = 1024 ** 2  # Of the sampled text, not of the file
+DEFAULT_TEXT_MAX_LINES = 10_000
+DEFAULT_HEAD_FRACTION = 0.5  # Of the budget spent on the start of the file (the rest goes to its end)
+MAX_LINE_CHARS = 1024  # Longer lines are cut -> a file without newlines cannot blow the budget in one go
+MIN_REPEATS = 3  # Shorter runs of the same line are kept as they are
+CONTROL_CHARS_RE = re.compile('[\x00-\x08\x0b-\x1f\x7f]')  # TeX chokes on them (tabs & newlines are fine)
+
+
+def elision_marker(n_lines: int, n_bytes: int) -> str:
+    return f"[... {n_lines} lines ({n_bytes / 1e6:.2f} [Mb]) elided by scooper ...]\n"
+
+
+def repeat_marker(n_repeats: int) -> str:
+    return f"[... previous line repeated {n_repeats} more times ...]\n"
+
+
+def iter_lines(fp: T.TextIO, max_line_chars: int = MAX_LINE_CHARS) -> T.Iterator[T.Tuple[str, int]]:
+    """
+    Read *fp* one line at a time, cutting the ones longer than *max_line_chars*
+
+    :return: yields (line, number of characters it had in the file)
+    """
+    while True:
+        line = fp.readline(max_line_chars)
+        if not line:
+            return
+        n_chars = len(line)
+        if not line.endswith('\n'):
+            # Skip the rest of the line without keeping it
+            rest = fp.readline(max_line_chars)
+            while rest:
+                n_chars += len(rest)
+                if rest.endswith('\n'):
+                    break
+                rest = fp.readline(max_line_chars)
+            if n_chars > len(line):
+                line += f" [... {n_chars - len(line)} chars cut ...]"
+            line += '\n'
+        yield line, n_chars
+
+
+def collapse_repeats(lines: T.Iterable[T.Tuple[str, int]],
+                     min_repeats: int = MIN_REPEATS,
+                     ) -> T.Iterator[T.Tuple[str, int, int]]:
+    """
+    Replace the runs of (at least *min_repeats*) identical lines with the line and a marker with the count
+
+    :param lines: as yielded by iter_lines
+    :param min_repeats:
+    :return: yields (line, number of lines of the file it stands for, characters of the file it stands for)
+    """
+    last, n_same, n_chars = None, 0, 0
+    for line, line_chars in lines:
+        if line == last:
+            n_same += 1
+            n_chars += line_chars
+            continue
+        if last is not None:
+            yield from _flush_run(last, n_same, n_chars, min_repeats)
+        last, n_same, n_chars = line, 1, line_chars
+    if last is not None:
+        yield from _flush_run(last, n_same, n_chars, min_repeats)
+
+
+def _flush_run(line: str, n_same: int, n_chars: int, min_repeats: int) -> T.Iterator[T.Tuple[str, int, int]]:
+    line_chars = n_chars // n_same
+    if n_same < min_repeats:
+        for _ in range(n_same - 1):
+            yield line, 1, line_chars
+        # The last line of the file may have had no newline -> it gets the remainder
+        yield line, 1, n_chars - line_chars * (n_same - 1)
+    else:
+        yield line, 1, line_chars
+        yield repeat_marker(n_same - 1), n_same - 1, n_chars - line_chars
+
+
+def sample_lines(fp: T.TextIO,
+                 max_bytes: T.Optional[int] = DEFAULT_TEXT_MAX_BYTES,
+                 max_lines: T.Optional[int] = DEFAULT_TEXT_MAX_LINES,
+                 head_fraction: float = DEFAULT_HEAD_FRACTION,
+                 ) -> T.Iterator[str]:
+    """
+    Stream the lines of *fp* that fit in the budget: the start & end of the file with a marker in between
+
+    Runs of repeated lines are collapsed first. Only the (bounded) tail is kept in memory while reading.
+
+    :param fp: a text file
+    :param max_bytes: of the sampled lines (None or 0 -> no limit)
+    :param max_lines: of the sampled lines (None or 0 -> no limit)
+    :param head_fraction: of the budget used for the start of the file
+    :return: yields the sampled lines (with their newlines)
+    """
+    max_bytes = max_bytes or float('inf')
+    max_lines = max_lines or float('inf')
+    head_bytes, head_lines = max_bytes * head_fraction, max_lines * head_fraction
+
+    lines = collapse_repeats(iter_lines(fp))
+
+    # Head -> straight through
+    n_bytes, n_lines = 0, 0
+    for line, n_src_lines, n_src_chars in lines:
+        line_bytes = len(line.encode('utf8', 'replace'))
+        if n_bytes + line_bytes > head_bytes or n_lines + 1 > head_lines:
+            break
+        n_bytes += line_bytes
+        n_lines += 1
+        yield line
+    else:
+        return
+
+    # Tail -> a sliding window with whatever is left of the budget
+    tail_bytes, tail_lines = max_bytes - n_bytes, max_lines - n_lines
+    tail = collections.deque()
+    n_tail_bytes = 0
+    elided_lines, elided_chars = 0, 0
+    for line, n_src_lines, n_src_chars in itertools.chain([(line, n_src_lines, n_src_chars)], lines):
+        line_bytes = len(line.encode('utf8', 'replace'))
+        tail.append((line, line_bytes, n_src_lines, n_src_chars))
+        n_tail_bytes += line_bytes
+        while tail and (n_tail_bytes > tail_bytes or len(tail) > tail_lines):
+            _, dropped_bytes, dropped_lines, dropped_chars = tail.popleft()
+            n_tail_bytes -= dropped_bytes
+            elided_lines += dropped_lines
+            elided_chars += dropped_chars
+
+    if elided_lines:
+        yield elision_marker(elided_lines, elided_chars)
+    for line, *_ in tail:
+        yield line
+
+
+def write_sampled_copy(src: T.Union[str, os.PathLike],
+                       dst: T.Union[str, os.PathLike],
+                       max_bytes: T.Optional[int] = DEFAULT_TEXT_MAX_BYTES,
+                       max_lines: T.Optional[int] = DEFAULT_TEXT_MAX_LINES,
+                       ) -> int:
+    """
+    Write the sampled lines of *src* (see sample_lines) to *dst* as they are read, without control characters
+
+    The copy is safe to \\VerbatimInput: valid UTF-8 & bounded by the budget
+
+    :return: number of bytes written
+    """
+    n_bytes = 0
+    with open(src, 'r', errors='replace') as fp_in, open(dst, 'w', encoding='utf8') as fp_out:
+        for line in sample_lines(fp_in, max_bytes=max_bytes, max_lines=max_lines):
+            n_bytes += fp_out.write(CONTROL_CHARS_RE.sub('', line))
+    return n_bytes
+
+
+if __name__ == '__main__':
+    sample = io.StringIO(''.join(f"line {i}\n" for i in range(100)) + "same\n" * 50 + "end\n")
+    print(''.join(sample_lines(sample, max_lines=20)))
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import sys
+import pathlib
+
+from pyscooper.attachments import TOCFile
+
+
+def folding_fcn(s1: str, s2: str) -> str:
+    return sys.intern(f"{s1}/{s2}")
+
+
+class TOCNode:
+    """
+    A directory of the table of contents
+
+    Its children are either other directories (TOCNode) or files (their TOCFile, no node needed)
+    """
+    __slots__ = ('children',)
+
+    def __init__(self):
+        self.children = dict()  # {name: TOCNode | TOCFile}, in TOC order
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} children={len(self.children)}>"
+
+    def is_foldable(self) -> bool:
+        """Its only child is a directory -> both can share a single heading"""
+        return len(self.children) == 1 and isinstance(next(iter(self.children.values())), TOCNode)
+
+
+def build_trie(filemap: dict) -> TOCNode:
+    """
+    Iteratively convert the nested dicts of scan_tree ({dir: {subdir: {filename: TOCFile}}}) into a trie
+
+    The directory names are interned -> the many 'src', 'logs', ... of a big tree are a single string each
+
+    :param filemap: its TOCFile are re-used as they are (a bare pathlib.Path is matched again)
+    :return: the root node
+    """
+    root = TOCNode()
+    stack = [(filemap, root)]
+    while stack:
+        recd, node = stack.pop()
+        for k, v in recd.items():
+            if isinstance(v, dict):
+                child = node.children[sys.intern(k)] = TOCNode()
+                stack.append((v, child))
+            elif isinstance(v, TOCFile):
+                node.children[k] = v
+            else:
+                node.children[k] = TOCFile(filepath=v, keypath=())
+    return root
+
+
+def fold_trie(root: TOCNode) -> TOCNode:
+    """
+    Merge (in place & iteratively) every directory whose only child is another directory: a/{b/{c/{...}}} -> a/b/c
+
+    The merged directories are moved after their siblings (like the recursive dict version used to do)
+
+    :param root: is never folded itself
+    :return: root
+    """
+    # Post-order -> the sub-directories are folded before their parents look at them
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((v, False) for v in node.children.values() if isinstance(v, TOCNode))
+            continue
+        # Folding a child does not change whether it is foldable (1 dir -> 1 dir) -> decide on the current state
+        for k in [k for k, v in node.children.items() if isinstance(v, TOCNode) and v.is_foldable()]:
+            child = node.children.pop(k)
+            [(lk, grandchild)] = child.children.items()
+            node.children[folding_fcn(k, lk)] = grandchild
+    return root
+
+
+def iter_entries(root: TOCNode) -> T.Iterator[TOCFile]:
+    """
+    Stream the files of the trie (depth-first, in TOC order) without building any intermediate lists
+
+    The leaves are yielded as they are (no copies), their keypath set to a tuple shared by all the files of the
+    directory
+
+    :param root:
+    :return: TOCFile entries, their keypath leads to their PARENT dir
+    """
+    stack = [((), iter(root.children.items()))]
+    while stack:
+        keypath, children = stack[-1]
+        for k, v in children:
+            if isinstance(v, TOCNode):
+                stack.append((keypath + (k,), iter(v.children.items())))
+                break
+            v.keypath = keypath
+            yield v
+        else:
+            stack.pop()
+
+
+def count_files(root: TOCNode) -> int:
+    n_files = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for v in node.children.values():
+            if isinstance(v, TOCNode):
+                stack.append(v)
+            else:
+                n_files += 1
+    return n_files
+
+
+if __name__ == '__main__':
+    from pyscooper.scan import scan_tree
+
+    trie = fold_trie(build_trie(scan_tree(pathlib.Path(__file__).parent.parent)))
+    for found in iter_entries(trie):
+        print('/'.join(found.keypath), found.filepath.name)
+    print(count_files(trie), 'files')
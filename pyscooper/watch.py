@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import os
+import time
+import pathlib
+
+from pyscooper.cli_utils import debug
+
+DEFAULT_POLL_INTERVAL = 1.0  # [s]
+DEFAULT_DEBOUNCE = 0.5  # [s] e.g. a program that writes a file in several steps, a folder being copied...
+
+
+class Snapshot(T.NamedTuple):
+    files: T.Dict[str, T.Optional[T.Tuple[int, int]]]  # {path: (mtime [ns], size) or None if it is gone}
+    dirs: T.Dict[str, int]  # {path: mtime [ns]} -> changes when files are added, removed or renamed
+
+
+class Changes(T.NamedTuple):
+    files: T.List[str]  # Known files that were modified or removed
+    structure: bool  # Files or directories were added/removed -> the sources have to be scanned again
+
+
+def stat_fingerprint(path: T.Union[str, pathlib.Path]) -> T.Optional[T.Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def dir_mtimes(top_dirs: T.Iterable[pathlib.Path]) -> T.Dict[str, int]:
+    """The mtime of every directory under *top_dirs* (symlinked directories are not followed, like scan_tree)"""
+    mtimes = dict()
+    stack = [str(d) for d in top_dirs]
+    while stack:
+        dir_path = stack.pop()
+        try:
+            mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as it:
+                stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+        except OSError:
+            continue
+    return mtimes
+
+
+def take_snapshot(files: T.Iterable[pathlib.Path],
+                  top_dirs: T.Iterable[pathlib.Path],
+                  ) -> Snapshot:
+    """
+    Stat fingerprints of the scanned *files* and of every directory under *top_dirs*
+
+    :param files: the files in the document
+    :param top_dirs: the scanned directories
+    :return:
+    """
+    return Snapshot(files={str(f): stat_fingerprint(f) for f in files}, dirs=dir_mtimes(top_dirs))
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Changes:
+    changed = [f for f, fingerprint in new.files.items() if old.files.get(f) != fingerprint]
+    return Changes(files=changed,
+                   structure=old.dirs != new.dirs or any(new.files[f] is None for f in changed))
+
+
+def wait_for_change(take_fcn: T.Callable[[], Snapshot],
+                    prev: Snapshot,
+                    interval: float = DEFAULT_POLL_INTERVAL,
+                    debounce: float = DEFAULT_DEBOUNCE,
+                    ) -> T.Tuple[Snapshot, Changes]:
+    """
+    Poll *take_fcn* until its snapshot differs from *prev* and then stays the same for *debounce* seconds
+
+    :param take_fcn: returns the current snapshot
+    :param prev: the snapshot of the last build
+    :param interval: time between polls [s]
+    :param debounce: [s]
+    :return: (the settled snapshot, what changed since *prev*)
+    """
+    curr = prev
+    while curr == prev:
+        time.sleep(interval)
+        curr = take_fcn()
+
+    settled_since = time.monotonic()
+    while time.monotonic() - settled_since < debounce:
+        time.sleep(min(interval, debounce))
+        latest = take_fcn()
+        if latest != curr:
+            debug("The sources are still changing...")
+            curr, settled_since = latest, time.monotonic()
+    return curr, diff_snapshots(prev, curr)
+
+
+if __name__ == '__main__':
+    import sys
+
+    watched = [pathlib.Path(p) for p in sys.argv[1:]] or [pathlib.Path.cwd()]
+    snapshot = take_snapshot([], watched)
+    print(f"Watching {len(snapshot.dirs)} directories, Ctrl+C to stop")
+    while True:
+        snapshot, changes = wait_for_change(lambda: take_snapshot([], watched), snapshot)
+        print(changes)
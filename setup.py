@@ -18,6 +18,7 @@ setup(
     version="1.0.0",
     packages=[
         "pyscooper",
+        "pyscooper.benchmark",
     ],
     scripts=scripts,
     license="MIT",
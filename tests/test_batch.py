@@ -0,0 +1,39 @@
+#! /usr/bin/env python3
+
+# std imports
+import json
+import pathlib
+
+import pytest
+
+from pyscooper.batch import load_manifest
+
+
+def write_manifest(tmp_path: pathlib.Path, manifest: object) -> pathlib.Path:
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest))
+    return path
+
+
+def test_defaults_are_merged_into_each_job(tmp_path: pathlib.Path):
+    path = write_manifest(tmp_path, {'defaults': {'compress': 'ebook', 'jobs': 2},
+                                     'jobs': [{'sources': 'a', 'output': 'a.pdf', 'options': {'jobs': 4}},
+                                              {'sources': ['b', 'c'], 'output': 'b.pdf', 'name': 'b'}]})
+    [a, b] = load_manifest(path)
+    assert (a.name, a.sources, a.output, a.options) == ('a.pdf', [tmp_path / 'a'], tmp_path / 'a.pdf',
+                                                        {'compress': 'ebook', 'jobs': 4})
+    assert (b.name, b.sources, b.options) == ('b', [tmp_path / 'b', tmp_path / 'c'], {'compress': 'ebook', 'jobs': 2})
+
+
+@pytest.mark.parametrize('manifest', [
+    {'jobs': 'a'},
+    {'defaults': ['compress'], 'jobs': [{'sources': 'a', 'output': 'a.pdf'}]},
+    {'jobs': [{'sources': 'a', 'output': 'a.pdf', 'options': 'compress'}]},
+    {'jobs': [{'sources': [1], 'output': 'a.pdf'}]},
+    {'jobs': [{'sources': 'a', 'output': {'path': 'a.pdf'}}]},
+    {'jobs': [{'sources': 'a'}]},
+    [{'sources': 'a', 'output': 'a.pdf'}, {'sources': 'b', 'output': 'a.pdf'}],
+])
+def test_invalid_manifests_raise_value_error(tmp_path: pathlib.Path, manifest: object):
+    with pytest.raises(ValueError):
+        load_manifest(write_manifest(tmp_path, manifest))
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+
+# std imports
+import re
+import json
+import shutil
+import pathlib
+
+import pytest
+
+from pyscooper.attachments import TOCFile, prerender_fragments, iter_tex_fragments
+from pyscooper.cache import FragmentCache, TOTAL_FILENAME
+from pyscooper.images import max_width_px
+
+
+def disk_usage(root: pathlib.Path) -> int:
+    return sum(f.stat().st_size for f in root.rglob('*') if f.is_file() and f.name != TOTAL_FILENAME)
+
+
+def text_entries(src_dir: pathlib.Path, n_files: int) -> list:
+    src_dir.mkdir()
+    for i in range(n_files):
+        (src_dir / f"file{i}.txt").write_text(''.join(f"line {j}\n" for j in range(200 * (i + 1))))
+    return [TOCFile(filepath=f, keypath=()) for f in sorted(src_dir.iterdir())]
+
+
+def test_parallel_prerender_counts_the_bytes_of_the_workers(tmp_path: pathlib.Path):
+    entries = text_entries(tmp_path / 'src', n_files=4)
+    cache = FragmentCache(root=tmp_path / 'cache')
+
+    assert prerender_fragments(entries, cache, max_workers=2) == len(entries)
+    assert cache.added_bytes == disk_usage(cache.root) > 0
+
+    assert cache.evict() == 0
+    with open(cache.root / TOTAL_FILENAME, 'r') as fp:
+        assert json.load(fp)['bytes'] == disk_usage(cache.root)
+
+
+def test_parallel_prerender_is_evicted(tmp_path: pathlib.Path):
+    entries = text_entries(tmp_path / 'src', n_files=4)
+    cache = FragmentCache(root=tmp_path / 'cache', max_bytes=4_000)
+    # A previous run stored the total of the (then empty) cache -> evict trusts it
+    cache.evict()
+
+    prerender_fragments(entries, cache, max_workers=2)
+    assert disk_usage(cache.root) > cache.max_bytes
+    assert cache.evict() > 0
+    assert disk_usage(cache.root) <= cache.max_bytes
+
+
+def test_prerendered_images_match_the_serial_ones(tmp_path: pathlib.Path):
+    Image = pytest.importorskip('PIL.Image')
+    src_dir = tmp_path / 'src'
+    src_dir.mkdir()
+    # Too wide -> a prepared copy is stored as an asset, named after what the handler was given
+    Image.new('RGB', (max_width_px() * 2, 10)).save(src_dir / 'we#ird %name_~é.png')
+    entries = [TOCFile(filepath=src_dir / 'we#ird %name_~é.png', keypath=()),
+               TOCFile(filepath=src_dir / 'copy.png', keypath=())]
+    shutil.copy(entries[0].filepath, entries[1].filepath)
+
+    parallel_cache = FragmentCache(root=tmp_path / 'parallel')
+    assert prerender_fragments(entries, parallel_cache, max_workers=2) == len(entries)
+    serial_cache = FragmentCache(root=tmp_path / 'serial')
+    link_dir = tmp_path / 'links'
+    link_dir.mkdir()
+    list(iter_tex_fragments(entries, link_dir, cache=serial_cache))
+
+    def stored(cache: FragmentCache) -> dict:
+        return {f.relative_to(cache.root): f.read_bytes() for f in cache.root.rglob('*') if f.is_file()}
+
+    assert stored(parallel_cache) == stored(serial_cache) != dict()
+    for f in parallel_cache.root.rglob('*.png'):
+        assert re.fullmatch(r'[A-Za-z0-9-]+\.png', f.name), f
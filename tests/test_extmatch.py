@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import fnmatch
+import itertools
+import pathlib
+import random
+import string
+
+import pytest
+
+from pyscooper.extmatch import ExtMatcher, ExtMap
+from pyscooper.attachments import EXT_MAP, ext_match
+
+NAME_CHARS = string.ascii_letters + string.digits + '._-'
+
+
+def fnmatch_scan(patterns: T.Iterable[str], name: str) -> T.Optional[str]:
+    """The first-match scan that ExtMatcher replaces"""
+    l_name = name.lower()
+    return next((pat for pat in patterns if fnmatch.fnmatch(name=l_name, pat=pat.lower())), None)
+
+
+def random_word(rng: random.Random, max_len: int = 6) -> str:
+    return ''.join(rng.choice(NAME_CHARS) for _ in range(rng.randint(0, max_len)))
+
+
+def name_like(rng: random.Random, pat: str) -> str:
+    """A (random case) name that *pat* is likely to match"""
+    name = pat.replace('*', random_word(rng)).replace('?', rng.choice(string.ascii_letters))
+    while '[' in name and ']' in name[name.index('['):]:
+        start = name.index('[')
+        end = name.index(']', start + 1)
+        name = name[:start] + (rng.choice(name[start + 1:end]) if end > start + 1 else '') + name[end + 1:]
+    return ''.join(c.upper() if rng.random() < 0.3 else c for c in name)
+
+
+def random_names(rng: random.Random, patterns: T.Sequence[str], n: int) -> T.List[str]:
+    names = [name_like(rng, rng.choice(patterns)) for _ in range(n)]
+    names += [random_word(rng, 12) for _ in range(n)]
+    # Several dots -> more than one suffix candidate
+    names += [f"{random_word(rng)}.{name_like(rng, rng.choice(patterns))}" for _ in range(n)]
+    return names
+
+
+def random_patterns(rng: random.Random, n: int) -> T.List[str]:
+    kinds = [lambda: f"*.{random_word(rng, 3)}",
+             lambda: random_word(rng, 4),
+             lambda: f"{random_word(rng, 2)}*",
+             lambda: f"*{random_word(rng, 2)}.[{random_word(rng, 3)}]",
+             lambda: f"{random_word(rng, 2)}?{random_word(rng, 2)}",
+             lambda: f"*.{random_word(rng, 2)}.{random_word(rng, 2)}",
+             lambda: '*',
+             ]
+    return [rng.choice(kinds)() for _ in range(n)]
+
+
+def test_ext_map_matches_the_scan():
+    rng = random.Random(0)
+    patterns = list(EXT_MAP)
+    for name in random_names(rng, patterns, 2_000):
+        assert ext_match(pathlib.Path(name)) == fnmatch_scan(patterns, name), name
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_patterns_match_the_scan(seed: int):
+    rng = random.Random(seed)
+    # Small alphabet -> overlapping patterns, the first one has to win
+    patterns = random_patterns(rng, rng.randint(1, 30))
+    matcher = ExtMatcher(patterns)
+    for name in random_names(rng, patterns, 200):
+        assert matcher.match(name) == fnmatch_scan(patterns, name), (patterns, name)
+
+
+def test_ext_map_rebuilds_its_matcher():
+    ext_map = ExtMap({'*.txt': None, 'makefile': None})
+    assert ext_map.matcher.match('a.TXT') == '*.txt'
+
+    ext_map['*.tar.gz'] = None
+    ext_map.update({'kconfig*': None})
+    ext_map.setdefault('*.[1234567]', None)
+    del ext_map['*.txt']
+    for name in ['a.txt', 'a.tar.gz', 'Kconfig.debug', 'ls.1', 'Makefile']:
+        assert ext_map.matcher.match(name) == fnmatch_scan(ext_map, name), name
+
+    ext_map.clear()
+    assert ext_map.matcher.match('Makefile') is None
+
+
+def test_translate_with_named_groups(monkeypatch):
+    # Before Python 3.11, fnmatch.translate names groups of its own (g0, g1...) for patterns with several '*'
+    translate, group_ids = fnmatch.translate, itertools.count()
+
+    def translate_with_groups(pat: str) -> str:
+        name = f"g{next(group_ids)}"
+        return f"(?=(?P<{name}>{translate(pat)}))(?P={name})"
+
+    monkeypatch.setattr(fnmatch, 'translate', translate_with_groups)
+    patterns = ['*.txt', '*config.in*', 'kconfig*', '*.[1234567]', '*a*b*c*']
+    matcher = ExtMatcher(patterns)
+    for name in ['a.txt', 'my-config.in.old', 'Kconfig.debug', 'ls.1', 'xaybzc', 'nothing']:
+        assert matcher.match(name) == fnmatch_scan(patterns, name), name
@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+
+# std imports
+import time
+import pathlib
+import multiprocessing as mp
+
+import pytest
+
+from pyscooper.server import ScoopServer, PDF_FILENAME
+
+
+@pytest.fixture
+def scoop(tmp_path: pathlib.Path) -> ScoopServer:
+    (tmp_path / 'sources' / 'docs').mkdir(parents=True)
+    (tmp_path / 'outside').mkdir()
+    (tmp_path / 'sources' / 'escape').symlink_to(tmp_path / 'outside')
+    # Never started -> the jobs are only queued
+    return ScoopServer(tmp_path / 'jobs', source_root=tmp_path / 'sources')
+
+
+def test_paths_stay_inside_the_roots(scoop: ScoopServer, tmp_path: pathlib.Path):
+    job = scoop.submit({'sources': ['docs', str(tmp_path / 'sources' / 'docs')]})
+    assert job.args.sources == [str(tmp_path / 'sources' / 'docs')] * 2
+    assert job.args.output == (job.job_dir / PDF_FILENAME).resolve()
+
+    job = scoop.submit({'sources': ['docs'], 'output': 'pdfs/report.pdf', 'options': {'profile': True}})
+    assert job.args.output == (job.job_dir / 'pdfs' / 'report.pdf').resolve()
+    assert job.args.output.parent.is_dir()
+
+
+@pytest.mark.parametrize('request_', [
+    {'sources': ['../outside']},
+    {'sources': [str(pathlib.Path('/etc'))]},
+    {'sources': ['escape']},
+    {'sources': 'docs'},
+    {'sources': [1]},
+    {'sources': ['docs'], 'output': '/tmp/out.pdf'},
+    {'sources': ['docs'], 'output': '../out.pdf'},
+    {'sources': ['docs'], 'output': ['out.pdf']},
+    {'sources': ['docs'], 'options': {'profile': '/tmp/profile.json'}},
+    {'sources': ['docs'], 'options': {'profile': 1}},
+])
+def test_paths_leading_out_of_the_roots_are_rejected(scoop: ScoopServer, request_: dict):
+    with pytest.raises(ValueError):
+        scoop.submit(request_)
+    assert not scoop.jobs
+
+
+def test_output_root(tmp_path: pathlib.Path):
+    (tmp_path / 'sources').mkdir()
+    scoop = ScoopServer(tmp_path / 'jobs', source_root=tmp_path / 'sources', output_root=tmp_path / 'pdfs')
+    assert scoop.submit({'sources': ['.'], 'output': 'a.pdf'}).args.output == (tmp_path / 'pdfs' / 'a.pdf').resolve()
+    with pytest.raises(ValueError):
+        scoop.submit({'sources': ['.'], 'output': '../a.pdf'})
+
+
+def test_kill_before_the_job_has_its_own_group(tmp_path: pathlib.Path):
+    # Like a job cancelled before _run_job called setpgrp: its pid is not a process group
+    process = mp.get_context('fork').Process(target=time.sleep, args=(60,))
+    process.start()
+    start = time.perf_counter()
+    ScoopServer._kill(process, tmp_path)
+    assert process.exitcode is not None
+    assert time.perf_counter() - start < 5
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+# std imports
+import os
+import time
+import pathlib
+
+import pytest
+
+from pyscooper import tex_utils
+
+# Builds the format only once the preamble's packages are "installed", counts its runs
+FAKE_PDFLATEX = '''#!/bin/sh
+echo run >> "{calls}"
+[ -f "{installed}" ] || {{ echo "! LaTeX Error: File missing.sty not found."; exit 1; }}
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -jobname=*) name="${{1#-jobname=}}";;
+        -output-directory) shift; out_dir="$1";;
+    esac
+    shift
+done
+echo fmt > "$out_dir/$name.fmt"
+'''
+
+FAKE_KPSEWHICH = '''#!/bin/sh
+echo "{ls_r}"
+'''
+
+
+@pytest.fixture
+def fake_tex(tmp_path: pathlib.Path, monkeypatch) -> pathlib.Path:
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for name, script in [('pdflatex', FAKE_PDFLATEX), ('kpsewhich', FAKE_KPSEWHICH)]:
+        (bin_dir / name).write_text(script.format(calls=tmp_path / 'calls', installed=tmp_path / 'installed',
+                                                  ls_r=tmp_path / 'ls-R'))
+        (bin_dir / name).chmod(0o755)
+    (tmp_path / 'ls-R').touch()
+    os.utime(tmp_path / 'ls-R', (0, 0))
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(tex_utils, 'FORMAT_CACHE_DIR', tmp_path / 'formats')
+    return tmp_path
+
+
+def n_runs(tmp_path: pathlib.Path) -> int:
+    return len((tmp_path / 'calls').read_text().split()) if (tmp_path / 'calls').is_file() else 0
+
+
+def test_failed_format_is_not_retried(fake_tex: pathlib.Path):
+    assert tex_utils.build_format() is None
+    assert tex_utils.build_format() is None
+    assert n_runs(fake_tex) == 1
+    assert len(list((fake_tex / 'formats').glob('*.failed'))) == 1
+
+
+def test_failed_format_is_retried_once_packages_are_installed(fake_tex: pathlib.Path):
+    assert tex_utils.build_format() is None
+    [failed_path] = (fake_tex / 'formats').glob('*.failed')
+    os.utime(failed_path, (time.time() - 60, time.time() - 60))
+
+    # e.g. tlmgr install -> mktexlsr updates the ls-R databases
+    (fake_tex / 'installed').touch()
+    (fake_tex / 'ls-R').touch()
+    fmt_path = tex_utils.build_format()
+    assert fmt_path is not None and fmt_path.is_file()
+    assert not failed_path.exists()
+    assert tex_utils.build_format() == fmt_path
+    assert n_runs(fake_tex) == 2
+
+
+def test_failed_format_expires(fake_tex: pathlib.Path):
+    assert tex_utils.build_format() is None
+    [failed_path] = (fake_tex / 'formats').glob('*.failed')
+    long_ago = time.time() - tex_utils.FAILED_FORMAT_RETRY_S - 1
+    os.utime(failed_path, (long_ago, long_ago))
+
+    # Tried again (and failed again -> not before another FAILED_FORMAT_RETRY_S)
+    assert tex_utils.build_format() is None
+    assert tex_utils.build_format() is None
+    assert n_runs(fake_tex) == 2
+
+
+# Writes the auxiliary files of a document with (or without) a table of contents, counts its passes
+FAKE_PASS = '''#!/bin/sh
+echo run >> "$1/calls"
+printf '\\\\relax\\n\\\\gdef \\\\@abspage@last{3}\\n' > "$1/$2.aux"
+if [ "$3" = toc ]; then
+    printf '\\\\@writefile{toc}{\\\\contentsline {section}{A}{1}}\\n' >> "$1/$2.aux"
+    printf '\\\\contentsline {section}{A}{1}\\n' > "$1/$2.toc"
+fi
+echo "Output written on $2.pdf (3 pages, 100 bytes)." > "$1/$2.log"
+'''
+
+
+@pytest.mark.parametrize('contents, n_passes', [('plain', 1), ('toc', 2)])
+def test_passes_until_stable(tmp_path: pathlib.Path, contents: str, n_passes: int):
+    fake_pass = tmp_path / 'pdflatex'
+    fake_pass.write_text(FAKE_PASS)
+    fake_pass.chmod(0o755)
+    src_tex = tmp_path / 'src.tex'
+
+    p = tex_utils._run_passes([str(fake_pass), str(tmp_path), 'src', contents], src_tex, tmp_path, max_passes=4,
+                              quiet=True)
+    assert p.ok
+    assert n_runs(tmp_path) == n_passes
+
+    # Rebuilt with the auxiliary files of the previous build -> already stable
+    (tmp_path / 'calls').unlink()
+    tex_utils._run_passes([str(fake_pass), str(tmp_path), 'src', contents], src_tex, tmp_path, max_passes=4,
+                          quiet=True)
+    assert n_runs(tmp_path) == 1
@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import io
+import random
+
+import pytest
+
+from pyscooper.text_sample import (sample_lines,
+                                   iter_lines,
+                                   collapse_repeats,
+                                   elision_marker,
+                                   MAX_LINE_CHARS,
+                                   )
+
+VOCABULARY = ['', 'a', 'same line', 'ünïcödé', '\t tabbed', 'x' * (MAX_LINE_CHARS + 10), 'y' * (3 * MAX_LINE_CHARS)]
+
+
+def random_text(rng: random.Random, n_lines: int) -> str:
+    lines = []
+    while len(lines) < n_lines:
+        line = rng.choice(VOCABULARY) if rng.random() < 0.5 else f"line {len(lines)} " * rng.randint(1, 20)
+        lines.extend([line] * (rng.randint(1, 6) if rng.random() < 0.2 else 1))
+    text = '\n'.join(lines)
+    return text if rng.random() < 0.5 else text + '\n'
+
+
+def reference_sample(text: str, max_bytes: int, max_lines: int, head_fraction: float = 0.5) -> T.List[str]:
+    """Same sampling with the whole (collapsed) file in memory: the longest head, then the longest tail that fit"""
+    max_bytes = max_bytes or float('inf')
+    max_lines = max_lines or float('inf')
+    items = [(line, len(line.encode('utf8', 'replace')), n_lines, n_chars)
+             for line, n_lines, n_chars in collapse_repeats(iter_lines(io.StringIO(text)))]
+
+    n_head, n_bytes = 0, 0
+    while (n_head < len(items)
+           and n_bytes + items[n_head][1] <= max_bytes * head_fraction
+           and n_head + 1 <= max_lines * head_fraction):
+        n_bytes += items[n_head][1]
+        n_head += 1
+    if n_head == len(items):
+        return [line for line, *_ in items]
+
+    tail_bytes, tail_lines = max_bytes - n_bytes, max_lines - n_head
+    n_tail, n_bytes = 0, 0
+    while (n_tail < len(items) - n_head
+           and n_bytes + items[-1 - n_tail][1] <= tail_bytes
+           and n_tail + 1 <= tail_lines):
+        n_bytes += items[-1 - n_tail][1]
+        n_tail += 1
+
+    middle = items[n_head:len(items) - n_tail]
+    marker = [elision_marker(sum(i[2] for i in middle), sum(i[3] for i in middle))] if middle else []
+    return [line for line, *_ in items[:n_head]] + marker + [line for line, *_ in items[len(items) - n_tail:]]
+
+
+def test_unlimited_is_the_whole_file():
+    # Nothing to cut or collapse -> the lines the old scoop_text read with readlines()
+    text = ''.join(f"line {i}\n" for i in range(500)) + 'no newline at the end'
+    assert list(sample_lines(io.StringIO(text), max_bytes=None, max_lines=None)) == \
+        [line for line in io.StringIO(text).readlines()[:-1]] + ['no newline at the end\n']
+
+
+def test_every_line_is_accounted_for():
+    rng = random.Random(0)
+    for _ in range(200):
+        text = random_text(rng, rng.randint(1, 300))
+        items = list(collapse_repeats(iter_lines(io.StringIO(text))))
+        assert sum(n_lines for _, n_lines, _ in items) == len(io.StringIO(text).readlines())
+        assert sum(n_chars for _, _, n_chars in items) == len(text)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_head_and_tail_match_the_reference(seed: int):
+    rng = random.Random(seed)
+    for _ in range(50):
+        text = random_text(rng, rng.randint(0, 300))
+        max_bytes, max_lines = rng.choice([0, rng.randint(1, 5_000)]), rng.choice([0, rng.randint(1, 80)])
+        assert list(sample_lines(io.StringIO(text), max_bytes=max_bytes, max_lines=max_lines)) == \
+            reference_sample(text, max_bytes=max_bytes, max_lines=max_lines), (text, max_bytes, max_lines)
@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+
+# std imports
+import typing as T
+import copy
+import pathlib
+import random
+
+import pytest
+
+from pyscooper.attachments import TOCFile
+from pyscooper.toc_trie import build_trie, fold_trie, iter_entries, count_files
+
+
+# The recursive versions (from scooper.py) that toc_trie replaces
+def folding_fcn(s1: str, s2: str) -> str:
+    return f"{s1}/{s2}"
+
+
+def fold_empty_nodes(recd: dict,
+                     ) -> T.Tuple[T.Dict, bool]:
+    dks = [k for k, v in recd.items() if isinstance(v, dict)]
+    foldable = len(recd) == 1 and len(dks) == 1
+
+    for k in dks:
+        ld, lf = fold_empty_nodes(recd[k])
+
+        if lf:
+            [lk] = ld.keys()
+            recd[folding_fcn(k, lk)] = recd.pop(k).pop(lk)
+
+    return recd, foldable
+
+
+def extract_entries(recd,
+                    keypath=None,
+                    ) -> T.List[TOCFile]:
+    keypath = keypath or []
+    vs = list(recd.values())
+
+    if len(vs) == 1 and isinstance(vs[0], pathlib.Path):
+        return [TOCFile(filepath=vs[0], keypath=keypath, )]
+
+    res = []
+    for k, v in recd.items():
+        if isinstance(v, pathlib.Path):
+            res.append(TOCFile(filepath=v, keypath=keypath, ))
+        else:
+            res.extend(extract_entries(v, keypath=keypath + [k]))
+
+    return res
+
+
+def random_filemap(rng: random.Random, path: pathlib.Path, depth: int) -> dict:
+    """{dir: {subdir: {filename: pathlib.Path}}} with plenty of single-child chains, lone files & empty dirs"""
+    if depth and rng.random() < 0.3:
+        # A lone sub-directory -> foldable
+        name = rng.choice(['src', 'a', 'b'])
+        return {name: random_filemap(rng, path / name, depth - 1)}
+
+    filemap = dict()
+    n_children = rng.choice([0, 1, 1, 1, 2, 3, 5]) if depth else rng.randint(0, 3)
+    for i in range(n_children):
+        if depth and rng.random() < 0.6:
+            name = rng.choice(['src', 'a', 'b', f"dir{i}"])
+            if name not in filemap:
+                filemap[name] = random_filemap(rng, path / name, depth - 1)
+        else:
+            name = f"file{i}.{rng.choice(['txt', 'py', 'c', 'bin'])}"
+            filemap[name] = path / name
+    return filemap
+
+
+def as_tuples(entries: T.Iterable[TOCFile]) -> T.List[T.Tuple[T.Tuple[str, ...], pathlib.Path, T.Optional[str]]]:
+    return [(tuple(e.keypath), e.filepath, e.ext_key) for e in entries]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_trie_matches_the_recursive_dicts(seed: int):
+    rng = random.Random(seed)
+    filemap = random_filemap(rng, pathlib.Path('/root'), depth=rng.randint(1, 7))
+
+    expected = as_tuples(extract_entries(fold_empty_nodes(copy.deepcopy(filemap))[0]))
+    trie = fold_trie(build_trie(filemap))
+
+    assert as_tuples(iter_entries(trie)) == expected
+    assert count_files(trie) == len(expected)
+
+
+def test_deep_chain_is_folded_without_recursion():
+    depth = 5_000  # Far beyond the recursion limit
+    filemap = leaf = dict()
+    for i in range(depth):
+        leaf[f"d{i}"] = dict()
+        leaf = leaf[f"d{i}"]
+    leaf['file.txt'] = pathlib.Path('/deep/file.txt')
+    leaf['other.txt'] = pathlib.Path('/deep/other.txt')
+
+    [first, second] = iter_entries(fold_trie(build_trie(filemap)))
+    assert first.keypath == ('/'.join(f"d{i}" for i in range(depth)),)
+    assert first.keypath is second.keypath
+    assert (first.filepath.name, second.filepath.name) == ('file.txt', 'other.txt')